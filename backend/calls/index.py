@@ -11,16 +11,25 @@
     MOBILON_DOMAIN      — домен Мобилон (по умолчанию connect.mobilon.ru)
     OPENAI_API_KEY      — ключ OpenAI для расшифровки звонков
     PORT                — порт сервера (по умолчанию 5173)
+    CALLS_TRANSCRIBE_WORKERS — потоков автоматической расшифровки (по умолчанию 2)
 
 URL для вебхука в настройках Мобилон:
     http://<ВАШ_БЕЛЫЙ_IP>:5173/
 """
 
+import hashlib
+import http.client
 import json
 import os
 import re
 import io
+import queue
+import signal
+import socket
 import ssl
+import tempfile
+import threading
+import time
 import urllib.request
 import urllib.parse
 import urllib.error
@@ -28,6 +37,8 @@ import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from http.server import HTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import contextmanager
 from urllib.parse import urlparse, parse_qs
 
 # ── .env поддержка ────────────────────────────────────────────────────────────
@@ -49,6 +60,56 @@ TIMEOUT = 8
 SCHEMA = 'public'
 PORT = int(os.environ.get('PORT', 5173))
 
+# Параллельное обслуживание запросов (см. раздел Concurrency)
+REQUEST_WORKERS = int(os.environ.get('CALLS_REQUEST_WORKERS', 32))
+SLOW_WORKERS = int(os.environ.get('CALLS_SLOW_WORKERS', 4))
+SLOW_QUEUE_MAX = int(os.environ.get('CALLS_SLOW_QUEUE_MAX', 16))
+SLOW_TIMEOUT = int(os.environ.get('CALLS_SLOW_TIMEOUT', 180))
+REQUEST_TIMEOUT = 15
+SHUTDOWN_TIMEOUT = 30
+FAST_ACTIONS = ('list_db', 'active', 'active_wait', 'calls_by_phone', 'transcription_queue', 'transcription_retry',
+                'search_transcripts', 'stats')
+STATS_MAX_DAYS = 366
+TRANSCRIPT_SEARCH_LIMIT = 100
+TRANSCRIPT_HEADLINE = 'StartSel=<b>, StopSel=</b>, MaxFragments=3, MinWords=5, MaxWords=20, FragmentDelimiter=" … "'
+
+# Реестр текущих звонков для всплывающего окна (см. раздел Active calls)
+ACTIVE_CALL_TTL = 60          # сек, после которых звонок без HANGUP считается завершённым
+ACTIVE_WAIT_MAX = 25          # сек, максимальное ожидание long-poll
+ACTIVE_WAITERS_MAX = 16
+
+# Кеш определителя номера (см. раздел Caller ID)
+CALLER_ID_REFRESH = 5         # сек между проверками change_log
+CALLER_ID_BATCH = 5000
+
+# Очередь автоматической расшифровки (см. раздел Transcription queue)
+TRANSCRIBE_WORKERS = int(os.environ.get('CALLS_TRANSCRIBE_WORKERS', 2))
+TRANSCRIBE_MAX_ATTEMPTS = 5
+TRANSCRIBE_LEASE = 900        # сек, после которых «зависшее» задание забирает другой воркер
+TRANSCRIBE_BACKOFF = 60       # сек, база экспоненциальной паузы между попытками
+TRANSCRIBE_BACKOFF_MAX = 3600
+TRANSCRIBE_POLL = 5
+AUDIO_MAX_BYTES = 25 * 1024 * 1024     # лимит Whisper API на файл
+AUDIO_SPOOL_MEMORY = 4 * 1024 * 1024   # больше — запись уходит во временный файл на диске
+AUDIO_CHUNK = 64 * 1024
+
+# Разметка реплик длинных расшифровок: куски по границам предложений, обрабатываются параллельно
+STRUCTURE_CHUNK_CHARS = 3000
+STRUCTURE_OVERLAP_SENTENCES = 2   # хвост предыдущего куска передаётся как контекст
+STRUCTURE_CONTEXT_CHARS = 600     # но не длиннее этого — предложения без пунктуации бывают огромными
+STRUCTURE_WORKERS = 8
+STRUCTURE_TIMEOUT = 60
+
+# Журнал Мобилон: закрытые дни кешируются в БД, текущий запрашивается вживую
+JOURNAL_WORKERS = 7
+JOURNAL_SETTLE_HOURS = 3      # день считается закрытым спустя столько часов после полуночи
+MOBILON_POOL_SIZE = 8
+JOURNAL_FIELDS = (
+    'callid', 'status', 'record_url', 'has_record',
+    'duration', 'from', 'direction', 'to', 'time',
+    'operator_id', 'subscriber_id',
+)
+
 
 def _urlopen(req, timeout=TIMEOUT):
     """SSL-safe urllib wrapper — disables cert verify for Windows compat."""
@@ -94,26 +155,84 @@ def get_mobilon_base():
     return f'https://{domain}/api/call'
 
 
+class MobilonSession:
+    """Пул keep-alive соединений к API Мобилон, общий для всех потоков сервера."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.idle = queue.LifoQueue()
+
+    def _connect(self, parsed):
+        if parsed.scheme == 'https':
+            return http.client.HTTPSConnection(parsed.netloc, timeout=TIMEOUT, context=_SSL_CTX)
+        return http.client.HTTPConnection(parsed.netloc, timeout=TIMEOUT)
+
+    def _acquire(self, parsed):
+        while True:
+            try:
+                netloc, conn = self.idle.get_nowait()
+            except queue.Empty:
+                return self._connect(parsed)
+            if netloc == parsed.netloc:
+                return conn
+            conn.close()
+
+    def _release(self, netloc: str, conn):
+        if self.idle.qsize() < self.size:
+            self.idle.put((netloc, conn))
+        else:
+            conn.close()
+
+    @contextmanager
+    def get(self, url: str, headers: dict = None):
+        """GET с переиспользованием соединения; отдаёт ответ как поток для чтения."""
+        parsed = urlparse(url)
+        path = parsed.path + (f'?{parsed.query}' if parsed.query else '')
+        conn = self._acquire(parsed)
+        reusable = False
+        try:
+            try:
+                conn.request('GET', path, headers=headers or {})
+                resp = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # Сервер закрыл простаивавшее соединение — повторяем на новом
+                conn.close()
+                conn = self._connect(parsed)
+                conn.request('GET', path, headers=headers or {})
+                resp = conn.getresponse()
+            if resp.status >= 400:
+                raise urllib.error.HTTPError(url, resp.status, resp.reason, resp.headers, None)
+            yield resp
+            resp.read()
+            reusable = not resp.will_close
+        finally:
+            if reusable:
+                self._release(parsed.netloc, conn)
+            else:
+                conn.close()
+
+
+MOBILON = MobilonSession(MOBILON_POOL_SIZE)
+
+
 def mobilon_request(path, params):
     base = get_mobilon_base()
     qs = safe_urlencode(params)
     url = f'{base}/{path}?{qs}'
-    req = urllib.request.Request(url, headers={'Accept': 'application/json, text/xml'})
-    with _urlopen(req, timeout=TIMEOUT) as r:
+    with MOBILON.get(url, {'Accept': 'application/json, text/xml'}) as r:
         return r.read().decode('utf-8')
 
 
+def iter_xml_calls(stream):
+    """Потоково разбирает XML журнала: каждый <call> отдаётся сразу и освобождается."""
+    for _event, el in ET.iterparse(stream, events=('end',)):
+        if el.tag == 'call':
+            yield {tag: (el.find(tag).text or '') for tag in JOURNAL_FIELDS if el.find(tag) is not None}
+            el.clear()
+
+
 def parse_xml_calls(xml_str):
-    root = ET.fromstring(xml_str)
-    calls = []
-    elements = root.findall('call') if root.tag == 'calls' else [root]
-    for c in elements:
-        calls.append({tag: (c.find(tag).text or '') for tag in [
-            'callid', 'status', 'record_url', 'has_record',
-            'duration', 'from', 'direction', 'to', 'time',
-            'operator_id', 'subscriber_id'
-        ] if c.find(tag) is not None})
-    return calls
+    return list(iter_xml_calls(io.BytesIO(xml_str.encode('utf-8'))))
 
 
 def normalize_direction(raw_direction, status, duration):
@@ -156,8 +275,57 @@ def format_call(c, token):
 
 def get_journal_for_date(token, date_str):
     params = {'token': token, 'date': date_str, 'format': 'xml'}
-    raw = mobilon_request('journal', params)
-    return parse_xml_calls(raw)
+    url = f'{get_mobilon_base()}/journal?{safe_urlencode(params)}'
+    with MOBILON.get(url, {'Accept': 'text/xml'}) as r:
+        return list(iter_xml_calls(r))
+
+
+def journal_day_closed(date_str: str, now: datetime) -> bool:
+    """Закрытый день больше не меняется в журнале и может храниться в БД."""
+    return datetime.strptime(date_str, '%Y-%m-%d') + timedelta(days=1, hours=JOURNAL_SETTLE_HOURS) <= now
+
+
+def load_cached_journal(cur, dates: list) -> tuple:
+    """Возвращает (множество закешированных дней, записи журнала за них)."""
+    if not dates:
+        return set(), []
+    cur.execute(
+        f"SELECT day::text FROM {SCHEMA}.call_journal_days WHERE day = ANY(%s::date[])",
+        (dates,)
+    )
+    cached = {r[0] for r in cur.fetchall()}
+    if not cached:
+        return cached, []
+    cur.execute(
+        f"SELECT data FROM {SCHEMA}.call_journal WHERE day = ANY(%s::date[]) ORDER BY day, seq",
+        (sorted(cached),)
+    )
+    return cached, [r[0] for r in cur.fetchall()]
+
+
+def store_journal_days(cur, journal: dict):
+    """Сохраняет журнал закрытых дней {дата: [записи]} и отмечает дни как закешированные."""
+    from psycopg2.extras import execute_values
+    # Ключ — позиция записи в журнале дня: callid в журнале может повторяться, кеш хранит все записи как есть
+    rows = []
+    for date_str, calls in journal.items():
+        for i, c in enumerate(calls):
+            rows.append((date_str, i, c.get('callid') or '', c.get('time', ''), json.dumps(c, ensure_ascii=False)))
+    if rows:
+        execute_values(cur, f"""
+            INSERT INTO {SCHEMA}.call_journal (day, seq, callid, call_time, data) VALUES %s
+            ON CONFLICT (day, seq) DO UPDATE
+            SET callid = EXCLUDED.callid, call_time = EXCLUDED.call_time, data = EXCLUDED.data
+        """, rows, page_size=1000)
+    execute_values(cur, f"""
+        DELETE FROM {SCHEMA}.call_journal j
+        USING (VALUES %s) AS v(day, calls_count)
+        WHERE j.day = v.day::date AND j.seq >= v.calls_count
+    """, [(d, len(calls)) for d, calls in journal.items()])
+    execute_values(cur, f"""
+        INSERT INTO {SCHEMA}.call_journal_days (day, calls_count) VALUES %s
+        ON CONFLICT (day) DO UPDATE SET calls_count = EXCLUDED.calls_count, fetched_at = NOW()
+    """, [(d, len(calls)) for d, calls in journal.items()])
 
 
 # ── Webhook → DB ──────────────────────────────────────────────────────────────
@@ -174,6 +342,11 @@ def normalize_phone(raw: str) -> str:
     return '+' + digits
 
 
+def phone_key(raw: str) -> str:
+    """Ключ телефона — последние 10 цифр. Совпадает с колонкой phone_key в БД."""
+    return re.sub(r'\D', '', str(raw or ''))[-10:]
+
+
 def save_webhook_to_db(data: dict):
     """Сохраняет или обновляет вебхук-событие в таблице calls."""
     mobilon_id = data.get('baseid') or data.get('callid') or data.get('uuid')
@@ -215,34 +388,323 @@ def save_webhook_to_db(data: dict):
 
     print(f"[WEBHOOK] mobilon_id={mobilon_id} raw_dir={direction_raw} state={state} callstatus={callstatus} dur={duration} -> direction={direction} phone={phone}")
 
+    caller = CALLER_ID.lookup(phone)
+
     conn = get_db()
     try:
         cur = conn.cursor()
         cur.execute(f"""
             INSERT INTO {SCHEMA}.calls
-                (mobilon_id, phone, src, dst, direction, duration, started_at, state, uuid, subid, userkey, raw)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                (mobilon_id, phone, src, dst, direction, duration, started_at, state, uuid, subid, userkey, raw, client_id)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             ON CONFLICT (mobilon_id) DO UPDATE SET
                 state = EXCLUDED.state,
                 duration = EXCLUDED.duration,
                 direction = EXCLUDED.direction,
                 phone = EXCLUDED.phone,
-                raw = EXCLUDED.raw
+                raw = EXCLUDED.raw,
+                client_id = COALESCE(EXCLUDED.client_id, {SCHEMA}.calls.client_id)
+            RETURNING started_at
         """, (
             mobilon_id, phone, phone_from, phone_to,
             direction, duration, started_at,
             state, uuid, subid, userkey,
-            json.dumps(data, ensure_ascii=False)
+            json.dumps(data, ensure_ascii=False),
+            caller['client_id'] if caller else None
         ))
+        call_started_at = cur.fetchone()[0]
+        if is_final and call_started_at:
+            refresh_hour_rollup(cur, call_started_at)
+        record_url = data.get('recordUrl') or data.get('record_url')
+        queued = is_final and direction == 'in' and duration > 10 and bool(record_url)
+        if queued:
+            enqueue_transcription(cur, mobilon_id, record_url)
+        ringing = direction_raw == 'incoming' and not is_final
         conn.commit()
     finally:
         conn.close()
 
-    if is_final and direction == 'in' and duration and duration > 10:
-        record_url = data.get('recordUrl') or data.get('record_url')
-        if record_url:
-            import threading
-            threading.Thread(target=auto_transcribe, args=(mobilon_id, record_url), daemon=True).start()
+    if queued:
+        TRANSCRIBERS.notify()
+    if ringing:
+        ACTIVE_CALLS.update(mobilon_id, {
+            'id': mobilon_id,
+            'phone': phone or '',
+            'src': phone_from or '',
+            'dst': phone_to or '',
+            'direction': direction,
+            'state': state,
+            'started_at': str(started_at) if started_at else '',
+            'client_id': caller['client_id'] if caller else None,
+            'client_name': caller['name'] if caller else None,
+            'last_work_order': caller['last_work_order'] if caller else None,
+        })
+    elif direction_raw == 'incoming':
+        ACTIVE_CALLS.update(mobilon_id, None)
+
+
+# ── Call stats rollup ─────────────────────────────────────────────────────────
+#
+# call_stats_hourly — итоги по часу начала звонка и оператору (внутренней стороне
+# разговора). Завершающий вебхук пересчитывает свой час целиком из calls в той же
+# транзакции, поэтому повторные и запоздавшие события не задваивают счётчики.
+
+def refresh_hour_rollup(cur, started_at: int):
+    hour = started_at - started_at % 3600
+    cur.execute(f"DELETE FROM {SCHEMA}.call_stats_hourly WHERE hour = %s", (hour,))
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.call_stats_hourly
+            (hour, operator, inbound, answered, missed, outbound, talk_seconds,
+             dur_lt_30, dur_30_120, dur_120_300, dur_gt_300)
+        SELECT %s,
+               COALESCE(CASE WHEN direction = 'out' THEN src ELSE dst END, ''),
+               COUNT(*) FILTER (WHERE direction IN ('in', 'missed')),
+               COUNT(*) FILTER (WHERE direction = 'in'),
+               COUNT(*) FILTER (WHERE direction = 'missed'),
+               COUNT(*) FILTER (WHERE direction = 'out'),
+               COALESCE(SUM(duration) FILTER (WHERE direction <> 'missed'), 0),
+               COUNT(*) FILTER (WHERE direction <> 'missed' AND duration < 30),
+               COUNT(*) FILTER (WHERE direction <> 'missed' AND duration >= 30 AND duration < 120),
+               COUNT(*) FILTER (WHERE direction <> 'missed' AND duration >= 120 AND duration < 300),
+               COUNT(*) FILTER (WHERE direction <> 'missed' AND duration >= 300)
+        FROM {SCHEMA}.calls
+        WHERE started_at >= %s AND started_at < %s
+          AND state IN ('HANGUP', 'END')
+          AND NOT (src ~ '^\\d{{1,3}}$' AND dst ~ '^\\d{{1,3}}$')
+          AND COALESCE(raw->>'direction', '') <> 'internal'
+        GROUP BY 2
+    """, (hour, hour, hour + 3600))
+
+
+# ── Active calls ──────────────────────────────────────────────────────────────
+#
+# Всплывающее окно входящего звонка читает реестр в памяти, а не БД: реестр
+# обновляется writer-потоком вебхуков (клиент берётся из кеша определителя номера),
+# а action=active_wait держит запрос до ближайшего изменения.
+
+class ActiveCallRegistry:
+    """Текущие входящие звонки по событиям вебхуков; ожидающие запросы будятся при каждом изменении."""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.calls = {}
+        self.version = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def update(self, mobilon_id: str, call: dict = None):
+        """Добавляет или обновляет звонок; call=None — звонок завершён."""
+        with self.cond:
+            prev = self.calls.get(mobilon_id)
+            if call is None:
+                if prev is None:
+                    return
+                del self.calls[mobilon_id]
+            else:
+                if prev and call.get('client_id') is None:
+                    for k in ('client_id', 'client_name', 'last_work_order'):
+                        call[k] = prev.get(k)
+                call['seen'] = prev['seen'] if prev else time.monotonic()
+                self.calls[mobilon_id] = call
+            self.version += 1
+            self.cond.notify_all()
+
+    def _expire(self):
+        deadline = time.monotonic() - self.ttl
+        stale = [k for k, c in self.calls.items() if c['seen'] < deadline]
+        for k in stale:
+            del self.calls[k]
+        if stale:
+            self.version += 1
+
+    def _snapshot(self) -> dict:
+        if not self.calls:
+            return {'active': False, 'call': None, 'version': self.version}
+        latest = max(self.calls.values(), key=lambda c: c['seen'])
+        return {
+            'active': True,
+            'call': {k: v for k, v in latest.items() if k != 'seen'},
+            'version': self.version,
+        }
+
+    def snapshot(self) -> dict:
+        with self.cond:
+            self._expire()
+            return self._snapshot()
+
+    def wait(self, since: int, timeout: float) -> dict:
+        """Возвращает состояние, как только версия отличается от since, либо по таймауту."""
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while True:
+                self._expire()
+                now = time.monotonic()
+                if self.version != since or self.closed or now >= deadline:
+                    return self._snapshot()
+                pause = deadline - now
+                if self.calls:
+                    # Проснуться к моменту, когда самый старый звонок устареет
+                    oldest = min(c['seen'] for c in self.calls.values())
+                    pause = min(pause, max(oldest + self.ttl - now, 0.05))
+                self.cond.wait(pause)
+
+    def close(self):
+        """Отпускает все ожидающие запросы (при остановке сервера)."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+ACTIVE_CALLS = ActiveCallRegistry(ACTIVE_CALL_TTL)
+ACTIVE_WAITERS = threading.BoundedSemaphore(ACTIVE_WAITERS_MAX)
+
+
+# ── Caller ID ─────────────────────────────────────────────────────────────────
+#
+# phone_key → клиент в памяти процесса. Загружается один раз целиком, затем раз в
+# CALLER_ID_REFRESH секунд догоняет change_log по клиентам (включая их автомобили)
+# и заказ-нарядам. Курсор "txid.id" продвигается только до горизонта xmin, как в
+# лентах изменений orders/clients, поэтому незавершённые транзакции не теряются.
+
+CALLER_ID_SQL = f"""
+    SELECT c.id, c.name, c.phone_key, w.id, w.status, w.car_info, w.created_at
+    FROM {SCHEMA}.clients c
+    LEFT JOIN LATERAL (
+        SELECT id, status, car_info, created_at FROM {SCHEMA}.work_orders
+        WHERE client_id = c.id
+        ORDER BY created_at DESC, id DESC
+        LIMIT 1
+    ) w ON TRUE
+"""
+
+
+class CallerIdCache:
+    """Определитель номера: phone_key → клиент (id, имя, последний заказ-наряд)."""
+
+    def __init__(self, refresh: float):
+        self.refresh = refresh
+        self.by_key = {}
+        self.key_of = {}
+        self.cursor = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+        self.updating = threading.Lock()
+
+    @staticmethod
+    def _entry(r) -> dict:
+        return {
+            'client_id': r[0],
+            'name': r[1],
+            'last_work_order': {
+                'id': r[3],
+                'status': r[4],
+                'car_info': r[5] or '',
+                'created_at': r[6].isoformat() if r[6] else None,
+            } if r[3] else None,
+        }
+
+    def lookup(self, raw_phone: str):
+        key = phone_key(raw_phone)
+        if not key:
+            return None
+        self.ensure_fresh()
+        with self.lock:
+            return self.by_key.get(key)
+
+    def name_for(self, raw_phone: str):
+        entry = self.lookup(raw_phone)
+        return entry['name'] if entry else None
+
+    def ensure_fresh(self):
+        if time.monotonic() - self.checked < self.refresh:
+            return
+        # Первая загрузка — ждём её; дальше, пока другой поток догоняет изменения, отдаём текущие данные
+        if not self.updating.acquire(blocking=self.cursor is None):
+            return
+        try:
+            if time.monotonic() - self.checked < self.refresh:
+                return
+            try:
+                self._refresh()
+            except Exception as e:
+                print(f"[CALLER ID] refresh error: {e}")
+            self.checked = time.monotonic()
+        finally:
+            self.updating.release()
+
+    def _refresh(self):
+        conn = get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+            xmin = cur.fetchone()[0]
+            if self.cursor is None:
+                self._load_all(cur)
+                self.cursor = (xmin, 0)
+                return
+            while True:
+                ids, has_more = self._changed_client_ids(cur, xmin)
+                if ids:
+                    self._reload(cur, ids)
+                if not has_more:
+                    return
+        finally:
+            conn.close()
+
+    def _load_all(self, cur):
+        cur.execute(CALLER_ID_SQL + " WHERE c.phone_key IS NOT NULL ORDER BY c.id")
+        by_key, key_of = {}, {}
+        for r in cur.fetchall():
+            key_of[r[0]] = r[2]
+            by_key.setdefault(r[2], self._entry(r))
+        with self.lock:
+            self.by_key, self.key_of = by_key, key_of
+        print(f"[CALLER ID] loaded {len(by_key)} phone keys")
+
+    def _changed_client_ids(self, cur, xmin: int) -> tuple:
+        since_txid, since_id = self.cursor
+        cur.execute(f"""
+            SELECT l.txid, l.id, CASE WHEN l.entity = 'client' THEN l.entity_id ELSE w.client_id END
+            FROM {SCHEMA}.change_log l
+            LEFT JOIN {SCHEMA}.work_orders w ON l.entity = 'work_order' AND w.id = l.entity_id
+            WHERE l.entity IN ('client', 'work_order') AND (l.txid, l.id) >= (%s, %s) AND l.txid < %s
+            ORDER BY l.txid, l.id
+            LIMIT %s
+        """, (since_txid, since_id, xmin, CALLER_ID_BATCH))
+        rows = cur.fetchall()
+        has_more = len(rows) == CALLER_ID_BATCH
+        if has_more:
+            self.cursor = (rows[-1][0], rows[-1][1] + 1)
+        else:
+            self.cursor = (max(xmin, since_txid), 0 if xmin > since_txid else since_id)
+        return {r[2] for r in rows if r[2] is not None}, has_more
+
+    def _reload(self, cur, ids: set):
+        """Перечитывает изменённых клиентов и всех, кто делит с ними старый или новый phone_key."""
+        with self.lock:
+            old_keys = {self.key_of[i] for i in ids if i in self.key_of}
+        cur.execute(CALLER_ID_SQL + f"""
+            WHERE c.phone_key IN (SELECT phone_key FROM {SCHEMA}.clients WHERE id = ANY(%s))
+               OR c.phone_key = ANY(%s)
+            ORDER BY c.id
+        """, (list(ids), list(old_keys)))
+        rows = cur.fetchall()
+        entries = {}
+        for r in rows:
+            entries.setdefault(r[2], self._entry(r))
+        with self.lock:
+            for i in ids:
+                self.key_of.pop(i, None)
+            for r in rows:
+                self.key_of[r[0]] = r[2]
+            for key in old_keys | set(entries):
+                if key in entries:
+                    self.by_key[key] = entries[key]
+                else:
+                    self.by_key.pop(key, None)
+
+
+CALLER_ID = CallerIdCache(CALLER_ID_REFRESH)
 
 
 # ── Transcription ─────────────────────────────────────────────────────────────
@@ -254,46 +716,139 @@ def _make_ai_client(api_key: str):
     return OpenAI(api_key=api_key, base_url='https://api.laozhang.ai/v1', http_client=http)
 
 
+class AudioTooLarge(Exception):
+    pass
+
+
+class SingleFlight:
+    """Именованные блокировки: одну запись одновременно обрабатывает только один поток."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.locks = {}
+
+    @contextmanager
+    def hold(self, key: str):
+        with self.lock:
+            entry = self.locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.locks[key]
+
+
+CALL_FLIGHTS = SingleFlight()
+
+
+def download_recording(record_url: str):
+    """Потоково скачивает запись во временный spooled-файл, попутно считая sha256.
+    Возвращает (файл, хеш, размер); файл закрывает вызывающий код."""
+    req = urllib.request.Request(record_url, headers={'User-Agent': 'Mozilla/5.0'})
+    spool = tempfile.SpooledTemporaryFile(max_size=AUDIO_SPOOL_MEMORY)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with _urlopen(req, timeout=30) as r:
+            declared = r.headers.get('Content-Length')
+            if declared and declared.isdigit() and int(declared) > AUDIO_MAX_BYTES:
+                raise AudioTooLarge(f'record is {declared} bytes, limit {AUDIO_MAX_BYTES}')
+            while True:
+                chunk = r.read(AUDIO_CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > AUDIO_MAX_BYTES:
+                    raise AudioTooLarge(f'record exceeds {AUDIO_MAX_BYTES} bytes')
+                digest.update(chunk)
+                spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool, digest.hexdigest(), size
+
+
+def transcribe_recording(record_url: str, openai_key: str) -> str:
+    """Текст записи: из audio_transcripts по хешу содержимого, иначе — через Whisper с сохранением результата."""
+    spool, content_hash, size = download_recording(record_url)
+    try:
+        conn = get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                f"SELECT transcript FROM {SCHEMA}.audio_transcripts WHERE content_hash = %s",
+                (content_hash,)
+            )
+            row = cur.fetchone()
+        finally:
+            conn.close()
+        if row:
+            print(f"[TRANSCRIBE] audio {content_hash[:12]} already transcribed, reuse")
+            return row[0]
+
+        ai_client = _make_ai_client(openai_key)
+        result = ai_client.audio.transcriptions.create(
+            model='whisper-1',
+            file=('call.mp3', spool, 'audio/mpeg'),
+            language='ru',
+        )
+        text = result.text.strip()
+    finally:
+        spool.close()
+
+    if text:
+        conn = get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"""
+                INSERT INTO {SCHEMA}.audio_transcripts (content_hash, size_bytes, transcript)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (content_hash) DO NOTHING
+            """, (content_hash, size, text))
+            conn.commit()
+        finally:
+            conn.close()
+    return text
+
+
 def auto_transcribe(mobilon_id: str, record_url: str):
+    """Расшифровывает запись звонка из очереди. Ошибки пробрасываются — задание уйдёт на повтор."""
     openai_key = os.environ.get('OPENAI_API_KEY', '')
     if not openai_key:
-        print(f"[AUTO TRANSCRIBE] OPENAI_API_KEY not set, skip")
-        return
+        raise RuntimeError('OPENAI_API_KEY not set')
+
+    with CALL_FLIGHTS.hold(mobilon_id):
+        _auto_transcribe(mobilon_id, record_url, openai_key)
 
+
+def _auto_transcribe(mobilon_id: str, record_url: str, openai_key: str):
     conn = get_db()
     try:
         cur = conn.cursor()
         cur.execute(f"SELECT transcript_status FROM {SCHEMA}.calls WHERE mobilon_id = %s LIMIT 1", (mobilon_id,))
         row = cur.fetchone()
-        if row and row[0] == 'done':
-            return
-        cur.execute(f"UPDATE {SCHEMA}.calls SET transcript_status = 'pending' WHERE mobilon_id = %s", (mobilon_id,))
-        conn.commit()
     finally:
         conn.close()
-
-    print(f"[AUTO TRANSCRIBE] starting for {mobilon_id}")
-    try:
-        req = urllib.request.Request(record_url, headers={'User-Agent': 'Mozilla/5.0'})
-        with _urlopen(req, timeout=30) as r:
-            audio_data = r.read()
-    except Exception as e:
-        print(f"[AUTO TRANSCRIBE] download failed: {e}")
+    if row and row[0] == 'done':
         return
 
-    ai_client = _make_ai_client(openai_key)
-    try:
-        result = ai_client.audio.transcriptions.create(
-            model='whisper-1',
-            file=('call.mp3', io.BytesIO(audio_data), 'audio/mpeg'),
-            language='ru',
-        )
-        text = result.text.strip()
-    except Exception as e:
-        print(f"[AUTO TRANSCRIBE] whisper failed: {e}")
-        return
+    print(f"[AUTO TRANSCRIBE] starting for {mobilon_id}")
+    text = transcribe_recording(record_url, openai_key)
 
     if not text:
+        conn = get_db()
+        try:
+            cur = conn.cursor()
+            cur.execute(f"UPDATE {SCHEMA}.calls SET transcript_status = 'none' WHERE mobilon_id = %s", (mobilon_id,))
+            conn.commit()
+        finally:
+            conn.close()
+        print(f"[AUTO TRANSCRIBE] empty transcript for {mobilon_id}")
         return
 
     structured = structure_transcript(text, openai_key)
@@ -305,55 +860,375 @@ def auto_transcribe(mobilon_id: str, record_url: str):
             f"UPDATE {SCHEMA}.calls SET transcript = %s, transcript_status = 'done' WHERE mobilon_id = %s",
             (text, mobilon_id)
         )
-        cur2.execute(f"""
-            SELECT id FROM {SCHEMA}.calls WHERE mobilon_id = %s LIMIT 1
-        """, (mobilon_id,))
-        row = cur2.fetchone()
-        if row:
-            cur2.execute(f"""
-                INSERT INTO {SCHEMA}.call_transcripts
-                    (call_id, mobilon_id, transcript_raw, transcript_structured)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT DO NOTHING
-            """, (row[0], mobilon_id, text, json.dumps(structured, ensure_ascii=False)))
+        insert_call_transcript(cur2, mobilon_id, text, structured)
         conn2.commit()
         print(f"[AUTO TRANSCRIBE] done for {mobilon_id}, len={len(text)}")
     finally:
         conn2.close()
 
 
+STRUCTURE_PROMPT = (
+    "Перед тобой расшифровка телефонного разговора между оператором автосервиса и клиентом.\n"
+    "Раздели текст на реплики. Для каждой реплики определи: кто говорит (оператор или клиент).\n\n"
+    "Верни JSON массив объектов в формате:\n"
+    '[{"speaker":"Оператор","role":"operator","text":"..."},{"speaker":"Клиент","role":"client","text":"..."}]\n\n'
+    "Правила:\n"
+    "- role: 'operator' для сотрудника автосервиса, 'client' для клиента\n"
+    "- Не меняй слова, только разбей на реплики\n"
+    "- Если не можешь определить кто говорит — role: 'unknown', speaker: 'Неизвестно'\n"
+    "- Верни ТОЛЬКО JSON массив, без пояснений\n\n"
+)
+
+
+def split_long_sentence(sentence: str, limit: int) -> list:
+    """Режет предложение длиннее limit по пробелам (Whisper часто отдаёт текст без пунктуации),
+    слово длиннее limit — по символам."""
+    if len(sentence) <= limit:
+        return [sentence]
+    parts, current = [], ''
+    for word in sentence.split():
+        while len(word) > limit:
+            if current:
+                parts.append(current)
+                current = ''
+            parts.append(word[:limit])
+            word = word[limit:]
+        if current and len(current) + 1 + len(word) > limit:
+            parts.append(current)
+            current = word
+        else:
+            current = f'{current} {word}' if current else word
+    if current:
+        parts.append(current)
+    return parts
+
+
+def tail_context(sentences: list) -> str:
+    """Последние предложения куска для контекста, обрезанные до STRUCTURE_CONTEXT_CHARS по границе слова."""
+    context = ' '.join(sentences[-STRUCTURE_OVERLAP_SENTENCES:])
+    if len(context) > STRUCTURE_CONTEXT_CHARS:
+        context = context[-STRUCTURE_CONTEXT_CHARS:]
+        context = context.split(' ', 1)[1] if ' ' in context else context
+    return context
+
+
+def split_transcript(text: str) -> list:
+    """Режет текст по границам предложений на куски до STRUCTURE_CHUNK_CHARS.
+    Возвращает [(контекст, кусок)], где контекст — последние предложения предыдущего куска."""
+    sentences = [
+        piece
+        for p in re.split(r'(?<=[.!?…])\s+', text.strip()) if p
+        for piece in split_long_sentence(p, STRUCTURE_CHUNK_CHARS)
+    ]
+    chunks, current, size = [], [], 0
+    for sentence in sentences:
+        if current and size + len(sentence) > STRUCTURE_CHUNK_CHARS:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(sentence)
+        size += len(sentence) + 1
+    if current:
+        chunks.append(current)
+    return [
+        (tail_context(chunks[i - 1]) if i else '', ' '.join(chunk))
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+def structure_chunk(ai, context: str, text: str) -> list:
+    prompt = STRUCTURE_PROMPT
+    if context:
+        prompt += (
+            "Это продолжение разговора. Предыдущие реплики даны только для понимания, кто говорит, "
+            f"в ответ их НЕ включай:\n{context}\n\n"
+        )
+    prompt += f"Текст разговора:\n{text}"
+    r = ai.chat.completions.create(
+        model='gpt-4o-mini',
+        messages=[{'role': 'user', 'content': prompt}],
+        temperature=0.1,
+        max_tokens=4000,
+        timeout=STRUCTURE_TIMEOUT,
+    )
+    raw = r.choices[0].message.content.strip()
+    if raw.startswith('```'):
+        raw = raw.split('```')[1]
+        if raw.startswith('json'):
+            raw = raw[4:]
+    return json.loads(raw)
+
+
+def stitch_replicas(parts: list) -> list:
+    """Склеивает реплики кусков; реплика, разрезанная границей куска, объединяется обратно."""
+    result = []
+    for part in parts:
+        for i, replica in enumerate(part):
+            if i == 0 and result and result[-1].get('role') == replica.get('role'):
+                result[-1] = {**result[-1], 'text': f"{result[-1].get('text', '')} {replica.get('text', '')}".strip()}
+            else:
+                result.append(replica)
+    return result
+
+
 def structure_transcript(text: str, openai_key: str) -> list:
+    """Разметка реплик по говорящим. Длинный текст размечается кусками параллельно,
+    поэтому время ограничено самым медленным куском, а не длиной разговора."""
     ai = _make_ai_client(openai_key)
-    prompt = (
-        "Перед тобой расшифровка телефонного разговора между оператором автосервиса и клиентом.\n"
-        "Раздели текст на реплики. Для каждой реплики определи: кто говорит (оператор или клиент).\n\n"
-        "Верни JSON массив объектов в формате:\n"
-        '[{"speaker":"Оператор","role":"operator","text":"..."},{"speaker":"Клиент","role":"client","text":"..."}]\n\n'
-        "Правила:\n"
-        "- role: 'operator' для сотрудника автосервиса, 'client' для клиента\n"
-        "- Не меняй слова, только разбей на реплики\n"
-        "- Если не можешь определить кто говорит — role: 'unknown', speaker: 'Неизвестно'\n"
-        "- Верни ТОЛЬКО JSON массив, без пояснений\n\n"
-        f"Текст разговора:\n{text}"
-    )
+    chunks = split_transcript(text)
+    if not chunks:
+        return []
     try:
-        r = ai.chat.completions.create(
-            model='gpt-4o-mini',
-            messages=[{'role': 'user', 'content': prompt}],
-            temperature=0.1,
-            max_tokens=4000,
-        )
-        raw = r.choices[0].message.content.strip()
-        if raw.startswith('```'):
-            raw = raw.split('```')[1]
-            if raw.startswith('json'):
-                raw = raw[4:]
-        return json.loads(raw)
+        if len(chunks) == 1:
+            return structure_chunk(ai, '', chunks[0][1])
+        with ThreadPoolExecutor(max_workers=min(len(chunks), STRUCTURE_WORKERS)) as executor:
+            parts = list(executor.map(lambda c: structure_chunk(ai, *c), chunks))
+        return stitch_replicas(parts)
     except Exception as e:
+        # Частичная разметка не кешируется: пустой результат будет пересчитан при следующем открытии
         print(f"[structure_transcript] error: {e}")
         return []
 
 
+# ── Transcription queue ───────────────────────────────────────────────────────
+#
+# Завершённые входящие звонки с записью ставятся в transcription_jobs в той же
+# транзакции, что и сам звонок. TRANSCRIBE_WORKERS потоков забирают задания через
+# FOR UPDATE SKIP LOCKED и держат их TRANSCRIBE_LEASE секунд; если воркер упал,
+# задание по истечении аренды забирает другой. Ошибка — повтор с экспоненциальной
+# паузой, после TRANSCRIBE_MAX_ATTEMPTS попыток задание переходит в 'dead'.
+
+def enqueue_transcription(cur, mobilon_id: str, record_url: str):
+    """Ставит звонок в очередь расшифровки в текущей транзакции; повторный вебхук задание не дублирует."""
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.transcription_jobs (mobilon_id, record_url, max_attempts)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (mobilon_id) DO UPDATE SET record_url = EXCLUDED.record_url, updated_at = NOW()
+        WHERE {SCHEMA}.transcription_jobs.status = 'queued'
+    """, (mobilon_id, record_url, TRANSCRIBE_MAX_ATTEMPTS))
+    cur.execute(f"""
+        UPDATE {SCHEMA}.calls SET transcript_status = 'pending'
+        WHERE mobilon_id = %s AND COALESCE(transcript_status, 'none') <> 'done'
+    """, (mobilon_id,))
+
+
+def claim_transcription_job(worker_id: str):
+    """Забирает одно готовое задание (или задание с истёкшей арендой). Возвращает (id, mobilon_id, record_url) или None."""
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"""
+            UPDATE {SCHEMA}.transcription_jobs
+            SET status = 'dead', locked_by = NULL, locked_until = NULL, finished_at = NOW(), updated_at = NOW(),
+                last_error = COALESCE(last_error, 'lease expired')
+            WHERE status = 'running' AND locked_until < NOW() AND attempts >= max_attempts
+            RETURNING mobilon_id
+        """)
+        dead = [r[0] for r in cur.fetchall()]
+        if dead:
+            cur.execute(f"UPDATE {SCHEMA}.calls SET transcript_status = 'failed' WHERE mobilon_id = ANY(%s)", (dead,))
+        cur.execute(f"""
+            UPDATE {SCHEMA}.transcription_jobs j
+            SET status = 'running', attempts = j.attempts + 1, locked_by = %s,
+                locked_until = NOW() + %s * INTERVAL '1 second', started_at = NOW(), updated_at = NOW()
+            WHERE j.id = (
+                SELECT id FROM {SCHEMA}.transcription_jobs
+                WHERE (status = 'queued' AND run_after <= NOW())
+                   OR (status = 'running' AND locked_until < NOW() AND attempts < max_attempts)
+                ORDER BY run_after, id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING j.id, j.mobilon_id, j.record_url
+        """, (worker_id, TRANSCRIBE_LEASE))
+        row = cur.fetchone()
+        conn.commit()
+        return row
+    finally:
+        conn.close()
+
+
+def finish_transcription_job(job_id: int, worker_id: str, error: str = None, retry: bool = True):
+    """Закрывает задание либо планирует повтор (retry=False — сразу в 'dead').
+    Если аренду уже забрал другой воркер — ничего не меняет."""
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        if error is None:
+            cur.execute(f"""
+                UPDATE {SCHEMA}.transcription_jobs
+                SET status = 'done', locked_by = NULL, locked_until = NULL, last_error = NULL,
+                    finished_at = NOW(), updated_at = NOW()
+                WHERE id = %s AND locked_by = %s
+            """, (job_id, worker_id))
+        else:
+            cur.execute(f"""
+                UPDATE {SCHEMA}.transcription_jobs
+                SET status = CASE WHEN NOT %s OR attempts >= max_attempts THEN 'dead' ELSE 'queued' END,
+                    run_after = NOW() + LEAST(%s * power(2, attempts - 1), %s) * (0.75 + random() * 0.5) * INTERVAL '1 second',
+                    finished_at = CASE WHEN NOT %s OR attempts >= max_attempts THEN NOW() END,
+                    locked_by = NULL, locked_until = NULL, last_error = %s, updated_at = NOW()
+                WHERE id = %s AND locked_by = %s
+                RETURNING status, mobilon_id
+            """, (retry, TRANSCRIBE_BACKOFF, TRANSCRIBE_BACKOFF_MAX, retry, error[:1000], job_id, worker_id))
+            row = cur.fetchone()
+            if row and row[0] == 'dead':
+                cur.execute(f"UPDATE {SCHEMA}.calls SET transcript_status = 'failed' WHERE mobilon_id = %s", (row[1],))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+class TranscriptionWorkers:
+    """Фиксированный пул потоков, разбирающих очередь transcription_jobs."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.threads = []
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.worker_prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+    def start(self):
+        if self.threads:
+            return
+        if not os.environ.get('OPENAI_API_KEY'):
+            print('[TRANSCRIBE QUEUE] OPENAI_API_KEY not set, workers not started')
+            return
+        self.stopping.clear()
+        for i in range(self.workers):
+            th = threading.Thread(target=self._run, name=f'transcribe-{i}', daemon=True)
+            th.start()
+            self.threads.append(th)
+
+    def alive(self) -> int:
+        return sum(1 for th in self.threads if th.is_alive())
+
+    def notify(self):
+        """Будит воркеров сразу после постановки задания, не дожидаясь TRANSCRIBE_POLL."""
+        self.wakeup.set()
+
+    def _run(self):
+        worker_id = f'{self.worker_prefix}:{threading.current_thread().name}'
+        while not self.stopping.is_set():
+            try:
+                job = claim_transcription_job(worker_id)
+            except Exception as e:
+                print(f"[TRANSCRIBE QUEUE] claim error: {e}")
+                job = None
+            if job is None:
+                self.wakeup.wait(TRANSCRIBE_POLL)
+                self.wakeup.clear()
+                continue
+
+            job_id, mobilon_id, record_url = job
+            error, retry = None, True
+            try:
+                auto_transcribe(mobilon_id, record_url)
+            except Exception as e:
+                error = f'{type(e).__name__}: {e}'
+                retry = not isinstance(e, AudioTooLarge)
+                print(f"[AUTO TRANSCRIBE] {mobilon_id} failed: {error}")
+            try:
+                finish_transcription_job(job_id, worker_id, error, retry)
+            except Exception as e:
+                # Задание вернётся в работу по истечении аренды
+                print(f"[TRANSCRIBE QUEUE] finish error: {e}")
+
+    def stop(self, timeout: float = SHUTDOWN_TIMEOUT):
+        """Дожидается текущих заданий; незавершённые вернутся в очередь по истечении аренды."""
+        self.stopping.set()
+        self.wakeup.set()
+        for th in self.threads:
+            th.join(timeout)
+        self.threads = []
+
+
+TRANSCRIBERS = TranscriptionWorkers(TRANSCRIBE_WORKERS)
+
+
+def handle_transcription_queue() -> dict:
+    """Глубина очереди, возраст старейшего готового задания, пропускная способность и последние 'dead'."""
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT
+                COUNT(*) FILTER (WHERE status = 'queued'),
+                COUNT(*) FILTER (WHERE status = 'queued' AND run_after <= NOW()),
+                COUNT(*) FILTER (WHERE status = 'running'),
+                COUNT(*) FILTER (WHERE status = 'dead'),
+                EXTRACT(EPOCH FROM NOW() - MIN(run_after) FILTER (WHERE status = 'queued' AND run_after <= NOW()))
+            FROM {SCHEMA}.transcription_jobs
+            WHERE status IN ('queued', 'running', 'dead')
+        """)
+        queued, ready, running, dead, oldest = cur.fetchone()
+        cur.execute(f"""
+            SELECT
+                COUNT(*) FILTER (WHERE status = 'done' AND finished_at > NOW() - INTERVAL '1 hour'),
+                COUNT(*) FILTER (WHERE status = 'done'),
+                COUNT(*) FILTER (WHERE status = 'dead'),
+                AVG(EXTRACT(EPOCH FROM finished_at - started_at)) FILTER (WHERE status = 'done' AND finished_at > NOW() - INTERVAL '1 hour')
+            FROM {SCHEMA}.transcription_jobs
+            WHERE finished_at > NOW() - INTERVAL '24 hours'
+        """)
+        done_1h, done_24h, dead_24h, avg_1h = cur.fetchone()
+        cur.execute(f"""
+            SELECT mobilon_id, attempts, last_error, finished_at
+            FROM {SCHEMA}.transcription_jobs
+            WHERE status = 'dead'
+            ORDER BY finished_at DESC NULLS LAST
+            LIMIT 20
+        """)
+        dead_jobs = [
+            {'call_id': r[0], 'attempts': r[1], 'error': r[2], 'finished_at': r[3].isoformat() if r[3] else None}
+            for r in cur.fetchall()
+        ]
+    finally:
+        conn.close()
+
+    return {
+        'depth': {'queued': queued, 'ready': ready, 'running': running, 'dead': dead},
+        'oldest_ready_seconds': round(float(oldest), 1) if oldest is not None else None,
+        'throughput': {
+            'done_1h': done_1h,
+            'done_24h': done_24h,
+            'dead_24h': dead_24h,
+            'avg_seconds_1h': round(float(avg_1h), 1) if avg_1h is not None else None,
+        },
+        'workers': {'configured': TRANSCRIBERS.workers, 'alive': TRANSCRIBERS.alive()},
+        'dead_jobs': dead_jobs,
+    }
+
+
+def handle_transcription_retry(params: dict) -> tuple:
+    """Возвращает 'dead'-задание в очередь с обнулённым счётчиком попыток."""
+    call_id = params.get('call_id', '').strip()
+    if not call_id:
+        return 400, {'error': 'call_id is required'}
+
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"""
+            UPDATE {SCHEMA}.transcription_jobs
+            SET status = 'queued', attempts = 0, run_after = NOW(), last_error = NULL,
+                finished_at = NULL, updated_at = NOW()
+            WHERE mobilon_id = %s AND status = 'dead'
+            RETURNING id
+        """, (call_id,))
+        row = cur.fetchone()
+        if row:
+            cur.execute(f"UPDATE {SCHEMA}.calls SET transcript_status = 'pending' WHERE mobilon_id = %s", (call_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    if not row:
+        return 404, {'error': 'dead job not found'}
+    TRANSCRIBERS.notify()
+    return 200, {'ok': True, 'job_id': row[0]}
+
+
 # ── DB query helpers ──────────────────────────────────────────────────────────
 
 def db_calls_to_list(rows):
@@ -363,6 +1238,7 @@ def db_calls_to_list(rows):
         record_url = raw.get('recordUrl') or raw.get('record_url') or None
         has_record = bool(record_url)
         structured = r[14] if len(r) > 14 and r[14] else None
+        caller = CALLER_ID.lookup(r[2])
         result.append({
             'id': r[1] or str(r[0]),
             'phone': r[2] or '',
@@ -378,7 +1254,8 @@ def db_calls_to_list(rows):
             'record_url': record_url,
             'status': r[8] or '',
             'operator_id': '',
-            'client_name': r[11] or None,
+            'client_id': r[11] or (caller['client_id'] if caller else None),
+            'client_name': caller['name'] if caller else None,
             'transcript': r[12] or None,
             'transcript_status': r[13] or 'none',
             'transcript_structured': structured,
@@ -399,27 +1276,38 @@ def handle_list_db(params: dict) -> dict:
     ts_from = int(datetime.strptime(date_from, '%Y-%m-%d').timestamp())
     ts_to = int((datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)).timestamp())
 
+    # Счётчики считаются по тем же условиям, что и список, но без LIMIT: в них попадают и
+    # незавершённые звонки. call_stats_hourly (только завершённые) отдаётся лишь через action=stats
+    where = f"""
+        WHERE c.started_at >= {ts_from} AND c.started_at < {ts_to}
+          AND NOT (c.src ~ '^\\d{{1,3}}$' AND c.dst ~ '^\\d{{1,3}}$')
+          AND (c.raw->>'direction') != 'internal'
+    """
     conn = get_db()
     try:
         cur = conn.cursor()
         cur.execute(f"""
             SELECT c.id, c.mobilon_id, c.phone, c.src, c.dst, c.direction, c.duration,
                    c.started_at, c.state, c.uuid, c.raw,
-                   cl.name AS client_name,
+                   c.client_id,
                    c.transcript, c.transcript_status,
                    ct.transcript_structured
             FROM {SCHEMA}.calls c
-            LEFT JOIN {SCHEMA}.clients cl
-                ON right(regexp_replace(cl.phone, '[^0-9]', '', 'g'), 10) =
-                   right(regexp_replace(c.phone, '[^0-9]', '', 'g'), 10)
             LEFT JOIN {SCHEMA}.call_transcripts ct ON ct.mobilon_id = c.mobilon_id
-            WHERE c.started_at >= {ts_from} AND c.started_at < {ts_to}
-              AND NOT (c.src ~ '^\\d{{1,3}}$' AND c.dst ~ '^\\d{{1,3}}$')
-              AND (c.raw->>'direction') != 'internal'
+            {where}
             ORDER BY c.started_at DESC
             LIMIT 500
         """)
         rows = cur.fetchall()
+        cur.execute(f"""
+            SELECT COUNT(*) FILTER (WHERE c.direction = 'in'),
+                   COUNT(*) FILTER (WHERE c.direction = 'out'),
+                   COUNT(*) FILTER (WHERE c.direction = 'missed'),
+                   COUNT(*)
+            FROM {SCHEMA}.calls c
+            {where}
+        """)
+        incoming, outgoing, missed, total = cur.fetchone()
     finally:
         conn.close()
 
@@ -427,10 +1315,10 @@ def handle_list_db(params: dict) -> dict:
     return {
         'calls': calls,
         'stats': {
-            'total': len(calls),
-            'incoming': sum(1 for c in calls if c['direction'] == 'in'),
-            'outgoing': sum(1 for c in calls if c['direction'] == 'out'),
-            'missed': sum(1 for c in calls if c['direction'] == 'missed'),
+            'total': total,
+            'incoming': incoming,
+            'outgoing': outgoing,
+            'missed': missed,
         },
         'date_from': date_from,
         'date_to': date_to,
@@ -438,72 +1326,204 @@ def handle_list_db(params: dict) -> dict:
     }
 
 
-def handle_active() -> dict:
+def handle_stats(params: dict) -> tuple:
+    """Итоги по звонкам из call_stats_hourly: плотные ряды по часам или дням, тепловая карта
+    «день недели × час» и разбивка по операторам. Время — локальное время сервера."""
+    granularity = params.get('granularity', 'day')
+    if granularity not in ('hour', 'day'):
+        return 400, {'error': 'granularity must be hour or day'}
+    try:
+        date_from = params.get('date_from', '') or (datetime.now() - timedelta(days=6)).strftime('%Y-%m-%d')
+        date_to = params.get('date_to', '') or datetime.now().strftime('%Y-%m-%d')
+        start = datetime.strptime(date_from, '%Y-%m-%d')
+        end = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
+    except ValueError:
+        return 400, {'error': 'date must be YYYY-MM-DD'}
+    if end <= start or (end - start).days > STATS_MAX_DAYS:
+        return 400, {'error': f'range must be 1..{STATS_MAX_DAYS} days'}
+
     conn = get_db()
     try:
         cur = conn.cursor()
         cur.execute(f"""
-            SELECT c.id, c.mobilon_id, c.phone, c.src, c.dst, c.direction,
-                   c.state, c.started_at, c.raw,
-                   cl.name AS client_name
-            FROM {SCHEMA}.calls c
-            LEFT JOIN {SCHEMA}.clients cl
-                ON right(regexp_replace(cl.phone, '[^0-9]', '', 'g'), 10) =
-                   right(regexp_replace(c.phone, '[^0-9]', '', 'g'), 10)
-            WHERE c.created_at >= NOW() - INTERVAL '60 seconds'
-              AND (c.raw->>'direction') = 'incoming'
-              AND c.state NOT IN ('HANGUP', 'END')
-              AND NOT (c.src ~ '^\\d{{1,3}}$' AND c.dst ~ '^\\d{{1,3}}$')
-            ORDER BY c.created_at DESC
-            LIMIT 1
-        """)
-        row = cur.fetchone()
+            SELECT hour, operator, inbound, answered, missed, outbound, talk_seconds,
+                   dur_lt_30, dur_30_120, dur_120_300, dur_gt_300
+            FROM {SCHEMA}.call_stats_hourly
+            WHERE hour >= %s AND hour < %s
+        """, (int(start.timestamp()), int(end.timestamp())))
+        rows = cur.fetchall()
     finally:
         conn.close()
 
-    if row:
-        return {
-            'active': True,
-            'call': {
-                'id': row[1] or str(row[0]),
-                'phone': row[2] or '',
-                'src': row[3] or '',
-                'dst': row[4] or '',
-                'direction': row[5] or 'in',
-                'state': row[6] or '',
-                'started_at': str(row[7]) if row[7] else '',
-                'client_name': row[9] or None,
-            }
-        }
-    return {'active': False, 'call': None}
+    metrics = ('inbound', 'answered', 'missed', 'outbound', 'talk_seconds')
+    durations = ('dur_lt_30', 'dur_30_120', 'dur_120_300', 'dur_gt_300')
+
+    labels = []
+    step = timedelta(hours=1) if granularity == 'hour' else timedelta(days=1)
+    fmt = '%Y-%m-%dT%H:00' if granularity == 'hour' else '%Y-%m-%d'
+    cursor = start
+    while cursor < end:
+        labels.append(cursor.strftime(fmt))
+        cursor += step
+    position = {label: i for i, label in enumerate(labels)}
+    series = {m: [0] * len(labels) for m in metrics}
+    totals = dict.fromkeys(metrics + durations, 0)
+    heat_inbound = [[0] * 24 for _ in range(7)]
+    heat_missed = [[0] * 24 for _ in range(7)]
+    operators = {}
+
+    for r in rows:
+        local = datetime.fromtimestamp(r[0])
+        i = position.get(local.strftime(fmt))
+        values = dict(zip(metrics + durations, r[2:]))
+        if i is not None:
+            for m in metrics:
+                series[m][i] += values[m]
+        for k, v in values.items():
+            totals[k] += v
+        heat_inbound[local.weekday()][local.hour] += values['inbound']
+        heat_missed[local.weekday()][local.hour] += values['missed']
+        op = operators.setdefault(r[1], dict.fromkeys(metrics, 0))
+        for m in metrics:
+            op[m] += values[m]
+
+    rate = lambda missed, inbound: round(missed / inbound, 4) if inbound else None
+    series['missed_rate'] = [rate(m, n) for m, n in zip(series['missed'], series['inbound'])]
+    return 200, {
+        'granularity': granularity,
+        'date_from': date_from,
+        'date_to': date_to,
+        'labels': labels,
+        'series': series,
+        'totals': {
+            **{m: totals[m] for m in metrics},
+            'missed_rate': rate(totals['missed'], totals['inbound']),
+            'answer_rate': round(totals['answered'] / totals['inbound'], 4) if totals['inbound'] else None,
+            'avg_talk_seconds': round(totals['talk_seconds'] / (totals['answered'] + totals['outbound']), 1)
+                if totals['answered'] + totals['outbound'] else None,
+            'durations': {d: totals[d] for d in durations},
+        },
+        'heatmap': {
+            'weekdays': ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс'],
+            'inbound': heat_inbound,
+            'missed': heat_missed,
+            'missed_rate': [[rate(m, n) for m, n in zip(mr, nr)] for mr, nr in zip(heat_missed, heat_inbound)],
+        },
+        'operators': sorted(
+            ({'operator': k or None, **v, 'missed_rate': rate(v['missed'], v['inbound'])} for k, v in operators.items()),
+            key=lambda o: -(o['inbound'] + o['outbound'])
+        ),
+    }
+
+
+def handle_active() -> dict:
+    return ACTIVE_CALLS.snapshot()
+
+
+def handle_active_wait(params: dict) -> dict:
+    """Long-poll: ответ приходит сразу при новом/завершённом звонке или через timeout секунд."""
+    since = params.get('since', '')
+    if not str(since).lstrip('-').isdigit():
+        return ACTIVE_CALLS.snapshot()
+    timeout = params.get('timeout', '')
+    timeout = min(int(timeout), ACTIVE_WAIT_MAX) if str(timeout).isdigit() else ACTIVE_WAIT_MAX
+    if not ACTIVE_WAITERS.acquire(blocking=False):
+        # Все слоты ожидания заняты — отвечаем сразу, клиент повторит запрос позже
+        return {**ACTIVE_CALLS.snapshot(), 'retry_after': 5}
+    try:
+        return ACTIVE_CALLS.wait(int(since), timeout)
+    finally:
+        ACTIVE_WAITERS.release()
 
 
 def handle_calls_by_phone(params: dict) -> dict:
     phone = params.get('phone', '').strip()
     if not phone:
         return {'error': 'phone is required'}
+    key = phone_key(phone)
+    if not key:
+        return {'calls': []}
     conn = get_db()
     try:
         cur = conn.cursor()
         cur.execute(f"""
             SELECT c.id, c.mobilon_id, c.phone, c.src, c.dst, c.direction, c.duration,
                    c.started_at, c.state, c.uuid, c.raw,
-                   NULL AS client_name,
+                   c.client_id,
                    c.transcript, c.transcript_status,
                    ct.transcript_structured
             FROM {SCHEMA}.calls c
             LEFT JOIN {SCHEMA}.call_transcripts ct ON ct.mobilon_id = c.mobilon_id
-            WHERE right(regexp_replace(c.phone, '[^0-9]', '', 'g'), 10) =
-                  right(regexp_replace('{phone}', '[^0-9]', '', 'g'), 10)
+            WHERE c.phone_key = %s
             ORDER BY c.started_at DESC
             LIMIT 100
-        """)
+        """, (key,))
         rows = cur.fetchall()
     finally:
         conn.close()
     return {'calls': db_calls_to_list(rows)}
 
 
+def handle_search_transcripts(params: dict) -> tuple:
+    """Поиск по расшифровкам: ранжированные звонки с подсвеченными фрагментами.
+    ts_headline считается только для отобранной страницы — он дорогой."""
+    q = params.get('q', '').strip()
+    if not q:
+        return 400, {'error': 'q is required'}
+    limit = params.get('limit', '')
+    limit = min(int(limit), TRANSCRIPT_SEARCH_LIMIT) if str(limit).isdigit() and int(limit) > 0 else 20
+
+    filters, args = [], [q]
+    try:
+        if params.get('date_from'):
+            filters.append('AND ct.started_at >= %s')
+            args.append(int(datetime.strptime(params['date_from'], '%Y-%m-%d').timestamp()))
+        if params.get('date_to'):
+            filters.append('AND ct.started_at < %s')
+            args.append(int((datetime.strptime(params['date_to'], '%Y-%m-%d') + timedelta(days=1)).timestamp()))
+    except ValueError:
+        return 400, {'error': 'date must be YYYY-MM-DD'}
+    args.append(limit)
+
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT hit.mobilon_id, hit.phone, hit.direction, hit.started_at, hit.duration, c.client_id, hit.rank,
+                   ts_headline('russian', hit.transcript_raw, hit.q, %s)
+            FROM (
+                SELECT ct.mobilon_id, ct.phone, ct.direction, ct.started_at, ct.duration, ct.transcript_raw, q,
+                       ts_rank_cd(ct.tsv, q) AS rank
+                FROM {SCHEMA}.call_transcripts ct, websearch_to_tsquery('russian', %s) q
+                WHERE ct.tsv @@ q
+                  {' '.join(filters)}
+                ORDER BY rank DESC, ct.started_at DESC
+                LIMIT %s
+            ) hit
+            LEFT JOIN {SCHEMA}.calls c ON c.mobilon_id = hit.mobilon_id
+            ORDER BY hit.rank DESC, hit.started_at DESC
+        """, [TRANSCRIPT_HEADLINE] + args)
+        rows = cur.fetchall()
+    finally:
+        conn.close()
+
+    results = []
+    for r in rows:
+        caller = CALLER_ID.lookup(r[1])
+        results.append({
+            'call_id': r[0],
+            'phone': r[1] or '',
+            'direction': r[2] or 'in',
+            'started_at': str(r[3]) if r[3] else '',
+            'duration': r[4] or 0,
+            'client_id': r[5] or (caller['client_id'] if caller else None),
+            'client_name': caller['name'] if caller else None,
+            'rank': round(float(r[6]), 4),
+            'snippet': r[7],
+        })
+    return 200, {'results': results, 'q': q}
+
+
 def handle_transcribe(params: dict) -> tuple:
     """Возвращает (status_code, body_dict)."""
 
@@ -515,6 +1535,41 @@ def handle_transcribe(params: dict) -> tuple:
     if not openai_key:
         return 500, {'error': 'OPENAI_API_KEY not configured'}
 
+    # Та же блокировка, что у очереди: повторный клик дождётся первой расшифровки и получит её из кеша
+    with CALL_FLIGHTS.hold(call_id):
+        return _transcribe_call(call_id, openai_key)
+
+
+def insert_call_transcript(cur, mobilon_id: str, text: str, structured: list):
+    """Создаёт строку call_transcripts, копируя реквизиты звонка из calls."""
+    cur.execute(f"""
+        INSERT INTO {SCHEMA}.call_transcripts
+            (call_id, mobilon_id, phone, dst, direction, started_at, duration, transcript_raw, transcript_structured)
+        SELECT id, mobilon_id, COALESCE(NULLIF(phone, ''), src, ''), dst, direction, started_at, duration, %s, %s
+        FROM {SCHEMA}.calls WHERE mobilon_id = %s
+        LIMIT 1
+        ON CONFLICT DO NOTHING
+    """, (text, json.dumps(structured, ensure_ascii=False), mobilon_id))
+
+
+def save_structured(mobilon_id: str, text: str, structured: list):
+    """Кеширует разметку реплик в call_transcripts (создаёт строку, если её ещё нет)."""
+    conn = get_db()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            f"""UPDATE {SCHEMA}.call_transcripts SET transcript_structured = %s, updated_at = NOW()
+                WHERE mobilon_id = %s""",
+            (json.dumps(structured, ensure_ascii=False), mobilon_id)
+        )
+        if cur.rowcount == 0:
+            insert_call_transcript(cur, mobilon_id, text, structured)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _transcribe_call(call_id: str, openai_key: str) -> tuple:
     conn = get_db()
     try:
         cur = conn.cursor()
@@ -537,30 +1592,28 @@ def handle_transcribe(params: dict) -> tuple:
 
     if cached and cached[0]:
         structured = cached[1] if cached[1] else []
+        if not structured:
+            structured = structure_transcript(cached[0], openai_key)
+            if structured:
+                save_structured(mobilon_id, cached[0], structured)
         return 200, {'transcript': cached[0], 'structured': structured, 'cached': True}
 
     if transcript and transcript_status == 'done':
-        return 200, {'transcript': transcript, 'structured': [], 'cached': True}
+        structured = structure_transcript(transcript, openai_key)
+        if structured:
+            save_structured(mobilon_id, transcript, structured)
+        return 200, {'transcript': transcript, 'structured': structured, 'cached': True}
 
     record_url = (raw or {}).get('recordUrl') or (raw or {}).get('record_url')
     if not record_url:
         return 400, {'error': 'no_record', 'message': 'Запись разговора недоступна'}
 
     try:
-        req = urllib.request.Request(record_url, headers={'User-Agent': 'Mozilla/5.0'})
-        with _urlopen(req, timeout=30) as r:
-            audio_data = r.read()
-    except Exception as e:
+        text = transcribe_recording(record_url, openai_key)
+    except AudioTooLarge as e:
+        return 413, {'error': 'record_too_large', 'message': str(e)}
+    except (urllib.error.URLError, OSError) as e:
         return 502, {'error': 'download_failed', 'message': str(e)}
-
-    ai_client = _make_ai_client(openai_key)
-    try:
-        result = ai_client.audio.transcriptions.create(
-            model='whisper-1',
-            file=('call.mp3', io.BytesIO(audio_data), 'audio/mpeg'),
-            language='ru',
-        )
-        text = result.text.strip()
     except Exception as e:
         return 502, {'error': 'whisper_failed', 'message': str(e)}
 
@@ -584,6 +1637,12 @@ def handle_transcribe(params: dict) -> tuple:
             (db_id, mobilon_id, phone or src, dst, direction, started_at, duration,
              text, json.dumps(structured, ensure_ascii=False))
         )
+        cur2.execute(
+            f"""UPDATE {SCHEMA}.transcription_jobs
+                SET status = 'done', last_error = NULL, finished_at = NOW(), updated_at = NOW()
+                WHERE mobilon_id = %s AND status IN ('queued', 'dead')""",
+            (mobilon_id,)
+        )
         conn2.commit()
     finally:
         conn2.close()
@@ -689,14 +1748,41 @@ def handle_list_api(params: dict) -> dict:
         dates.append(d.strftime('%Y-%m-%d'))
         d += timedelta(days=1)
 
-    all_raw = []
-    with ThreadPoolExecutor(max_workers=min(len(dates), 7)) as executor:
-        futures = {executor.submit(get_journal_for_date, token, date): date for date in dates}
-        for future in as_completed(futures):
+    closed = [d for d in dates if journal_day_closed(d, datetime.now())]
+    all_raw, cached = [], set()
+    try:
+        conn = get_db()
+        try:
+            cached, all_raw = load_cached_journal(conn.cursor(), closed)
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f"[JOURNAL CACHE] read error: {e}")
+
+    fetched = {}
+    to_fetch = [d for d in dates if d not in cached]
+    if to_fetch:
+        with ThreadPoolExecutor(max_workers=min(len(to_fetch), JOURNAL_WORKERS)) as executor:
+            futures = {executor.submit(get_journal_for_date, token, date): date for date in to_fetch}
+            for future in as_completed(futures):
+                try:
+                    fetched[futures[future]] = future.result()
+                except Exception:
+                    pass
+    for calls in fetched.values():
+        all_raw.extend(calls)
+
+    to_store = {d: fetched[d] for d in closed if d in fetched}
+    if to_store:
+        try:
+            conn = get_db()
             try:
-                all_raw.extend(future.result())
-            except Exception:
-                pass
+                store_journal_days(conn.cursor(), to_store)
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[JOURNAL CACHE] write error: {e}")
 
     all_raw.sort(key=lambda c: c.get('time', ''), reverse=True)
     calls = [format_call(c, token) for c in all_raw]
@@ -710,6 +1796,8 @@ def handle_list_api(params: dict) -> dict:
         },
         'date_from': date_from,
         'date_to': date_to,
+        'days_cached': len(cached),
+        'days_fetched': len(fetched),
     }
 
 
@@ -720,6 +1808,8 @@ def make_response(status: int, body: dict) -> tuple:
 
 
 class CallsHandler(BaseHTTPRequestHandler):
+    # Таймаут чтения сокета: медленный или зависший клиент не держит поток пула
+    timeout = REQUEST_TIMEOUT
 
     def log_message(self, format, *args):
         print(f"[HTTP] {self.address_string()} {format % args}")
@@ -775,7 +1865,29 @@ class CallsHandler(BaseHTTPRequestHandler):
                 pass
         self._dispatch('POST', params, body_json)
 
+    def _save_webhooks_now(self, events: list):
+        """Синхронная запись для прокси: 200 — только когда все события в БД.
+        Недоступная БД — 503 (прокси повторяет без ограничений), прочие ошибки — 500."""
+        try:
+            for event in events:
+                save_webhook_to_db(event)
+        except Exception as e:
+            print(f"[WEBHOOK] DB error, прокси повторит отправку: {e}")
+            self.send_text(webhook_error_status(e), 'error')
+            return
+        self.send_text(200, 'ok')
+
     def _dispatch(self, method: str, params: dict, body: dict):
+        # webhook_proxy.py считает событие доставленным по ответу 200 и сдвигает позицию своего журнала,
+        # поэтому его события пишутся в БД до ответа, а не через очередь в памяти
+        from_proxy = 'MobilonWebhookProxy' in (self.headers.get('User-Agent') or '')
+
+        # ── Пачка вебхуков от webhook_proxy.py (PROXY_BATCH_SIZE > 1) ──
+        events = body.get('events') if method == 'POST' and isinstance(body, dict) else None
+        if isinstance(events, list) and 'action' not in params:
+            self._save_webhooks_now([event for event in events if isinstance(event, dict)])
+            return
+
         # ── Входящий вебхук от Мобилон (POST JSON или GET с параметрами) ──
         merged = {**params, **body}
 
@@ -790,10 +1902,11 @@ class CallsHandler(BaseHTTPRequestHandler):
 
         if is_webhook_post or is_webhook_get:
             print(f"[MOBILON WEBHOOK {method}] {json.dumps(merged, ensure_ascii=False)}")
-            try:
-                save_webhook_to_db(merged)
-            except Exception as e:
-                print(f"[WEBHOOK] DB error: {e}")
+            if from_proxy:
+                self._save_webhooks_now([merged])
+                return
+            # Быстрая полоса: событие ставится в очередь записи, ответ Мобилону — сразу
+            WEBHOOKS.submit(merged)
             self.send_text(200, 'ok')
             return
 
@@ -801,80 +1914,216 @@ class CallsHandler(BaseHTTPRequestHandler):
         action = params.get('action', 'list_db')
 
         try:
-            if action == 'list_db':
-                self.send_json(200, handle_list_db(params))
+            if action in FAST_ACTIONS:
+                code, body_resp = route_action(action, params, body)
+            else:
+                code, body_resp = SLOW_LANE.run(lambda: route_action(action, params, body))
+            self.send_json(code, body_resp)
+        except SlowLaneBusy:
+            self.send_json(503, {'error': 'busy', 'message': 'Сервер занят длительными запросами, повторите позже'})
+        except FutureTimeout:
+            self.send_json(504, {'error': 'timeout', 'message': f'Запрос не завершился за {SLOW_TIMEOUT} с'})
+        except Exception as e:
+            print(f"[ERROR] action={action}: {e}")
+            import traceback
+            traceback.print_exc()
+            self.send_json(500, {'error': str(e)})
 
-            elif action == 'active':
-                self.send_json(200, handle_active())
 
-            elif action == 'calls_by_phone':
-                self.send_json(200, handle_calls_by_phone(params))
+def handle_raw_request(body: dict) -> tuple:
+    token = os.environ.get('MOBILON_API_TOKEN', '')
+    userkey = os.environ.get('MOBILON_USER_KEY', '')
+    domain = os.environ.get('MOBILON_DOMAIN', 'connect.mobilon.ru').strip().rstrip('/')
+    raw_url = body.get('url', '').strip()
+    if not raw_url:
+        return 400, {'error': 'url required'}
+    full_url = raw_url.replace('{TOKEN}', token).replace('{KEY}', userkey).replace('{DOMAIN}', domain)
+    safe_url = full_url.replace(token, '{TOKEN}').replace(userkey, '{KEY}')
+    try:
+        req = urllib.request.Request(full_url, headers={'Accept': 'application/json, text/xml, */*'})
+        with _urlopen(req, timeout=TIMEOUT) as r:
+            http_status = r.status
+            raw = r.read().decode('utf-8')
+        try:
+            parsed_json = json.loads(raw)
+            return 200, {'url': safe_url, 'http_status': http_status, 'format': 'json', 'response': parsed_json}
+        except Exception:
+            pass
+        try:
+            root = ET.fromstring(raw)
+            def xml_to_dict(el):
+                d = {}
+                for child in el:
+                    if len(child):
+                        if child.tag in d:
+                            if not isinstance(d[child.tag], list):
+                                d[child.tag] = [d[child.tag]]
+                            d[child.tag].append(xml_to_dict(child))
+                        else:
+                            d[child.tag] = xml_to_dict(child)
+                    else:
+                        d[child.tag] = child.text or ''
+                return d
+            return 200, {'url': safe_url, 'http_status': http_status, 'format': 'xml',
+                         'response': xml_to_dict(root), 'raw': raw[:2000]}
+        except Exception:
+            pass
+        return 200, {'url': safe_url, 'http_status': http_status, 'format': 'text', 'response': raw[:3000]}
+    except urllib.error.HTTPError as e:
+        body_err = e.read().decode('utf-8') if e.fp else ''
+        return 200, {'url': safe_url, 'http_status': e.code,
+                     'error': f"HTTP {e.code}: {e.reason}", 'response': body_err[:1000]}
+    except Exception as e:
+        return 200, {'url': safe_url, 'error': str(e)}
+
+
+def route_action(action: str, params: dict, body: dict) -> tuple:
+    """Выполняет API-действие и возвращает (status_code, body_dict)."""
+    if action == 'list_db':
+        return 200, handle_list_db(params)
+    if action == 'active':
+        return 200, handle_active()
+    if action == 'active_wait':
+        return 200, handle_active_wait(params)
+    if action == 'calls_by_phone':
+        return 200, handle_calls_by_phone(params)
+    if action == 'transcribe':
+        return handle_transcribe(params)
+    if action == 'stats':
+        return handle_stats(params)
+    if action == 'search_transcripts':
+        return handle_search_transcripts(params)
+    if action == 'transcription_queue':
+        return 200, handle_transcription_queue()
+    if action == 'transcription_retry':
+        return handle_transcription_retry(params)
+    if action == 'ping':
+        return 200, handle_ping()
+    if action == 'raw_request':
+        return handle_raw_request(body)
+    # По умолчанию — список из Mobilon API
+    return 200, handle_list_api(params)
+
+
+# ── Concurrency ───────────────────────────────────────────────────────────────
+#
+# Каждое соединение обслуживается потоком из ограниченного пула REQUEST_WORKERS.
+# Быстрые действия (чтение из БД) выполняются прямо в нём; длительные (расшифровка,
+# журнал Мобилон, ping, raw_request) — в отдельном пуле SLOW_WORKERS с очередью
+# не длиннее SLOW_QUEUE_MAX и таймаутом SLOW_TIMEOUT. Поэтому длительные запросы
+# никогда не занимают все потоки, и вебхуки подтверждаются без ожидания.
+
+
+class SlowLaneBusy(Exception):
+    pass
+
+
+class SlowLane:
+    """Пул для длительных действий с ограниченной очередью и таймаутом ожидания результата."""
+
+    def __init__(self, workers: int, queue_max: int, timeout: int):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='slow')
+        self.slots = threading.BoundedSemaphore(workers + queue_max)
+        self.timeout = timeout
+
+    def run(self, fn):
+        if not self.slots.acquire(blocking=False):
+            raise SlowLaneBusy()
+        try:
+            future = self.pool.submit(fn)
+        except Exception:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _f: self.slots.release())
+        return future.result(timeout=self.timeout)
 
-            elif action == 'transcribe':
-                code, body_resp = handle_transcribe(params)
-                self.send_json(code, body_resp)
+    def shutdown(self):
+        self.pool.shutdown(wait=True, cancel_futures=True)
 
-            elif action == 'ping':
-                self.send_json(200, handle_ping())
 
-            elif action == 'raw_request':
-                token = os.environ.get('MOBILON_API_TOKEN', '')
-                userkey = os.environ.get('MOBILON_USER_KEY', '')
-                domain = os.environ.get('MOBILON_DOMAIN', 'connect.mobilon.ru').strip().rstrip('/')
-                raw_url = body.get('url', '').strip()
-                if not raw_url:
-                    self.send_json(400, {'error': 'url required'})
-                    return
-                full_url = raw_url.replace('{TOKEN}', token).replace('{KEY}', userkey).replace('{DOMAIN}', domain)
-                safe_url = full_url.replace(token, '{TOKEN}').replace(userkey, '{KEY}')
-                try:
-                    req = urllib.request.Request(full_url, headers={'Accept': 'application/json, text/xml, */*'})
-                    with _urlopen(req, timeout=TIMEOUT) as r:
-                        http_status = r.status
-                        raw = r.read().decode('utf-8')
-                    try:
-                        parsed_json = json.loads(raw)
-                        self.send_json(200, {'url': safe_url, 'http_status': http_status, 'format': 'json', 'response': parsed_json})
-                        return
-                    except Exception:
-                        pass
-                    try:
-                        root = ET.fromstring(raw)
-                        def xml_to_dict(el):
-                            d = {}
-                            for child in el:
-                                if len(child):
-                                    if child.tag in d:
-                                        if not isinstance(d[child.tag], list):
-                                            d[child.tag] = [d[child.tag]]
-                                        d[child.tag].append(xml_to_dict(child))
-                                    else:
-                                        d[child.tag] = xml_to_dict(child)
-                                else:
-                                    d[child.tag] = child.text or ''
-                            return d
-                        self.send_json(200, {'url': safe_url, 'http_status': http_status, 'format': 'xml',
-                                             'response': xml_to_dict(root), 'raw': raw[:2000]})
-                        return
-                    except Exception:
-                        pass
-                    self.send_json(200, {'url': safe_url, 'http_status': http_status, 'format': 'text', 'response': raw[:3000]})
-                except urllib.error.HTTPError as e:
-                    body_err = e.read().decode('utf-8') if e.fp else ''
-                    self.send_json(200, {'url': safe_url, 'http_status': e.code,
-                                         'error': f"HTTP {e.code}: {e.reason}", 'response': body_err[:1000]})
-                except Exception as e:
-                    self.send_json(200, {'url': safe_url, 'error': str(e)})
+class WebhookIngest:
+    """Очередь вебхуков: HTTP-поток только кладёт событие, запись в БД делает отдельный поток по порядку."""
 
-            else:
-                # По умолчанию — список из Mobilon API
-                self.send_json(200, handle_list_api(params))
+    def __init__(self, maxsize: int = 10000):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.thread = None
 
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name='webhook-writer', daemon=True)
+            self.thread.start()
+
+    def submit(self, data: dict):
+        if self.thread is None:
+            self._save(data)
+            return
+        try:
+            self.queue.put_nowait(data)
+        except queue.Full:
+            # Переполнение — пишем синхронно, чтобы не потерять событие
+            self._save(data)
+
+    def _save(self, data: dict):
+        try:
+            save_webhook_to_db(data)
         except Exception as e:
-            print(f"[ERROR] action={action}: {e}")
-            import traceback
-            traceback.print_exc()
-            self.send_json(500, {'error': str(e)})
+            print(f"[WEBHOOK] DB error: {e}")
+
+    def _run(self):
+        while True:
+            data = self.queue.get()
+            try:
+                if data is None:
+                    return
+                self._save(data)
+            finally:
+                self.queue.task_done()
+
+    def stop(self, timeout: float = SHUTDOWN_TIMEOUT):
+        """Дописывает накопленные события и останавливает поток записи."""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+
+def webhook_error_status(e: Exception) -> int:
+    """503 — нет соединения с БД (OperationalError/InterfaceError psycopg2), иначе 500."""
+    unavailable = any(
+        cls.__module__.startswith('psycopg2') and cls.__name__ in ('OperationalError', 'InterfaceError')
+        for cls in type(e).__mro__
+    )
+    return 503 if unavailable else 500
+
+
+SLOW_LANE = SlowLane(SLOW_WORKERS, SLOW_QUEUE_MAX, SLOW_TIMEOUT)
+WEBHOOKS = WebhookIngest()
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTP-сервер, обслуживающий соединения в ограниченном пуле потоков."""
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, workers: int = REQUEST_WORKERS):
+        super().__init__(server_address, handler_class)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
 
 
 # ── Entry point ───────────────────────────────────────────────────────────────
@@ -884,19 +2133,33 @@ def handler(event: dict, context) -> dict:
     return {'statusCode': 200, 'body': 'use local server'}
 
 
-if __name__ == '__main__':
-    import socket as _sock
+def serve(port: int = PORT) -> PooledHTTPServer:
+    """Создаёт сервер, запускает запись вебхуков и воркеров расшифровки; serve_forever вызывает вызывающий код."""
+    WEBHOOKS.start()
+    TRANSCRIBERS.start()
+    threading.Thread(target=CALLER_ID.ensure_fresh, name='caller-id-load', daemon=True).start()
+    return PooledHTTPServer(('0.0.0.0', port), CallsHandler)
+
+
+def shutdown_gracefully(server: PooledHTTPServer):
+    """Перестаёт принимать соединения, дожидается текущих запросов и дописывает очередь вебхуков."""
+    ACTIVE_CALLS.close()
+    server.server_close()
+    WEBHOOKS.stop()
+    TRANSCRIBERS.stop()
+    SLOW_LANE.shutdown()
 
+
+if __name__ == '__main__':
     webhook_url = os.environ.get('WEBHOOK_URL', f'http://YOUR_IP:{PORT}/')
 
-    class ReuseHTTPServer(HTTPServer):
-        allow_reuse_address = True
+    server = serve(PORT)
 
-        def server_bind(self):
-            self.socket.setsockopt(_sock.SOL_SOCKET, _sock.SO_REUSEADDR, 1)
-            super().server_bind()
+    def _on_signal(signum, frame):
+        print(f'\n  Получен сигнал {signum}, останавливаемся...')
+        threading.Thread(target=server.shutdown, daemon=True).start()
 
-    server = ReuseHTTPServer(('0.0.0.0', PORT), CallsHandler)
+    signal.signal(signal.SIGTERM, _on_signal)
 
     print()
     print('=' * 55)
@@ -906,6 +2169,7 @@ if __name__ == '__main__':
     print(f'  Webhook:    {webhook_url}')
     print(f'  Ping:      http://0.0.0.0:{PORT}/?action=ping')
     print(f'  List:      http://0.0.0.0:{PORT}/?action=list_db')
+    print(f'  Workers:   {REQUEST_WORKERS} http / {SLOW_WORKERS} slow')
     print('=' * 55)
     print('  Mobilon webhook URL:')
     print(f'  {webhook_url}')
@@ -920,5 +2184,6 @@ if __name__ == '__main__':
     try:
         server.serve_forever()
     except KeyboardInterrupt:
-        print('\n  Сервер остановлен.')
-        server.server_close()
\ No newline at end of file
+        pass
+    shutdown_gracefully(server)
+    print('\n  Сервер остановлен.')
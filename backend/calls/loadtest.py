@@ -0,0 +1,114 @@
+"""
+Нагрузочная проверка сервера звонков: вебхуки должны подтверждаться быстро,
+пока идут длительные расшифровки.
+
+Против запущенного сервера:
+    python loadtest.py --url http://127.0.0.1:5173/ --call-id <mobilon_id>
+
+Без БД и внешних API (сервер поднимается в процессе, расшифровка имитируется задержкой):
+    python loadtest.py --simulate
+"""
+
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def post_webhook(url: str, n: int) -> float:
+    payload = json.dumps({
+        'from': '89990000000', 'to': '101', 'baseid': f'loadtest.{n:06d}',
+        'state': 'RINGING', 'direction': 'incoming', 'uuid': f'loadtest-{n}',
+        'time': int(time.time()), 'duration': '0',
+    }).encode('utf-8')
+    req = urllib.request.Request(url, data=payload, method='POST', headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=10) as r:
+        r.read()
+    return (time.perf_counter() - started) * 1000
+
+
+def slow_request(url: str, call_id: str, results: list):
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(f'{url}?action=transcribe&call_id={call_id}', timeout=300) as r:
+            status = r.status
+            r.read()
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception as e:
+        status = str(e)
+    results.append((status, time.perf_counter() - started))
+
+
+def run(url: str, call_id: str, slow: int, webhooks: int, concurrency: int, budget_ms: float) -> bool:
+    slow_results = []
+    slow_threads = [threading.Thread(target=slow_request, args=(url, call_id, slow_results)) for _ in range(slow)]
+    for th in slow_threads:
+        th.start()
+    time.sleep(0.5)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(lambda n: post_webhook(url, n), range(webhooks)))
+
+    p50 = statistics.median(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    busy = sum(1 for th in slow_threads if th.is_alive())
+    print(f'webhooks: {webhooks} (concurrency {concurrency}), slow requests still running: {busy}/{slow}')
+    print(f'ack latency ms: p50={p50:.1f} p95={p95:.1f} p99={p99:.1f} max={latencies[-1]:.1f}')
+    ok = p99 <= budget_ms
+    print(f'{"PASS" if ok else "FAIL"}: p99 {"<=" if ok else ">"} {budget_ms} ms')
+    for th in slow_threads:
+        th.join()
+    print(f'slow requests: {[(s, round(d, 1)) for s, d in slow_results]}')
+    return ok
+
+
+def simulate(args) -> bool:
+    import index as calls
+
+    def fake_transcribe(params):
+        time.sleep(args.slow_seconds)
+        return 200, {'transcript': '', 'structured': [], 'cached': False}
+
+    def fake_save(data):
+        time.sleep(0.005)
+
+    calls.handle_transcribe = fake_transcribe
+    calls.save_webhook_to_db = fake_save
+    calls.TRANSCRIBERS.start = lambda: None
+    server = calls.serve(0)
+    port = server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        return run(f'http://127.0.0.1:{port}/', 'simulated', args.slow, args.webhooks, args.concurrency, args.budget_ms)
+    finally:
+        server.shutdown()
+        calls.shutdown_gracefully(server)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5173/')
+    parser.add_argument('--call-id', default='')
+    parser.add_argument('--slow', type=int, default=8, help='одновременных расшифровок')
+    parser.add_argument('--slow-seconds', type=float, default=5, help='длительность имитируемой расшифровки')
+    parser.add_argument('--webhooks', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, default=50)
+    parser.add_argument('--simulate', action='store_true')
+    args = parser.parse_args()
+
+    if args.simulate:
+        passed = simulate(args)
+    else:
+        if not args.call_id:
+            parser.error('--call-id is required without --simulate')
+        passed = run(args.url, args.call_id, args.slow, args.webhooks, args.concurrency, args.budget_ms)
+    raise SystemExit(0 if passed else 1)
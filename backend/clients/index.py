@@ -1,14 +1,16 @@
 """API для управления клиентами и их автомобилями"""
+import hashlib
 import json
 import os
 import re
+import time
 import psycopg2
 import psycopg2.extras
 
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
     'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-    'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token, X-Session-Id',
+    'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token, X-Session-Id, If-None-Match',
     'Access-Control-Max-Age': '86400',
 }
 
@@ -31,40 +33,104 @@ def response(status_code, body):
     }
 
 
-def get_clients():
+CLIENTS_PAGE_DEFAULT = 50
+CLIENTS_PAGE_MAX = 200
+
+
+def format_client(c, cars):
+    return {
+        'id': c['id'],
+        'name': c['name'],
+        'phone': c['phone'],
+        'email': c['email'] or '',
+        'inn': c['inn'] or '',
+        'comment': c['comment'] or '',
+        'created_at': str(c['created_at']),
+        'cars': [format_car(car) for car in cars],
+    }
+
+
+def cars_by_client(cur, client_ids):
+    """Активные автомобили клиентов одним запросом, сгруппированные по client_id (None — все клиенты)"""
+    grouped = {}
+    if client_ids is None:
+        cur.execute(f"SELECT * FROM {t('cars')} WHERE is_active = TRUE ORDER BY created_at DESC")
+    elif client_ids:
+        cur.execute(
+            f"SELECT * FROM {t('cars')} WHERE client_id = ANY(%s) AND is_active = TRUE ORDER BY created_at DESC",
+            (list(client_ids),),
+        )
+    else:
+        return grouped
+    for car in cur.fetchall():
+        grouped.setdefault(car['client_id'], []).append(car)
+    return grouped
+
+
+def get_clients(qs):
+    """Справочник клиентов. Без параметров — полный список; с q/limit/cursor/fields — страница по id (keyset)"""
+    paged = any(qs.get(k) for k in ('q', 'limit', 'cursor', 'fields'))
+    short = qs.get('fields') == 'short'
+    q = (qs.get('q') or '').strip()
+
+    where = []
+    vals = []
+    if q:
+        # Каждая ветка объединения покрывается своим триграммным индексом
+        branches = [f"SELECT id FROM {t('clients')} WHERE name ILIKE %s"]
+        vals.append(f"%{q}%")
+        digits = re.sub(r'\D', '', q)
+        if len(digits) >= 3:
+            branches.append(f"SELECT id FROM {t('clients')} WHERE phone_key LIKE %s")
+            vals.append(f"%{digits[-10:]}%")
+        car_q = re.sub(r'\s', '', q).upper()
+        if len(car_q) >= 3:
+            branches.append(f"SELECT client_id FROM {t('cars')} WHERE is_active = TRUE AND (vin LIKE %s OR license_plate LIKE %s)")
+            vals.extend([f"%{car_q}%", f"%{car_q}%"])
+        where.append(f"cl.id IN ({' UNION '.join(branches)})")
+
+    limit = None
+    if paged:
+        try:
+            limit = min(CLIENTS_PAGE_MAX, max(1, int(qs.get('limit') or CLIENTS_PAGE_DEFAULT)))
+        except ValueError:
+            limit = CLIENTS_PAGE_DEFAULT
+        if qs.get('cursor'):
+            try:
+                cursor_id = int(qs['cursor'])
+            except ValueError:
+                return response(400, {'error': 'cursor must be an integer'})
+            where.append("cl.id < %s")
+            vals.append(cursor_id)
+
+    columns = "cl.id, cl.name, cl.phone" if short else "cl.*"
+    w = (" WHERE " + " AND ".join(where)) if where else ""
+    if paged:
+        sql = f"SELECT {columns} FROM {t('clients')} cl{w} ORDER BY cl.id DESC LIMIT %s"
+        vals.append(limit + 1)
+    else:
+        sql = f"SELECT {columns} FROM {t('clients')} cl{w} ORDER BY cl.created_at DESC"
+
     conn = get_conn()
     try:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute(f"SELECT * FROM {t('clients')} ORDER BY created_at DESC")
+            cur.execute(sql, vals)
             clients = cur.fetchall()
 
-            cur.execute(f"SELECT * FROM {t('cars')} WHERE is_active = TRUE ORDER BY created_at DESC")
-            cars = cur.fetchall()
-
-            clients_list = []
-            for c in clients:
-                c_cars = [car for car in cars if car['client_id'] == c['id']]
-                clients_list.append({
-                    'id': c['id'],
-                    'name': c['name'],
-                    'phone': c['phone'],
-                    'email': c['email'] or '',
-                    'inn': c['inn'] or '',
-                    'comment': c['comment'] or '',
-                    'created_at': str(c['created_at']),
-                    'cars': [
-                        {
-                            'id': car['id'],
-                            'brand': car['brand'],
-                            'model': car['model'],
-                            'year': car['year'] or '',
-                            'vin': car['vin'] or '',
-                            'license_plate': car['license_plate'] or '',
-                        }
-                        for car in c_cars
-                    ],
-                })
-            return response(200, {'clients': clients_list})
+            next_cursor = None
+            if paged and len(clients) > limit:
+                clients = clients[:limit]
+                next_cursor = clients[-1]['id']
+
+            if short:
+                clients_list = [{'id': c['id'], 'name': c['name'], 'phone': c['phone']} for c in clients]
+            else:
+                cars = cars_by_client(cur, [c['id'] for c in clients] if paged else None)
+                clients_list = [format_client(c, cars.get(c['id'], [])) for c in clients]
+
+            if not paged:
+                return response(200, {'clients': clients_list})
+            return response(200, {'clients': clients_list, 'next_cursor': next_cursor})
     finally:
         conn.close()
 
@@ -80,6 +146,107 @@ def normalize_phone(phone):
     return f"+7 ({digits[1:4]}) {digits[4:7]}-{digits[7:9]}-{digits[9:11]}"
 
 
+def phone_key(phone):
+    """Ключ телефона — последние 10 цифр, как в колонке phone_key"""
+    return re.sub(r'\D', '', phone or '')[-10:]
+
+
+DUPLICATES_BATCH_MAX = 1000
+
+
+def find_duplicates(cur, candidates):
+    """Дубли для списка кандидатов: телефон, имя, VIN и госномер — по одному индексному запросу на признак"""
+    keys = {phone_key(c['phone']) for c in candidates} - {''}
+    names = {c['name'].lower() for c in candidates if c['name']}
+    vins = {c['vin'] for c in candidates if c['vin']}
+    plates = {c['license_plate'] for c in candidates if c['license_plate']}
+
+    by_key = {}
+    if keys:
+        cur.execute(f"SELECT id, name, phone, phone_key FROM {t('clients')} WHERE phone_key = ANY(%s) ORDER BY id", (list(keys),))
+        for c in cur.fetchall():
+            by_key.setdefault(c['phone_key'], []).append(c)
+
+    by_name = {}
+    if names:
+        cur.execute(f"SELECT id, name, phone, lower(name) AS name_lower FROM {t('clients')} WHERE lower(name) = ANY(%s) ORDER BY id", (list(names),))
+        for c in cur.fetchall():
+            by_name.setdefault(c['name_lower'], []).append(c)
+
+    by_vin = {}
+    if vins:
+        cur.execute(
+            f"SELECT ca.vin, cl.id as client_id, cl.name as client_name, cl.phone as client_phone FROM {t('cars')} ca JOIN {t('clients')} cl ON cl.id = ca.client_id WHERE ca.vin = ANY(%s) AND ca.vin != '' AND ca.is_active = TRUE ORDER BY ca.id",
+            (list(vins),)
+        )
+        for row in cur.fetchall():
+            by_vin.setdefault(row['vin'], row)
+
+    by_plate = {}
+    if plates:
+        cur.execute(
+            f"SELECT ca.license_plate, cl.id as client_id, cl.name as client_name, cl.phone as client_phone FROM {t('cars')} ca JOIN {t('clients')} cl ON cl.id = ca.client_id WHERE ca.license_plate = ANY(%s) AND ca.license_plate != '' AND ca.is_active = TRUE ORDER BY ca.id",
+            (list(plates),)
+        )
+        for row in cur.fetchall():
+            by_plate.setdefault(row['license_plate'], row)
+
+    result = []
+    for cand in candidates:
+        duplicates = []
+        phone_ids = set()
+        for c in by_key.get(phone_key(cand['phone']), []):
+            phone_ids.add(c['id'])
+            duplicates.append({'field': 'phone', 'client_id': c['id'], 'client_name': c['name'], 'client_phone': c['phone']})
+        for c in by_name.get(cand['name'].lower(), []):
+            if c['id'] not in phone_ids:
+                duplicates.append({'field': 'name', 'client_id': c['id'], 'client_name': c['name'], 'client_phone': c['phone']})
+        vin_match = by_vin.get(cand['vin']) if cand['vin'] else None
+        if vin_match:
+            duplicates.append({'field': 'vin', 'client_id': vin_match['client_id'], 'client_name': vin_match['client_name'], 'client_phone': vin_match['client_phone'], 'vin': vin_match['vin']})
+        plate_match = by_plate.get(cand['license_plate']) if cand['license_plate'] else None
+        if plate_match:
+            duplicates.append({'field': 'license_plate', 'client_id': plate_match['client_id'], 'client_name': plate_match['client_name'], 'client_phone': plate_match['client_phone'], 'license_plate': plate_match['license_plate']})
+        result.append(duplicates)
+    return result
+
+
+def check_duplicates(data):
+    """Пакетная проверка кандидатов (для импорта): для каждого — тот же список duplicates, что и в create_client"""
+    items = data.get('candidates') or []
+    if not isinstance(items, list) or not items:
+        return response(400, {'error': 'candidates is required'})
+    if len(items) > DUPLICATES_BATCH_MAX:
+        return response(400, {'error': f'Не более {DUPLICATES_BATCH_MAX} кандидатов за запрос'})
+
+    candidates = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('car') or {}, dict):
+            return response(400, {'error': f'candidates[{i}] должен быть объектом'})
+        car = item.get('car') or {}
+        vin = str(item.get('vin') or car.get('vin') or '').strip().upper()
+        candidates.append({
+            'name': str(item.get('name') or '').strip(),
+            'phone': normalize_phone(str(item.get('phone') or '').strip()),
+            'vin': vin if len(vin) == 17 else '',
+            'license_plate': str(item.get('license_plate') or car.get('license_plate') or '').strip().upper(),
+        })
+
+    conn = get_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            found = find_duplicates(cur, candidates)
+        return response(200, {
+            'results': [
+                {'index': i, 'name': cand['name'], 'phone': cand['phone'], 'duplicates': dups}
+                for i, (cand, dups) in enumerate(zip(candidates, found))
+            ],
+            'duplicates_count': sum(1 for dups in found if dups),
+        })
+    finally:
+        conn.close()
+
+
 def format_car(car):
     return {
         'id': car['id'],
@@ -115,35 +282,7 @@ def create_client(data):
     try:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
             if not force:
-                duplicates = []
-                phone_digits = re.sub(r'\D', '', phone)
-
-                cur.execute(f"SELECT id, name, phone FROM {t('clients')} ORDER BY id")
-                all_clients = cur.fetchall()
-                for c in all_clients:
-                    c_digits = re.sub(r'\D', '', c['phone'])
-                    if c_digits == phone_digits:
-                        duplicates.append({'field': 'phone', 'client_id': c['id'], 'client_name': c['name'], 'client_phone': c['phone']})
-                    elif c['name'].lower() == name.lower():
-                        duplicates.append({'field': 'name', 'client_id': c['id'], 'client_name': c['name'], 'client_phone': c['phone']})
-
-                if vin:
-                    cur.execute(
-                        f"SELECT ca.id, ca.vin, cl.id as client_id, cl.name as client_name, cl.phone as client_phone FROM {t('cars')} ca JOIN {t('clients')} cl ON cl.id = ca.client_id WHERE ca.vin = %s AND ca.is_active = TRUE",
-                        (vin,)
-                    )
-                    vin_match = cur.fetchone()
-                    if vin_match:
-                        duplicates.append({'field': 'vin', 'client_id': vin_match['client_id'], 'client_name': vin_match['client_name'], 'client_phone': vin_match['client_phone'], 'vin': vin_match['vin']})
-
-                if license_plate:
-                    cur.execute(
-                        f"SELECT ca.id, ca.license_plate, cl.id as client_id, cl.name as client_name, cl.phone as client_phone FROM {t('cars')} ca JOIN {t('clients')} cl ON cl.id = ca.client_id WHERE ca.license_plate = %s AND ca.is_active = TRUE",
-                        (license_plate,)
-                    )
-                    plate_match = cur.fetchone()
-                    if plate_match:
-                        duplicates.append({'field': 'license_plate', 'client_id': plate_match['client_id'], 'client_name': plate_match['client_name'], 'client_phone': plate_match['client_phone'], 'license_plate': plate_match['license_plate']})
+                duplicates = find_duplicates(cur, [{'name': name, 'phone': phone, 'vin': vin, 'license_plate': license_plate}])[0]
 
                 if duplicates:
                     return response(409, {'error': 'duplicate', 'duplicates': duplicates})
@@ -336,6 +475,492 @@ def delete_client(data):
         conn.close()
 
 
+CARD_CALLS_LIMIT = 20
+CARD_ORDERS_LIMIT = 50
+
+# ЗН клиента с суммами: по client_id, старые ЗН без client_id — по имени
+CARD_WORK_ORDERS_SQL = """
+    SELECT wo.id, wo.status, wo.created_at, wo.car_info, wo.master,
+           COALESCE(w.total, 0) as works_total,
+           COALESCE(pt.total, 0) as parts_total,
+           COALESCE(pay.total, 0) as paid,
+           COALESCE(inc.total, 0) as incomes_total
+    FROM {work_orders} wo
+    LEFT JOIN LATERAL (SELECT SUM(price * qty) as total FROM {works} WHERE work_order_id = wo.id) w ON TRUE
+    LEFT JOIN LATERAL (SELECT SUM(sell_price * qty) as total FROM {parts} WHERE work_order_id = wo.id) pt ON TRUE
+    LEFT JOIN LATERAL (SELECT SUM(amount) as total FROM {payments} WHERE work_order_id = wo.id) pay ON TRUE
+    LEFT JOIN LATERAL (SELECT SUM(amount) as total FROM {incomes} WHERE work_order_id = wo.id) inc ON TRUE
+    WHERE wo.client_id = %(client_id)s
+       OR (wo.client_id IS NULL AND lower(wo.client_name) = lower(%(name)s))
+    ORDER BY wo.created_at DESC
+"""
+
+
+def get_client_card(qs, headers):
+    """Карточка клиента 360: клиент, авто, ЗН с суммами и долгом, платежи, заявки и последние звонки.
+    Фиксированный набор индексных запросов в одном подключении; ETag по содержимому."""
+    client_id = qs.get('client_id')
+    if not client_id:
+        return response(400, {'error': 'client_id is required'})
+    cid = int(client_id)
+
+    conn = get_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(f"SELECT * FROM {t('clients')} WHERE id = %s", (cid,))
+            client = cur.fetchone()
+            if not client:
+                return response(404, {'error': 'Client not found'})
+
+            cars = cars_by_client(cur, [cid]).get(cid, [])
+
+            cur.execute(
+                CARD_WORK_ORDERS_SQL.format(
+                    work_orders=t('work_orders'), works=t('work_order_works'), parts=t('work_order_parts'),
+                    payments=t('payments'), incomes=t('incomes'),
+                ),
+                {'client_id': cid, 'name': client['name']},
+            )
+            work_orders = []
+            debt_total = 0.0
+            turnover = 0.0
+            for wo in cur.fetchall():
+                order_total = float(wo['works_total']) + float(wo['parts_total'])
+                paid = float(wo['paid'])
+                # Как в финансах: если платежей нет, оплатой считаются приходы по ЗН
+                effective_paid = paid if paid > 0 else float(wo['incomes_total'])
+                debt = max(0.0, order_total - effective_paid) if wo['status'] != 'cancelled' else 0.0
+                debt_total += debt
+                if wo['status'] != 'cancelled':
+                    turnover += order_total
+                work_orders.append({
+                    'id': wo['id'],
+                    'number': f"Н-{wo['id']:04d}",
+                    'status': wo['status'],
+                    'created_at': str(wo['created_at']),
+                    'car_info': wo['car_info'] or '',
+                    'master': wo['master'] or '',
+                    'order_total': round(order_total, 2),
+                    'paid': round(effective_paid, 2),
+                    'debt': round(debt, 2),
+                })
+
+            payments = []
+            wo_ids = [wo['id'] for wo in work_orders]
+            if wo_ids:
+                cur.execute(
+                    f"""SELECT p.id, p.work_order_id, p.amount, p.payment_method, p.comment, p.created_at,
+                               c.name as cashbox_name
+                        FROM {t('payments')} p
+                        LEFT JOIN {t('cashboxes')} c ON c.id = p.cashbox_id
+                        WHERE p.work_order_id = ANY(%s)
+                        ORDER BY p.created_at DESC""",
+                    (wo_ids,),
+                )
+                payments = [dict(r) for r in cur.fetchall()]
+
+            key = client['phone_key']
+            cur.execute(
+                f"""SELECT id, status, service, car_info, source, comment, created_at
+                    FROM {t('orders')}
+                    WHERE client_id = %s OR (%s::varchar IS NOT NULL AND phone_key = %s)
+                    ORDER BY created_at DESC
+                    LIMIT %s""",
+                (cid, key, key, CARD_ORDERS_LIMIT),
+            )
+            orders = [dict(r) for r in cur.fetchall()]
+
+            calls = []
+            if key:
+                cur.execute(
+                    f"""SELECT c.mobilon_id, c.direction, c.duration, c.started_at, c.transcript_status
+                        FROM {t('calls')} c
+                        WHERE c.phone_key = %s
+                        ORDER BY c.started_at DESC
+                        LIMIT %s""",
+                    (key, CARD_CALLS_LIMIT),
+                )
+                calls = [dict(r) for r in cur.fetchall()]
+    finally:
+        conn.close()
+
+    body = {
+        'client': format_client(client, cars),
+        'work_orders': work_orders,
+        'payments': payments,
+        'orders': orders,
+        'calls': calls,
+        'totals': {
+            'work_orders': len(work_orders),
+            'turnover': round(turnover, 2),
+            'paid': round(sum(float(p['amount']) for p in payments), 2),
+            'debt': round(debt_total, 2),
+        },
+    }
+    payload = json.dumps(body, default=str, ensure_ascii=False)
+    etag = '"' + hashlib.sha1(payload.encode('utf-8')).hexdigest() + '"'
+    cache_headers = {'ETag': etag, 'Cache-Control': 'private, no-cache', 'Access-Control-Expose-Headers': 'ETag'}
+    if_none_match = {k.lower(): v for k, v in (headers or {}).items()}.get('if-none-match')
+    if if_none_match == etag:
+        return {'statusCode': 304, 'headers': {**CORS_HEADERS, **cache_headers}, 'body': ''}
+    return {
+        'statusCode': 200,
+        'headers': {**CORS_HEADERS, 'Content-Type': 'application/json', **cache_headers},
+        'body': payload,
+    }
+
+
+DUPLICATE_JOB_BATCH = 5000
+DUPLICATE_JOB_TIME_BUDGET = 20
+DUPLICATE_BLOCK_MAX = 50
+DUPLICATE_NAME_SIMILARITY = 0.8
+
+# Пары-кандидаты для пачки клиентов (a.id в диапазоне) по ключам блокировки.
+# Каждая пара ищется индексом со стороны меньшего id; слишком большие блоки (общий номер, мусорный ИНН) пропускаются
+DUPLICATE_PAIRS_SQL = """
+    INSERT INTO {pairs} (run_id, client_id, other_client_id, reasons)
+    SELECT %(run_id)s, client_id, other_client_id, array_agg(DISTINCT reason ORDER BY reason)
+    FROM (
+        SELECT a.id as client_id, b.id as other_client_id, 'phone' as reason
+        FROM {clients} a
+        JOIN {clients} b ON b.phone_key = a.phone_key AND b.id > a.id
+        WHERE a.id > %(from_id)s AND a.id <= %(to_id)s AND a.phone_key IS NOT NULL
+          AND (SELECT COUNT(*) FROM {clients} x WHERE x.phone_key = a.phone_key) <= %(block_max)s
+        UNION ALL
+        SELECT a.id, b.id, 'inn'
+        FROM {clients} a
+        JOIN {clients} b ON b.inn = a.inn AND b.id > a.id AND b.inn != ''
+        WHERE a.id > %(from_id)s AND a.id <= %(to_id)s AND a.inn != ''
+          AND (SELECT COUNT(*) FROM {clients} x WHERE x.inn = a.inn) <= %(block_max)s
+        UNION ALL
+        SELECT DISTINCT ca.client_id, cb.client_id, 'vin'
+        FROM {cars} ca
+        JOIN {cars} cb ON cb.vin = ca.vin AND cb.client_id > ca.client_id AND cb.vin != '' AND cb.is_active = TRUE
+        WHERE ca.client_id > %(from_id)s AND ca.client_id <= %(to_id)s AND ca.vin != '' AND ca.is_active = TRUE
+          AND (SELECT COUNT(*) FROM {cars} x WHERE x.vin = ca.vin AND x.is_active = TRUE) <= %(block_max)s
+        UNION ALL
+        SELECT a.id, b.id, 'name'
+        FROM {clients} a
+        CROSS JOIN LATERAL (
+            SELECT array_agg(x.id) as ids
+            FROM (
+                SELECT x.id FROM {clients} x
+                WHERE x.name %% a.name
+                LIMIT %(block_max)s + 1
+            ) x
+        ) blk
+        CROSS JOIN LATERAL unnest(blk.ids) b(id)
+        WHERE a.id > %(from_id)s AND a.id <= %(to_id)s AND a.name != ''
+          AND cardinality(blk.ids) <= %(block_max)s AND b.id > a.id
+    ) found
+    GROUP BY client_id, other_client_id
+    ON CONFLICT DO NOTHING
+"""
+
+
+def find_duplicates_job(data):
+    """Фоновый поиск дублей: обрабатывает клиентов пачками по id, пока не исчерпан бюджет времени.
+    Незавершённый запуск продолжается следующим вызовом; restart=true начинает новый."""
+    deadline = time.monotonic() + DUPLICATE_JOB_TIME_BUDGET
+    conn = get_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute("SELECT pg_try_advisory_lock(hashtext('client_duplicate_job')) as locked")
+            if not cur.fetchone()['locked']:
+                return response(409, {'error': 'Поиск дублей уже выполняется'})
+
+            run = None
+            if not data.get('restart'):
+                cur.execute(f"SELECT * FROM {t('client_duplicate_runs')} WHERE status = 'running' ORDER BY id DESC LIMIT 1")
+                run = cur.fetchone()
+            if run is None:
+                cur.execute(f"UPDATE {t('client_duplicate_runs')} SET status = 'cancelled', finished_at = NOW() WHERE status = 'running'")
+                cur.execute(
+                    f"""INSERT INTO {t('client_duplicate_runs')} (max_client_id)
+                       SELECT COALESCE(MAX(id), 0) FROM {t('clients')} RETURNING *"""
+                )
+                run = cur.fetchone()
+                conn.commit()
+
+            sql = DUPLICATE_PAIRS_SQL.format(pairs=t('client_duplicate_pairs'), clients=t('clients'), cars=t('cars'))
+            last_id = run['last_client_id']
+            while last_id < run['max_client_id'] and time.monotonic() < deadline:
+                to_id = min(last_id + DUPLICATE_JOB_BATCH, run['max_client_id'])
+                cur.execute("SET LOCAL pg_trgm.similarity_threshold = %s", (DUPLICATE_NAME_SIMILARITY,))
+                cur.execute(sql, {'run_id': run['id'], 'from_id': last_id, 'to_id': to_id, 'block_max': DUPLICATE_BLOCK_MAX})
+                found = cur.rowcount
+                cur.execute(
+                    f"UPDATE {t('client_duplicate_runs')} SET last_client_id = %s, pairs_found = pairs_found + %s WHERE id = %s",
+                    (to_id, found, run['id']),
+                )
+                conn.commit()
+                last_id = to_id
+
+            if last_id >= run['max_client_id']:
+                cur.execute(
+                    f"UPDATE {t('client_duplicate_runs')} SET status = 'done', finished_at = NOW() WHERE id = %s AND status = 'running'",
+                    (run['id'],),
+                )
+                conn.commit()
+
+            cur.execute(f"SELECT * FROM {t('client_duplicate_runs')} WHERE id = %s", (run['id'],))
+            run = cur.fetchone()
+            cur.execute("SELECT pg_advisory_unlock(hashtext('client_duplicate_job'))")
+            return response(200, {'run': dict(run), 'done': run['status'] == 'done'})
+    finally:
+        conn.close()
+
+
+def get_duplicate_clusters(qs):
+    """Кластеры дублей из последнего завершённого запуска (связные компоненты по найденным парам)"""
+    conn = get_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(f"SELECT * FROM {t('client_duplicate_runs')} WHERE status = 'done' ORDER BY id DESC LIMIT 1")
+            run = cur.fetchone()
+            if not run:
+                return response(200, {'run': None, 'clusters': []})
+
+            # Уже объединённые (удалённые) клиенты отсекаются соединением с clients
+            cur.execute(f"""
+                SELECT p.client_id, p.other_client_id, p.reasons
+                FROM {t('client_duplicate_pairs')} p
+                JOIN {t('clients')} a ON a.id = p.client_id
+                JOIN {t('clients')} b ON b.id = p.other_client_id
+                WHERE p.run_id = %s
+            """, (run['id'],))
+            pairs = cur.fetchall()
+
+            parent = {}
+
+            def find(x):
+                while parent.setdefault(x, x) != x:
+                    parent[x] = parent[parent[x]]
+                    x = parent[x]
+                return x
+
+            for p in pairs:
+                ra, rb = find(p['client_id']), find(p['other_client_id'])
+                if ra != rb:
+                    parent[max(ra, rb)] = min(ra, rb)
+
+            groups = {}
+            for cid in parent:
+                groups.setdefault(find(cid), set()).add(cid)
+
+            reason = qs.get('reason')
+            reasons_by_root = {}
+            for p in pairs:
+                reasons_by_root.setdefault(find(p['client_id']), set()).update(p['reasons'])
+
+            all_ids = [cid for ids in groups.values() for cid in ids]
+            clients = {}
+            if all_ids:
+                cur.execute(f"SELECT id, name, phone, inn, email, created_at FROM {t('clients')} WHERE id = ANY(%s)", (all_ids,))
+                clients = {c['id']: c for c in cur.fetchall()}
+
+            clusters = []
+            for root, ids in groups.items():
+                reasons = sorted(reasons_by_root.get(root, set()))
+                if reason and reason not in reasons:
+                    continue
+                clusters.append({
+                    'client_ids': sorted(ids),
+                    'reasons': reasons,
+                    'clients': [
+                        {
+                            'id': clients[cid]['id'],
+                            'name': clients[cid]['name'],
+                            'phone': clients[cid]['phone'],
+                            'inn': clients[cid]['inn'] or '',
+                            'email': clients[cid]['email'] or '',
+                            'created_at': str(clients[cid]['created_at']),
+                        }
+                        for cid in sorted(ids) if cid in clients
+                    ],
+                })
+            clusters.sort(key=lambda c: (-len(c['client_ids']), c['client_ids'][0]))
+            return response(200, {'run': dict(run), 'clusters': clusters})
+    finally:
+        conn.close()
+
+
+def merge_clients(data):
+    """Объединение дублей в одного клиента: все ссылки переносятся на target_id, дубли удаляются — в одной транзакции.
+    Платежи привязаны к ЗН, звонки — к телефону, поэтому переносятся вместе с ЗН и телефоном клиента."""
+    target_id = data.get('target_id')
+    source_ids = data.get('source_ids') or []
+    if not target_id or not source_ids:
+        return response(400, {'error': 'target_id and source_ids are required'})
+    target_id = int(target_id)
+    source_ids = sorted({int(x) for x in source_ids} - {target_id})
+    if not source_ids:
+        return response(400, {'error': 'source_ids must differ from target_id'})
+
+    conn = get_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(
+                f"SELECT * FROM {t('clients')} WHERE id = ANY(%s) ORDER BY id FOR UPDATE",
+                ([target_id] + source_ids,),
+            )
+            rows = {c['id']: c for c in cur.fetchall()}
+            target = rows.get(target_id)
+            if not target:
+                return response(404, {'error': 'Client not found'})
+            missing = [cid for cid in source_ids if cid not in rows]
+            if missing:
+                return response(404, {'error': f'Clients not found: {missing}'})
+            sources = [rows[cid] for cid in source_ids]
+
+            moved = {}
+            cur.execute(f"UPDATE {t('cars')} SET client_id = %s WHERE client_id = ANY(%s)", (target_id, source_ids))
+            moved['cars'] = cur.rowcount
+            cur.execute(
+                f"UPDATE {t('work_orders')} SET client_id = %s, client_name = %s, client_phone = %s WHERE client_id = ANY(%s)",
+                (target_id, target['name'], target['phone'], source_ids),
+            )
+            moved['work_orders'] = cur.rowcount
+            cur.execute(
+                f"UPDATE {t('work_orders')} SET payer_client_id = %s, payer_name = %s WHERE payer_client_id = ANY(%s)",
+                (target_id, target['name'], source_ids),
+            )
+            moved['work_orders_payer'] = cur.rowcount
+            cur.execute(f"UPDATE {t('orders')} SET client_id = %s WHERE client_id = ANY(%s)", (target_id, source_ids))
+            moved['orders'] = cur.rowcount
+            cur.execute(f"UPDATE {t('incomes')} SET client_id = %s WHERE client_id = ANY(%s)", (target_id, source_ids))
+            moved['incomes'] = cur.rowcount
+            cur.execute(f"UPDATE {t('expenses')} SET client_id = %s WHERE client_id = ANY(%s)", (target_id, source_ids))
+            moved['expenses'] = cur.rowcount
+            cur.execute(f"UPDATE {t('calls')} SET client_id = %s WHERE client_id = ANY(%s)", (target_id, source_ids))
+            moved['calls'] = cur.rowcount
+
+            # Пустые реквизиты берутся у дублей; их телефоны сохраняются в комментарии для истории звонков
+            email = target['email'] or next((c['email'] for c in sources if c['email']), '')
+            inn = target['inn'] or next((c['inn'] for c in sources if c['inn']), '')
+            notes = [
+                f"Объединён с #{c['id']} {c['name']} {c['phone']}".strip()
+                for c in sources
+            ]
+            comment = '\n'.join([x for x in [target['comment'] or ''] + notes if x])
+            cur.execute(
+                f"UPDATE {t('clients')} SET email = %s, inn = %s, comment = %s WHERE id = %s RETURNING *",
+                (email, inn, comment, target_id),
+            )
+            client = cur.fetchone()
+
+            cur.execute(
+                f"DELETE FROM {t('client_duplicate_pairs')} WHERE client_id = ANY(%s) OR other_client_id = ANY(%s)",
+                (source_ids, source_ids),
+            )
+            cur.execute(f"DELETE FROM {t('clients')} WHERE id = ANY(%s)", (source_ids,))
+
+            conn.commit()
+            return response(200, {
+                'client': format_client(client, cars_by_client(cur, [target_id]).get(target_id, [])),
+                'merged_ids': source_ids,
+                'moved': moved,
+            })
+    finally:
+        conn.close()
+
+
+CHANGES_BATCH = 500
+CHANGE_LOG_RETENTION_DAYS = 30
+CHANGE_LOG_PRUNE_EVERY = 300
+CHANGE_LOG_PRUNE_BATCH = 10000
+
+
+def prune_change_log(cur):
+    """Удаляет записи change_log старше CHANGE_LOG_RETENTION_DAYS — не чаще раза в CHANGE_LOG_PRUNE_EVERY секунд
+    и не больше CHANGE_LOG_PRUNE_BATCH за раз — и сдвигает горизонт хранения на наибольший удалённый txid"""
+    cur.execute(
+        f"""WITH gone AS (
+                DELETE FROM {t('change_log')}
+                WHERE id IN (
+                    SELECT id FROM {t('change_log')}
+                    WHERE changed_at < NOW() - %(days)s * INTERVAL '1 day'
+                      AND EXISTS (SELECT 1 FROM {t('change_log_retention')}
+                                  WHERE id = 1 AND pruned_at < NOW() - %(every)s * INTERVAL '1 second')
+                    ORDER BY id
+                    LIMIT %(batch)s
+                )
+                RETURNING txid
+            )
+            UPDATE {t('change_log_retention')}
+            SET pruned_at = NOW(), pruned_txid = GREATEST(pruned_txid, COALESCE((SELECT MAX(txid) FROM gone), 0))
+            WHERE id = 1 AND pruned_at < NOW() - %(every)s * INTERVAL '1 second'""",
+        {'days': CHANGE_LOG_RETENTION_DAYS, 'every': CHANGE_LOG_PRUNE_EVERY, 'batch': CHANGE_LOG_PRUNE_BATCH},
+    )
+
+
+def read_changes(cur, entity, since):
+    """Изменения сущности из change_log после курсора "txid.id".
+    Отдаются только транзакции младше горизонта xmin — они уже завершены, поэтому курсор ничего не пропускает.
+    Возвращает ({entity_id: последняя операция}, новый курсор, есть ли ещё); ops=None — курсор попадает
+    в уже удалённую часть change_log (см. prune_change_log), нужна полная перезагрузка.
+    Некорректный курсор — ValueError."""
+    cur.execute(
+        f"""SELECT txid_snapshot_xmin(txid_current_snapshot()) as xmin,
+                   (SELECT pruned_txid FROM {t('change_log_retention')} WHERE id = 1) as pruned_txid"""
+    )
+    row = cur.fetchone()
+    xmin = row['xmin']
+    if not since:
+        return {}, f"{xmin}.0", False
+    txid_part, _, id_part = since.partition('.')
+    if not (txid_part.isdigit() and id_part.isdigit() and len(txid_part) <= 18 and len(id_part) <= 18):
+        raise ValueError(f'invalid cursor: {since}')
+    since_txid, since_id = int(txid_part), int(id_part)
+    if row['pruned_txid'] and since_txid <= row['pruned_txid']:
+        return None, f"{xmin}.0", False
+    cur.execute(
+        f"""SELECT id, entity_id, op, txid FROM {t('change_log')}
+            WHERE entity = %s AND (txid, id) >= (%s, %s) AND txid < %s
+            ORDER BY txid, id
+            LIMIT %s""",
+        (entity, since_txid, since_id, xmin, CHANGES_BATCH + 1),
+    )
+    rows = cur.fetchall()
+    has_more = len(rows) > CHANGES_BATCH
+    rows = rows[:CHANGES_BATCH]
+    ops = {}
+    for r in rows:
+        ops[r['entity_id']] = r['op']
+    if has_more:
+        cursor = f"{rows[-1]['txid']}.{rows[-1]['id'] + 1}"
+    else:
+        cursor = f"{max(xmin, since_txid)}.{0 if xmin > since_txid else since_id}"
+    return ops, cursor, has_more
+
+
+def get_client_changes(qs):
+    """Лента изменений клиентов (в т.ч. их автомобилей): изменённые клиенты и id удалённых"""
+    conn = get_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            prune_change_log(cur)
+            conn.commit()
+            try:
+                ops, cursor, has_more = read_changes(cur, 'client', qs.get('since'))
+            except ValueError:
+                return response(400, {'error': 'invalid since cursor'})
+            if ops is None:
+                return response(410, {'error': 'cursor too old, resync', 'resync': True, 'cursor': cursor})
+            changed = [cid for cid, op in ops.items() if op != 'D']
+            clients = []
+            if changed:
+                cur.execute(f"SELECT * FROM {t('clients')} WHERE id = ANY(%s) ORDER BY id", (changed,))
+                rows = cur.fetchall()
+                cars = cars_by_client(cur, [c['id'] for c in rows])
+                clients = [format_client(c, cars.get(c['id'], [])) for c in rows]
+            found = {c['id'] for c in clients}
+            deleted = sorted(cid for cid in ops if cid not in found)
+            return response(200, {'clients': clients, 'deleted': deleted, 'cursor': cursor, 'has_more': has_more})
+    finally:
+        conn.close()
+
+
 def handler(event, context):
     """API клиентов и автомобилей установочного центра"""
     if event.get('httpMethod') == 'OPTIONS':
@@ -348,7 +973,14 @@ def handler(event, context):
     method = event.get('httpMethod', 'GET')
 
     if method == 'GET':
-        return get_clients()
+        qs = event.get('queryStringParameters') or {}
+        if qs.get('section') == 'duplicates':
+            return get_duplicate_clusters(qs)
+        if qs.get('section') == 'changes':
+            return get_client_changes(qs)
+        if qs.get('section') == 'card':
+            return get_client_card(qs, event.get('headers'))
+        return get_clients(qs)
 
     if method == 'POST':
         body = json.loads(event.get('body', '{}'))
@@ -358,6 +990,12 @@ def handler(event, context):
             return create_client(body)
         elif action == 'update_client':
             return update_client(body)
+        elif action == 'check_duplicates':
+            return check_duplicates(body)
+        elif action == 'find_duplicates':
+            return find_duplicates_job(body)
+        elif action == 'merge_clients':
+            return merge_clients(body)
         elif action == 'add_car':
             return add_car(body)
         elif action == 'update_car':
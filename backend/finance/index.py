@@ -75,6 +75,53 @@ def resp(status_code, body):
     }
 
 
+# Себестоимость запчастей по заказ-нарядам: оценка списаний со склада (FIFO или скользящая средняя)
+# плюс ещё не списанное количество по закупочной цене из строки заказ-наряда
+WO_PARTS_COST_SUBQUERY = """
+    SELECT wop.work_order_id,
+           SUM(
+               COALESCE(ic.cost, 0)
+               + CASE WHEN wop.qty > 0
+                      THEN GREATEST(wop.qty - COALESCE(ic.qty, 0), 0) * wop.cost / wop.qty
+                      ELSE 0 END
+           ) as cst
+    FROM (
+        SELECT work_order_id, product_id, SUM(qty) as qty, SUM(purchase_price * qty) as cost
+        FROM {parts}
+        {parts_filter}
+        GROUP BY work_order_id, product_id
+    ) wop
+    LEFT JOIN (
+        SELECT work_order_id, product_id,
+               SUM(CASE WHEN direction = 'to_order' THEN qty ELSE -qty END) as qty,
+               SUM({cost_col}) as cost
+        FROM {issues}
+        GROUP BY work_order_id, product_id
+    ) ic ON ic.work_order_id = wop.work_order_id AND ic.product_id = wop.product_id
+    GROUP BY wop.work_order_id
+"""
+
+
+# Функция для получения метода оценки себестоимости из настроек ('fifo' или 'average')
+# Настройка inventory_cost_method общая со складом (get_cost_method в warehouse) — держать копии одинаковыми
+def get_cost_method(cur):
+    cur.execute(f"SELECT value FROM {t('system_settings')} WHERE key = 'inventory_cost_method'")
+    row = cur.fetchone()
+    method = (row['value'] if row else 'fifo') or 'fifo'
+    return method if method in ('fifo', 'average') else 'fifo'
+
+
+# Функция для подстановки подзапроса себестоимости запчастей
+# parts_filter - необязательное условие WHERE по work_order_parts
+def wo_parts_cost_subquery(method, parts_filter=''):
+    return WO_PARTS_COST_SUBQUERY.format(
+        parts=t('work_order_parts'),
+        issues=t('inventory_issue_costs'),
+        cost_col='fifo_cost' if method == 'fifo' else 'avg_cost',
+        parts_filter=parts_filter,
+    )
+
+
 # Функция для получения списка всех касс
 # conn - подключение к базе данных
 # Возвращает список касс с их балансами и общей суммой поступлений
@@ -248,7 +295,14 @@ def get_work_order_finance(conn, work_order_id):
         )
         parts_list = [dict(r) for r in cur.fetchall()]
 
-        parts_purchase_total = sum(float(p['purchase_price'] or 0) * float(p['qty']) for p in parts_list)
+        # Себестоимость по оценке склада, а не по последней закупочной цене
+        cost_method = get_cost_method(cur)
+        cur.execute(
+            wo_parts_cost_subquery(cost_method, 'WHERE work_order_id = %s'),
+            (work_order_id,),
+        )
+        cost_row = cur.fetchone()
+        parts_purchase_total = float(cost_row['cst'] or 0) if cost_row else 0.0
         parts_margin = float(parts_total) - parts_purchase_total
 
         # Платежи (поступления от клиента)
@@ -325,6 +379,7 @@ def get_work_order_finance(conn, work_order_id):
             'parts_total': parts_total,
             'parts_purchase_total': parts_purchase_total,
             'parts_margin': parts_margin,
+            'cost_method': cost_method,
             'order_total': order_total,
             'paid': paid,
             'debt': max(0, order_total - effective_paid),
@@ -1437,6 +1492,7 @@ def get_economics(conn, month_offset=0):
         parts_revenue = float(row['parts_revenue'])
 
         # Себестоимость запчастей из заказ-нарядов (пропорционально оплаченным)
+        cost_method = get_cost_method(cur)
         cur.execute(f"""
             SELECT
                 COALESCE(SUM(
@@ -1461,11 +1517,7 @@ def get_economics(conn, month_offset=0):
                 FROM {t('work_order_parts')}
                 GROUP BY work_order_id
             ) wo_pts ON wo_pts.work_order_id = p.work_order_id
-            LEFT JOIN (
-                SELECT work_order_id, SUM(purchase_price * qty) as cst
-                FROM {t('work_order_parts')}
-                GROUP BY work_order_id
-            ) wo_cost ON wo_cost.work_order_id = p.work_order_id
+            LEFT JOIN ({wo_parts_cost_subquery(cost_method)}) wo_cost ON wo_cost.work_order_id = p.work_order_id
             WHERE COALESCE(p.operation_date, p.created_at::date) >= '{month_start_str}'::date
               AND COALESCE(p.operation_date, p.created_at::date) < '{month_end_next_str}'::date
         """)
@@ -1669,6 +1721,7 @@ def get_economics(conn, month_offset=0):
             'services_revenue': round(services_revenue, 2),
             'parts_revenue': round(parts_revenue, 2),
             'parts_cost': round(parts_cost, 2),
+            'cost_method': cost_method,
             'total_revenue_orders': round(total_revenue, 2),
             'services_share': round(services_share, 1),
             'parts_share': round(parts_share, 1),
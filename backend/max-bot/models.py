@@ -306,6 +306,11 @@ def create_product_in_db(conn, name: str, sku: str = "", category: str = "",
         VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id
     """, (name, sku or "", category or "", purchase_price, quantity, unit or "шт", description or ""))
     product_id = cur.fetchone()[0]
+    if quantity:
+        cur.execute(f"""
+            INSERT INTO {t('stock_movements')} (product_id, qty, movement_type, quantity_delta, note)
+            VALUES (%s, %s, 'opening', %s, 'создан ботом')
+        """, (product_id, int(quantity), quantity))
     cur.close()
     return product_id
 
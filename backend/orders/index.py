@@ -1,4 +1,7 @@
 """API для управления заявками установочного центра"""
+import base64
+import hashlib
+import io
 import json
 import os
 import re
@@ -45,21 +48,20 @@ def normalize_phone(phone):
 
 def find_or_create_client(cur, name, phone, email='', car_data=None):
     normalized = normalize_phone(phone) if phone else ''
-    raw_digits = re.sub(r'\D', '', normalized)
-
-    if raw_digits:
-        cur.execute(f"SELECT * FROM {t('clients')} ORDER BY id")
-        clients = cur.fetchall()
-        for c in clients:
-            c_digits = re.sub(r'\D', '', c['phone'] or '')
-            if c_digits and c_digits == raw_digits:
-                if car_data and car_data.get('brand'):
-                    cur.execute(
-                        f"INSERT INTO {t('cars')} (client_id, brand, model, year, vin, license_plate) VALUES (%s, %s, %s, %s, %s, %s)",
-                        (c['id'], car_data.get('brand', ''), car_data.get('model', ''),
-                         car_data.get('year', ''), car_data.get('vin', ''), car_data.get('license_plate', '').upper()),
-                    )
-                return c['id'], normalized
+    key = re.sub(r'\D', '', normalized)[-10:]
+
+    if key:
+        # Поиск по индексируемому ключу телефона (последние 10 цифр)
+        cur.execute(f"SELECT id FROM {t('clients')} WHERE phone_key = %s ORDER BY id LIMIT 1", (key,))
+        c = cur.fetchone()
+        if c:
+            if car_data and car_data.get('brand'):
+                cur.execute(
+                    f"INSERT INTO {t('cars')} (client_id, brand, model, year, vin, license_plate) VALUES (%s, %s, %s, %s, %s, %s)",
+                    (c['id'], car_data.get('brand', ''), car_data.get('model', ''),
+                     car_data.get('year', ''), car_data.get('vin', ''), car_data.get('license_plate', '').upper()),
+                )
+            return c['id'], normalized
 
     cur.execute(
         f"INSERT INTO {t('clients')} (name, phone, email) VALUES (%s, %s, %s) RETURNING *",
@@ -77,29 +79,122 @@ def find_or_create_client(cur, name, phone, email='', car_data=None):
     return new_client['id'], normalized
 
 
+def format_order(r):
+    return {
+        'id': r['id'],
+        'number': f"З-{str(r['id']).zfill(4)}",
+        'date': r['created_at'].strftime('%d.%m.%Y') if r['created_at'] else '',
+        'client': r['client_name'],
+        'client_id': r['client_id'],
+        'phone': r['phone'] or '',
+        'car': r['car_info'] or '',
+        'service': r['service'] or '',
+        'status': r['status'],
+        'comment': r['comment'] or '',
+        'source': r['source'] or 'manual',
+        'assignee': r['assignee'] or None,
+    }
+
+
 def get_orders():
     conn = get_conn()
     try:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
             cur.execute(f"SELECT * FROM {t('orders')} ORDER BY created_at DESC")
             rows = cur.fetchall()
-            orders = []
-            for r in rows:
-                orders.append({
-                    'id': r['id'],
-                    'number': f"З-{str(r['id']).zfill(4)}",
-                    'date': r['created_at'].strftime('%d.%m.%Y') if r['created_at'] else '',
-                    'client': r['client_name'],
-                    'client_id': r['client_id'],
-                    'phone': r['phone'] or '',
-                    'car': r['car_info'] or '',
-                    'service': r['service'] or '',
-                    'status': r['status'],
-                    'comment': r['comment'] or '',
-                    'source': r['source'] or 'manual',
-                    'assignee': r['assignee'] or None,
+            return resp(200, {'orders': [format_order(r) for r in rows]})
+    finally:
+        conn.close()
+
+
+BOARD_STATUSES = ('new', 'contacted', 'approved', 'rejected')
+BOARD_DEFAULT_LIMIT = 20
+BOARD_MAX_LIMIT = 100
+
+
+def board_filters(params):
+    """Фильтры доски: source (через запятую) и assignee ('none' — без исполнителя)"""
+    where = []
+    vals = []
+    sources = [x.strip() for x in (params.get('source') or '').split(',') if x.strip()]
+    if sources:
+        where.append("COALESCE(source, 'manual') = ANY(%s)")
+        vals.append(sources)
+    assignee = (params.get('assignee') or '').strip()
+    if assignee == 'none':
+        where.append("assignee IS NULL")
+    elif assignee:
+        where.append("assignee = %s")
+        vals.append(assignee)
+    return where, vals
+
+
+def board_cursor(r):
+    return f"{r['created_at'].isoformat()}|{r['id']}"
+
+
+def get_orders_board(params):
+    """Канбан заявок: количество по статусам и первые N в каждой колонке одним запросом (оконные функции).
+    С status и cursor — следующая страница одной колонки по индексу (status, created_at, id)."""
+    try:
+        limit = min(BOARD_MAX_LIMIT, max(1, int(params.get('limit') or BOARD_DEFAULT_LIMIT)))
+    except ValueError:
+        limit = BOARD_DEFAULT_LIMIT
+    where, vals = board_filters(params)
+
+    conn = get_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            status = params.get('status')
+            if status:
+                col_where = where + ["status = %s"]
+                col_vals = vals + [status]
+                if params.get('cursor'):
+                    try:
+                        cursor_at, cursor_id = params['cursor'].rsplit('|', 1)
+                        cursor_id = int(cursor_id)
+                    except ValueError:
+                        return resp(400, {'error': 'invalid cursor'})
+                    col_where.append("(created_at, id) < (%s::timestamp, %s)")
+                    col_vals.extend([cursor_at, cursor_id])
+                cur.execute(
+                    f"""SELECT * FROM {t('orders')}
+                        WHERE {' AND '.join(col_where)}
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT %s""",
+                    col_vals + [limit + 1],
+                )
+                rows = cur.fetchall()
+                has_more = len(rows) > limit
+                rows = rows[:limit]
+                return resp(200, {
+                    'status': status,
+                    'orders': [format_order(r) for r in rows],
+                    'next_cursor': board_cursor(rows[-1]) if has_more else None,
                 })
-            return resp(200, {'orders': orders})
+
+            w = (" WHERE " + " AND ".join(where)) if where else ""
+            cur.execute(
+                f"""SELECT * FROM (
+                        SELECT o.*,
+                               row_number() OVER (PARTITION BY status ORDER BY created_at DESC, id DESC) as rn,
+                               count(*) OVER (PARTITION BY status) as status_count
+                        FROM {t('orders')} o{w}
+                    ) ranked
+                    WHERE rn <= %s
+                    ORDER BY status, rn""",
+                vals + [limit + 1],
+            )
+            columns = {st: {'count': 0, 'orders': [], 'next_cursor': None} for st in BOARD_STATUSES}
+            for r in cur.fetchall():
+                col = columns.setdefault(r['status'], {'count': 0, 'orders': [], 'next_cursor': None})
+                col['count'] = r['status_count']
+                if r['rn'] <= limit:
+                    col['orders'].append(format_order(r))
+                    last = r
+                else:
+                    col['next_cursor'] = board_cursor(last)
+            return resp(200, {'columns': columns, 'limit': limit})
     finally:
         conn.close()
 
@@ -134,20 +229,7 @@ def create_order(data):
             r = cur.fetchone()
             conn.commit()
             return resp(201, {
-                'order': {
-                    'id': r['id'],
-                    'number': f"З-{str(r['id']).zfill(4)}",
-                    'date': r['created_at'].strftime('%d.%m.%Y') if r['created_at'] else '',
-                    'client': r['client_name'],
-                    'client_id': r['client_id'],
-                    'phone': r['phone'] or '',
-                    'car': r['car_info'] or '',
-                    'service': r['service'] or '',
-                    'status': r['status'],
-                    'comment': r['comment'] or '',
-                    'source': r['source'] or 'manual',
-                    'assignee': r['assignee'] or None,
-                }
+                'order': format_order(r),
             })
     finally:
         conn.close()
@@ -170,20 +252,7 @@ def assign_order(data):
                 return resp(404, {'error': 'Order not found'})
             conn.commit()
             return resp(200, {
-                'order': {
-                    'id': r['id'],
-                    'number': f"З-{str(r['id']).zfill(4)}",
-                    'date': r['created_at'].strftime('%d.%m.%Y') if r['created_at'] else '',
-                    'client': r['client_name'],
-                    'client_id': r['client_id'],
-                    'phone': r['phone'] or '',
-                    'car': r['car_info'] or '',
-                    'service': r['service'] or '',
-                    'status': r['status'],
-                    'comment': r['comment'] or '',
-                    'source': r['source'] or 'manual',
-                    'assignee': r['assignee'] or None,
-                }
+                'order': format_order(r),
             })
     finally:
         conn.close()
@@ -290,6 +359,99 @@ def delete_order(data):
         conn.close()
 
 
+OCR_CACHE_TTL_DAYS = 30
+OCR_MAX_SIDE = 2048
+OCR_JPEG_QUALITY = 85
+EXIF_ORIENTATION = 0x0112
+
+
+def downscale_image(image_bytes, mime):
+    """Поворачивает фото по EXIF, уменьшает до OCR_MAX_SIDE по большей стороне и пережимает в JPEG,
+    если это меньше исходника или фото пришлось повернуть. Без Pillow возвращает исходные байты."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return image_bytes, mime
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        # Фото с телефона хранят поворот в EXIF — без поворота пикселей документ уйдёт в модель боком
+        rotated = img.getexif().get(EXIF_ORIENTATION, 1) != 1
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        if max(img.size) > OCR_MAX_SIDE:
+            img.thumbnail((OCR_MAX_SIDE, OCR_MAX_SIDE), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=OCR_JPEG_QUALITY, optimize=True)
+        out = buf.getvalue()
+    except Exception as e:
+        print(f'[RECOGNIZE] downscale error: {e}')
+        return image_bytes, mime
+    if rotated or len(out) < len(image_bytes):
+        return out, 'image/jpeg'
+    return image_bytes, mime
+
+
+def ocr_cache_get(cur, image_hash):
+    cur.execute(
+        f"""UPDATE {t('ocr_cache')} SET hits = hits + 1, last_hit_at = NOW()
+            WHERE image_hash = %s AND created_at > NOW() - make_interval(days => %s)
+            RETURNING recognized""",
+        (image_hash, OCR_CACHE_TTL_DAYS),
+    )
+    row = cur.fetchone()
+    return row['recognized'] if row else None
+
+
+def ocr_cache_put(cur, image_hash, recognized):
+    cur.execute(
+        f"""INSERT INTO {t('ocr_cache')} (image_hash, recognized) VALUES (%s, %s)
+            ON CONFLICT (image_hash) DO UPDATE SET recognized = EXCLUDED.recognized, created_at = NOW(), hits = 0""",
+        (image_hash, json.dumps(recognized, ensure_ascii=False)),
+    )
+
+
+def ocr_stats_add(cur, hit, bytes_in, bytes_sent=0):
+    cur.execute(
+        f"""INSERT INTO {t('ocr_cache_stats')} (day, hits, misses, bytes_in, bytes_sent)
+            VALUES (CURRENT_DATE, %s, %s, %s, %s)
+            ON CONFLICT (day) DO UPDATE SET
+                hits = {t('ocr_cache_stats')}.hits + EXCLUDED.hits,
+                misses = {t('ocr_cache_stats')}.misses + EXCLUDED.misses,
+                bytes_in = {t('ocr_cache_stats')}.bytes_in + EXCLUDED.bytes_in,
+                bytes_sent = {t('ocr_cache_stats')}.bytes_sent + EXCLUDED.bytes_sent""",
+        (1 if hit else 0, 0 if hit else 1, bytes_in, bytes_sent),
+    )
+
+
+def get_ocr_stats(params):
+    """Счётчики кэша распознавания по дням (hit rate и сэкономленный трафик)"""
+    try:
+        days = min(365, max(1, int(params.get('days') or 30)))
+    except ValueError:
+        days = 30
+    conn = get_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(
+                f"""SELECT day, hits, misses, bytes_in, bytes_sent FROM {t('ocr_cache_stats')}
+                    WHERE day > CURRENT_DATE - %s ORDER BY day DESC""",
+                (days,),
+            )
+            rows = [dict(r) for r in cur.fetchall()]
+            cur.execute(f"SELECT COUNT(*) as entries FROM {t('ocr_cache')}")
+            entries = cur.fetchone()['entries']
+        hits = sum(r['hits'] for r in rows)
+        misses = sum(r['misses'] for r in rows)
+        return resp(200, {
+            'days': rows,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / (hits + misses), 3) if hits + misses else 0,
+            'cache_entries': entries,
+        })
+    finally:
+        conn.close()
+
+
 def recognize_photo(data):
     image_b64 = data.get('image', '')
     if not image_b64:
@@ -302,6 +464,22 @@ def recognize_photo(data):
             mime = match.group(1)
             image_b64 = match.group(2)
 
+    try:
+        image_bytes = base64.b64decode(image_b64)
+    except ValueError:
+        return resp(400, {'error': 'Некорректное изображение'})
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+
+    # Повторная отправка того же фото (повторы, двойной клик) отдаётся из кэша без обращения к модели
+    cached = lookup_ocr_result(image_hash, len(image_bytes))
+    if cached is not None:
+        print(f'[RECOGNIZE] cache hit {image_hash[:12]}')
+        return resp(200, {'recognized': cached, 'cached': True})
+
+    sent_bytes, mime = downscale_image(image_bytes, mime)
+    image_b64 = base64.b64encode(sent_bytes).decode('ascii')
+    print(f'[RECOGNIZE] cache miss {image_hash[:12]}: {len(image_bytes)} -> {len(sent_bytes)} bytes')
+
     openai_key = os.environ.get('OPENAI_API_KEY', '')
     ai_client = OpenAI(api_key=openai_key, base_url='https://api.laozhang.ai/v1', timeout=30.0)
 
@@ -367,6 +545,7 @@ def recognize_photo(data):
 
     json_match = re.search(r'\{.*\}', raw, re.DOTALL)
     if not json_match:
+        record_ocr_result(image_hash, None, len(image_bytes), len(sent_bytes))
         return resp(200, {'recognized': {}, 'raw': raw})
 
     recognized = json.loads(json_match.group(0))
@@ -397,9 +576,44 @@ def recognize_photo(data):
             recognized['client_name'] = name
 
     print(f'[RECOGNIZE] cleaned: {recognized}')
+    record_ocr_result(image_hash, recognized, len(image_bytes), len(sent_bytes))
     return resp(200, {'recognized': recognized})
 
 
+def lookup_ocr_result(image_hash, bytes_in):
+    """Результат из кэша с учётом попадания; ошибка кэша не ломает распознавание — идём в модель"""
+    try:
+        conn = get_conn()
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cached = ocr_cache_get(cur, image_hash)
+                if cached is not None:
+                    ocr_stats_add(cur, True, bytes_in)
+            conn.commit()
+            return cached
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f'[RECOGNIZE] cache read error: {e}')
+        return None
+
+
+def record_ocr_result(image_hash, recognized, bytes_in, bytes_sent):
+    """Кладёт разобранный результат в кэш и учитывает промах; ошибка кэша не ломает распознавание"""
+    try:
+        conn = get_conn()
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                if recognized is not None:
+                    ocr_cache_put(cur, image_hash, recognized)
+                ocr_stats_add(cur, False, bytes_in, bytes_sent)
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        print(f'[RECOGNIZE] cache write error: {e}')
+
+
 def get_order_tasks(order_id):
     conn = get_conn()
     try:
@@ -475,6 +689,192 @@ def add_order_message(data):
         conn.close()
 
 
+BATCH_ORDERS_MAX = 500
+
+
+def parse_order_ids(raw):
+    ids = []
+    for x in str(raw or '').split(','):
+        x = x.strip()
+        if x.isdigit():
+            ids.append(int(x))
+    return sorted(set(ids))[:BATCH_ORDERS_MAX]
+
+
+def get_orders_badges(params):
+    """Задачи, непрочитанные сообщения и последнее сообщение сразу для многих заявок — одним запросом.
+    Непрочитанные считаются для user_id (чужие сообщения после отметки прочтения), без user_id — все сообщения."""
+    order_ids = parse_order_ids(params.get('order_ids'))
+    if not order_ids:
+        return resp(400, {'error': 'order_ids required'})
+    user_id = int(params['user_id']) if str(params.get('user_id') or '').isdigit() else None
+
+    conn = get_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(f"""
+                SELECT ids.order_id,
+                       COALESCE(tk.tasks, '[]'::json) as tasks,
+                       COALESCE(tk.open_count, 0) as tasks_open,
+                       (SELECT COUNT(*) FROM {t('order_messages')} m
+                        WHERE m.order_id = ids.order_id
+                          AND m.id > COALESCE(r.last_read_message_id, 0)
+                          AND (%(user_id)s::int IS NULL OR m.user_id IS DISTINCT FROM %(user_id)s)) as unread,
+                       lm.id as last_message_id, lm.user_name as last_message_user,
+                       lm.text as last_message_text, lm.created_at as last_message_at
+                FROM unnest(%(ids)s::int[]) as ids(order_id)
+                LEFT JOIN {t('order_message_reads')} r
+                    ON r.order_id = ids.order_id AND r.user_id = %(user_id)s
+                LEFT JOIN LATERAL (
+                    SELECT json_agg(row_to_json(x) ORDER BY x.id) as tasks,
+                           COUNT(*) FILTER (WHERE NOT x.done) as open_count
+                    FROM {t('order_tasks')} x WHERE x.order_id = ids.order_id
+                ) tk ON TRUE
+                LEFT JOIN LATERAL (
+                    SELECT id, user_name, text, created_at FROM {t('order_messages')}
+                    WHERE order_id = ids.order_id
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT 1
+                ) lm ON TRUE
+            """, {'ids': order_ids, 'user_id': user_id})
+            result = {}
+            for r in cur.fetchall():
+                result[r['order_id']] = {
+                    'tasks': r['tasks'],
+                    'tasks_open': r['tasks_open'],
+                    'unread': r['unread'],
+                    'last_message': {
+                        'id': r['last_message_id'],
+                        'user_name': r['last_message_user'],
+                        'text': r['last_message_text'],
+                        'created_at': r['last_message_at'],
+                    } if r['last_message_id'] else None,
+                }
+            return resp(200, {'orders': result})
+    finally:
+        conn.close()
+
+
+def mark_messages_read(data):
+    order_id = data.get('order_id')
+    user_id = data.get('user_id')
+    if not order_id or not user_id:
+        return resp(400, {'error': 'order_id and user_id required'})
+
+    conn = get_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(
+                f"""INSERT INTO {t('order_message_reads')} (order_id, user_id, last_read_message_id)
+                    SELECT %s, %s, COALESCE(MAX(id), 0) FROM {t('order_messages')} WHERE order_id = %s
+                    ON CONFLICT (user_id, order_id) DO UPDATE
+                    SET last_read_message_id = GREATEST({t('order_message_reads')}.last_read_message_id, EXCLUDED.last_read_message_id),
+                        read_at = NOW()
+                    RETURNING *""",
+                (order_id, user_id, order_id)
+            )
+            r = cur.fetchone()
+            conn.commit()
+            return resp(200, {'read': dict(r)})
+    finally:
+        conn.close()
+
+
+CHANGES_BATCH = 500
+CHANGE_LOG_RETENTION_DAYS = 30
+CHANGE_LOG_PRUNE_EVERY = 300
+CHANGE_LOG_PRUNE_BATCH = 10000
+
+
+def prune_change_log(cur):
+    """Удаляет записи change_log старше CHANGE_LOG_RETENTION_DAYS — не чаще раза в CHANGE_LOG_PRUNE_EVERY секунд
+    и не больше CHANGE_LOG_PRUNE_BATCH за раз — и сдвигает горизонт хранения на наибольший удалённый txid"""
+    cur.execute(
+        f"""WITH gone AS (
+                DELETE FROM {t('change_log')}
+                WHERE id IN (
+                    SELECT id FROM {t('change_log')}
+                    WHERE changed_at < NOW() - %(days)s * INTERVAL '1 day'
+                      AND EXISTS (SELECT 1 FROM {t('change_log_retention')}
+                                  WHERE id = 1 AND pruned_at < NOW() - %(every)s * INTERVAL '1 second')
+                    ORDER BY id
+                    LIMIT %(batch)s
+                )
+                RETURNING txid
+            )
+            UPDATE {t('change_log_retention')}
+            SET pruned_at = NOW(), pruned_txid = GREATEST(pruned_txid, COALESCE((SELECT MAX(txid) FROM gone), 0))
+            WHERE id = 1 AND pruned_at < NOW() - %(every)s * INTERVAL '1 second'""",
+        {'days': CHANGE_LOG_RETENTION_DAYS, 'every': CHANGE_LOG_PRUNE_EVERY, 'batch': CHANGE_LOG_PRUNE_BATCH},
+    )
+
+
+def read_changes(cur, entity, since):
+    """Изменения сущности из change_log после курсора "txid.id".
+    Отдаются только транзакции младше горизонта xmin — они уже завершены, поэтому курсор ничего не пропускает.
+    Возвращает ({entity_id: последняя операция}, новый курсор, есть ли ещё); ops=None — курсор попадает
+    в уже удалённую часть change_log (см. prune_change_log), нужна полная перезагрузка.
+    Некорректный курсор — ValueError."""
+    cur.execute(
+        f"""SELECT txid_snapshot_xmin(txid_current_snapshot()) as xmin,
+                   (SELECT pruned_txid FROM {t('change_log_retention')} WHERE id = 1) as pruned_txid"""
+    )
+    row = cur.fetchone()
+    xmin = row['xmin']
+    if not since:
+        return {}, f"{xmin}.0", False
+    txid_part, _, id_part = since.partition('.')
+    if not (txid_part.isdigit() and id_part.isdigit() and len(txid_part) <= 18 and len(id_part) <= 18):
+        raise ValueError(f'invalid cursor: {since}')
+    since_txid, since_id = int(txid_part), int(id_part)
+    if row['pruned_txid'] and since_txid <= row['pruned_txid']:
+        return None, f"{xmin}.0", False
+    cur.execute(
+        f"""SELECT id, entity_id, op, txid FROM {t('change_log')}
+            WHERE entity = %s AND (txid, id) >= (%s, %s) AND txid < %s
+            ORDER BY txid, id
+            LIMIT %s""",
+        (entity, since_txid, since_id, xmin, CHANGES_BATCH + 1),
+    )
+    rows = cur.fetchall()
+    has_more = len(rows) > CHANGES_BATCH
+    rows = rows[:CHANGES_BATCH]
+    ops = {}
+    for r in rows:
+        ops[r['entity_id']] = r['op']
+    if has_more:
+        cursor = f"{rows[-1]['txid']}.{rows[-1]['id'] + 1}"
+    else:
+        cursor = f"{max(xmin, since_txid)}.{0 if xmin > since_txid else since_id}"
+    return ops, cursor, has_more
+
+
+def get_order_changes(params):
+    """Лента изменений заявок: изменённые заявки целиком и id удалённых (tombstones).
+    Без since возвращает только текущий курсор — клиент загружает полный список и дальше опрашивает по курсору."""
+    conn = get_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            prune_change_log(cur)
+            conn.commit()
+            try:
+                ops, cursor, has_more = read_changes(cur, 'order', params.get('since'))
+            except ValueError:
+                return resp(400, {'error': 'invalid since cursor'})
+            if ops is None:
+                return resp(410, {'error': 'cursor too old, resync', 'resync': True, 'cursor': cursor})
+            changed = [oid for oid, op in ops.items() if op != 'D']
+            orders = []
+            if changed:
+                cur.execute(f"SELECT * FROM {t('orders')} WHERE id = ANY(%s) ORDER BY id", (changed,))
+                orders = [format_order(r) for r in cur.fetchall()]
+            found = {o['id'] for o in orders}
+            deleted = sorted(oid for oid in ops if oid not in found)
+            return resp(200, {'orders': orders, 'deleted': deleted, 'cursor': cursor, 'has_more': has_more})
+    finally:
+        conn.close()
+
+
 def handler(event, context):
     """API заявок установочного центра"""
     if event.get('httpMethod') == 'OPTIONS':
@@ -488,6 +888,14 @@ def handler(event, context):
             return get_order_tasks(int(params['order_id']))
         if params.get('action') == 'messages' and params.get('order_id'):
             return get_order_messages(int(params['order_id']))
+        if params.get('action') == 'ocr_stats':
+            return get_ocr_stats(params)
+        if params.get('action') == 'changes':
+            return get_order_changes(params)
+        if params.get('action') == 'badges':
+            return get_orders_badges(params)
+        if params.get('action') == 'board':
+            return get_orders_board(params)
         return get_orders()
 
     if method in ('POST', 'PUT'):
@@ -510,6 +918,8 @@ def handler(event, context):
             return upsert_order_task(body)
         elif action == 'add_message':
             return add_order_message(body)
+        elif action == 'mark_read':
+            return mark_messages_read(body)
 
         return resp(400, {'error': 'Unknown action'})
 
@@ -0,0 +1,114 @@
+"""Глобальный поиск по клиентам, заявкам, заказ-нарядам и номенклатуре.
+
+URL функции записывает в backend/func2url.json платформа при первом деплое (ключ "search");
+до деплоя getApiUrl('search') на фронтенде возвращает пустую строку."""
+import json
+import os
+import re
+import psycopg2
+import psycopg2.extras
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token, X-Session-Id',
+    'Access-Control-Max-Age': '86400',
+}
+
+SCHEMA = os.environ.get('MAIN_DB_SCHEMA', 'public')
+
+ENTITIES = ('client', 'order', 'work_order', 'product')
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+# Сколько кандидатов берёт каждая ветка (полнотекстовая и триграммная) до ранжирования
+SEARCH_CANDIDATES = 200
+
+
+def t(name):
+    return f'{SCHEMA}.{name}'
+
+
+def get_conn():
+    return psycopg2.connect(os.environ['DATABASE_URL'])
+
+
+def resp(status_code, body):
+    return {
+        'statusCode': status_code,
+        'headers': {**CORS_HEADERS, 'Content-Type': 'application/json'},
+        'body': json.dumps(body, default=str, ensure_ascii=False),
+    }
+
+
+def search(params):
+    """Поиск по search_index: морфология (tsvector, russian) и подстрока/опечатки (триграммы).
+    Обе ветки идут по своим GIN-индексам, результат ранжируется вместе."""
+    q = (params.get('q') or '').strip()
+    if len(q) < 2:
+        return resp(400, {'error': 'q must be at least 2 characters'})
+    try:
+        limit = min(SEARCH_MAX_LIMIT, max(1, int(params.get('limit') or SEARCH_DEFAULT_LIMIT)))
+    except ValueError:
+        limit = SEARCH_DEFAULT_LIMIT
+    types = [x for x in (params.get('types') or '').split(',') if x in ENTITIES] or list(ENTITIES)
+
+    # Номер телефона ищется по цифрам: в индексе хранится и ключ из 10 цифр
+    digits = re.sub(r'\D', '', q)
+    if len(digits) >= 5 and re.fullmatch(r'[\d\s()+\-]+', q):
+        like = f"%{digits[-10:]}%"
+    else:
+        # % и _ из запроса — обычные символы, а не шаблоны LIKE
+        like = "%" + re.sub(r'([\\%_])', r'\\\1', q) + "%"
+
+    conn = get_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(f"""
+                WITH query AS (SELECT websearch_to_tsquery('russian', %(q)s) as tsq),
+                fts AS (
+                    SELECT si.entity, si.entity_id
+                    FROM {t('search_index')} si, query
+                    WHERE si.tsv @@ query.tsq AND si.entity = ANY(%(types)s)
+                    LIMIT %(candidates)s
+                ),
+                trg AS (
+                    SELECT si.entity, si.entity_id
+                    FROM {t('search_index')} si
+                    WHERE si.search_text ILIKE %(like)s AND si.entity = ANY(%(types)s)
+                    LIMIT %(candidates)s
+                )
+                SELECT si.entity, si.entity_id, si.title, si.subtitle, si.updated_at,
+                       ts_rank(si.tsv, query.tsq) + word_similarity(%(q)s, si.search_text) as score
+                FROM (SELECT * FROM fts UNION SELECT * FROM trg) m
+                JOIN {t('search_index')} si ON si.entity = m.entity AND si.entity_id = m.entity_id
+                CROSS JOIN query
+                ORDER BY score DESC, si.updated_at DESC
+                LIMIT %(limit)s
+            """, {'q': q, 'like': like, 'types': types, 'candidates': SEARCH_CANDIDATES, 'limit': limit})
+            rows = cur.fetchall()
+    finally:
+        conn.close()
+
+    results = [{
+        'entity': r['entity'],
+        'id': r['entity_id'],
+        'title': r['title'],
+        'subtitle': r['subtitle'],
+        'score': round(float(r['score']), 4),
+    } for r in rows]
+    grouped = {}
+    for r in results:
+        grouped.setdefault(r['entity'], []).append(r)
+    return resp(200, {'q': q, 'results': results, 'by_entity': grouped})
+
+
+def handler(event, context):
+    """API глобального поиска"""
+    if event.get('httpMethod') == 'OPTIONS':
+        return {'statusCode': 200, 'headers': CORS_HEADERS, 'body': ''}
+
+    if event.get('httpMethod', 'GET') == 'GET':
+        params = event.get('queryStringParameters') or {}
+        return search(params)
+
+    return resp(405, {'error': 'Method not allowed'})
@@ -344,6 +344,11 @@ def create_product_in_db(conn, name: str, sku: str = "", category: str = "", pur
         VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id, name
     """, (name, auto_sku, category or "", purchase_price or 0.0, quantity or 0, unit or "шт", description or ""))
     product_id, product_name = cur.fetchone()
+    if quantity:
+        cur.execute(f"""
+            INSERT INTO {t('stock_movements')} (product_id, qty, movement_type, quantity_delta, note)
+            VALUES (%s, %s, 'opening', %s, 'создан ботом')
+        """, (product_id, int(quantity), quantity))
     conn.commit()
     cur.close()
     return product_id, product_name, True
\ No newline at end of file
@@ -1,6 +1,8 @@
 """API складского учёта: товары, поставщики, поступления, перемещения"""
 import json
+import math
 import os
+from datetime import date, datetime, timedelta
 import psycopg2
 import psycopg2.extras
 
@@ -81,14 +83,37 @@ RESERVED_SUBQUERY = """
 """
 
 
+def add_movement(cur, product_id, movement_type, quantity_delta=0, reserved_delta=0,
+                 work_order_id=None, work_order_part_id=None, stock_receipt_id=None,
+                 stock_transfer_id=None, note=''):
+    """Записывает движение в регистр stock_movements (изменение остатка и резерва)"""
+    cur.execute(
+        f"""INSERT INTO {t('stock_movements')}
+               (product_id, work_order_id, work_order_part_id, stock_receipt_id, stock_transfer_id,
+                qty, movement_type, quantity_delta, reserved_delta, note)
+           VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
+        (
+            product_id, work_order_id, work_order_part_id, stock_receipt_id, stock_transfer_id,
+            int(round(abs(quantity_delta or reserved_delta))), movement_type,
+            quantity_delta, reserved_delta, note,
+        ),
+    )
+
+
+SKU_NORMALIZE_SQL = "lower(regexp_replace(%s, '[[:space:]-]', '', 'g'))"
+
+SUGGEST_DEFAULT_LIMIT = 10
+SUGGEST_MAX_LIMIT = 50
+
+
 def get_products(conn, params=None):
     with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
         where = []
         vals = []
         if params and params.get('search'):
-            where.append("(p.name ILIKE %s OR p.sku ILIKE %s)")
-            q = f"%{params['search']}%"
-            vals.extend([q, q])
+            # Оба условия покрываются триграммными GIN-индексами; артикул сравнивается в нормализованном виде
+            where.append(f"(p.name ILIKE %s OR p.sku_normalized LIKE '%%' || {SKU_NORMALIZE_SQL} || '%%')")
+            vals.extend([f"%{params['search']}%", params['search']])
         if params and params.get('category'):
             where.append("p.category = %s")
             vals.append(params['category'])
@@ -123,6 +148,44 @@ def get_product(conn, product_id):
         return dict(p)
 
 
+def get_product_suggest(conn, params):
+    """Автодополнение номенклатуры: точный и префиксный артикул, затем похожие названия"""
+    q = (params.get('q') or '').strip()
+    if not q:
+        return []
+    try:
+        limit = min(SUGGEST_MAX_LIMIT, max(1, int(params.get('limit') or SUGGEST_DEFAULT_LIMIT)))
+    except ValueError:
+        limit = SUGGEST_DEFAULT_LIMIT
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(f"""
+            WITH q AS (SELECT %(q)s::text as raw, {SKU_NORMALIZE_SQL.replace('%s', '%(q)s')} as sku)
+            SELECT p.id, p.sku, p.name, p.unit, p.quantity, p.reserved_qty,
+                   p.purchase_price, p.selling_price,
+                   (p.sku_normalized = q.sku) as sku_exact,
+                   GREATEST(similarity(p.name, q.raw), similarity(p.sku_normalized, q.sku)) as score
+            FROM {t('products')} p, q
+            WHERE p.is_active = true
+              AND (p.sku_normalized LIKE q.sku || '%%'
+                   OR p.sku_normalized LIKE '%%' || q.sku || '%%'
+                   OR p.name ILIKE '%%' || q.raw || '%%'
+                   OR p.name %% q.raw)
+            ORDER BY sku_exact DESC, (p.sku_normalized LIKE q.sku || '%%') DESC, score DESC, p.name
+            LIMIT %(limit)s
+        """, {'q': q, 'limit': limit})
+        return [{
+            'id': r['id'],
+            'sku': r['sku'],
+            'name': r['name'],
+            'unit': r['unit'],
+            'quantity': r['quantity'],
+            'reserved_qty': r['reserved_qty'],
+            'purchase_price': float(r['purchase_price'] or 0),
+            'selling_price': float(r['selling_price'] or 0),
+            'score': round(float(r['score'] or 0), 3),
+        } for r in cur.fetchall()]
+
+
 def create_product(conn, data):
     sku = data.get('sku', '').strip()
     name = data.get('name', '').strip()
@@ -353,27 +416,166 @@ def create_receipt(conn, data):
                     WHERE id = %s""",
                 (quantity, price, product_id),
             )
+            add_movement(
+                cur, product_id, 'receipt',
+                quantity_delta=quantity,
+                stock_receipt_id=receipt['id'],
+                note=receipt_number,
+            )
 
+        revalue_before_commit(cur, [i['product_id'] for i in valid_items])
         conn.commit()
         return resp(201, {'receipt': dict(receipt)})
 
 
-def get_dashboard(conn):
+# ==================== ИТОГИ СКЛАДА ====================
+
+# Итоги склада = строка warehouse_summary + дельты, которые триггеры на products и suppliers дописывают
+# в warehouse_summary_deltas (V0082). Писатели только вставляют дельты и не ждут друг друга на общей строке;
+# накопленные дельты сворачиваются в строку при чтении дашборда, когда их больше SUMMARY_FOLD_THRESHOLD
+SUMMARY_COLUMNS = ('total_products', 'total_quantity', 'total_supplied', 'low_stock_count', 'suppliers_count')
+SUMMARY_FOLD_THRESHOLD = 500
+
+ACTUAL_SUMMARY_SQL = """
+    SELECT
+        COUNT(*) as total_products,
+        COALESCE(SUM(quantity), 0) as total_quantity,
+        COALESCE(SUM(quantity * purchase_price), 0) as total_supplied,
+        COUNT(CASE WHEN quantity <= min_quantity THEN 1 END) as low_stock_count,
+        (SELECT COUNT(*) FROM {suppliers} WHERE is_active = true) as suppliers_count
+    FROM {products}
+    WHERE is_active = true
+"""
+
+STORED_SUMMARY_SQL = """
+    SELECT s.total_products + COALESCE(d.d_products, 0) as total_products,
+           s.total_quantity + COALESCE(d.d_quantity, 0) as total_quantity,
+           s.total_supplied + COALESCE(d.d_supplied, 0) as total_supplied,
+           s.low_stock_count + COALESCE(d.d_low, 0) as low_stock_count,
+           s.suppliers_count + COALESCE(d.d_suppliers, 0) as suppliers_count,
+           COALESCE(d.pending, 0) as pending_deltas,
+           s.updated_at
+    FROM {summary} s
+    LEFT JOIN (
+        SELECT SUM(d_products) as d_products, SUM(d_quantity) as d_quantity, SUM(d_supplied) as d_supplied,
+               SUM(d_low) as d_low, SUM(d_suppliers) as d_suppliers, COUNT(*) as pending
+        FROM {deltas}
+    ) d ON TRUE
+    WHERE s.id = 1
+"""
+
+
+def _summary_sql(template):
+    return template.format(
+        products=t('products'), suppliers=t('suppliers'),
+        summary=t('warehouse_summary'), deltas=t('warehouse_summary_deltas'),
+    )
+
+
+def _summary_values(row):
+    return {
+        'total_products': int(row['total_products']),
+        'total_quantity': float(row['total_quantity']),
+        'total_supplied': float(row['total_supplied']),
+        'low_stock_count': int(row['low_stock_count']),
+        'suppliers_count': int(row['suppliers_count']),
+    }
+
+
+def compute_summary(cur):
+    """Итоги склада полным пересчётом по products и suppliers"""
+    cur.execute(_summary_sql(ACTUAL_SUMMARY_SQL))
+    return _summary_values(cur.fetchone())
+
+
+def fold_summary_deltas(conn):
+    """Переносит накопленные дельты в строку итогов одним оператором.
+    Дельты ещё не завершённых транзакций не видны и останутся до следующего сворачивания."""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            WITH moved AS (
+                DELETE FROM {t('warehouse_summary_deltas')} RETURNING *
+            ), d AS (
+                SELECT COUNT(*) as n,
+                       COALESCE(SUM(d_products), 0) as d_products, COALESCE(SUM(d_quantity), 0) as d_quantity,
+                       COALESCE(SUM(d_supplied), 0) as d_supplied, COALESCE(SUM(d_low), 0) as d_low,
+                       COALESCE(SUM(d_suppliers), 0) as d_suppliers
+                FROM moved
+            )
+            UPDATE {t('warehouse_summary')} ws SET
+                total_products = ws.total_products + d.d_products,
+                total_quantity = ws.total_quantity + d.d_quantity,
+                total_supplied = ws.total_supplied + d.d_supplied,
+                low_stock_count = ws.low_stock_count + d.d_low,
+                suppliers_count = ws.suppliers_count + d.d_suppliers,
+                updated_at = NOW()
+            FROM d
+            WHERE ws.id = 1 AND d.n > 0
+        """)
+    conn.commit()
+
+
+def rebuild_summary(conn):
+    """Полный пересчёт итогов. Удаление дельт и пересчёт — один оператор с одним снимком данных,
+    поэтому изменения параллельных транзакций не теряются и не учитываются дважды."""
     with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
         cur.execute(f"""
-            SELECT
-                COUNT(*) as total_products,
-                COALESCE(SUM(quantity), 0) as total_quantity,
-                COALESCE(SUM(quantity * purchase_price), 0) as total_supplied,
-                COUNT(CASE WHEN quantity <= min_quantity THEN 1 END) as low_stock_count
-            FROM {t('products')}
-            WHERE is_active = true
+            WITH cleared AS (
+                DELETE FROM {t('warehouse_summary_deltas')}
+            ), actual AS (
+                {_summary_sql(ACTUAL_SUMMARY_SQL)}
+            )
+            INSERT INTO {t('warehouse_summary')} (id, {', '.join(SUMMARY_COLUMNS)}, updated_at)
+            SELECT 1, {', '.join(SUMMARY_COLUMNS)}, NOW() FROM actual
+            ON CONFLICT (id) DO UPDATE SET
+                total_products = EXCLUDED.total_products,
+                total_quantity = EXCLUDED.total_quantity,
+                total_supplied = EXCLUDED.total_supplied,
+                low_stock_count = EXCLUDED.low_stock_count,
+                suppliers_count = EXCLUDED.suppliers_count,
+                updated_at = NOW()
+            RETURNING {', '.join(SUMMARY_COLUMNS)}
         """)
-        stats = dict(cur.fetchone())
+        actual = _summary_values(cur.fetchone())
+        conn.commit()
+        return actual
 
-        cur.execute(f"SELECT COUNT(*) as suppliers_count FROM {t('suppliers')} WHERE is_active = true")
-        stats['suppliers_count'] = cur.fetchone()['suppliers_count']
-        return stats
+
+def check_summary(conn):
+    """Сверка поддерживаемых итогов (строка + дельты) с полным пересчётом в одном снимке данных"""
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(f"""
+            SELECT row_to_json(st) as stored, row_to_json(ac) as actual
+            FROM ({_summary_sql(ACTUAL_SUMMARY_SQL)}) ac
+            LEFT JOIN ({_summary_sql(STORED_SUMMARY_SQL)}) st ON TRUE
+        """)
+        row = cur.fetchone()
+    stored = row['stored'] or {}
+    actual = _summary_values(row['actual'])
+    stored_values = _summary_values(stored) if stored else {}
+    diff = {
+        col: {'stored': stored_values.get(col), 'actual': actual[col]}
+        for col in SUMMARY_COLUMNS
+        if stored_values.get(col) != actual[col]
+    }
+    return {
+        'consistent': not diff,
+        'diff': diff,
+        'pending_deltas': stored.get('pending_deltas', 0),
+        'updated_at': stored.get('updated_at'),
+    }
+
+
+def get_dashboard(conn):
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        cur.execute(_summary_sql(STORED_SUMMARY_SQL))
+        row = cur.fetchone()
+    conn.commit()
+    if not row:
+        return rebuild_summary(conn)
+    if row['pending_deltas'] > SUMMARY_FOLD_THRESHOLD:
+        fold_summary_deltas(conn)
+    return _summary_values(row)
 
 
 # ==================== ПЕРЕМЕЩЕНИЯ ====================
@@ -520,7 +722,8 @@ def confirm_transfer(conn, data):
         return resp(400, {'error': 'transfer_id is required'})
 
     with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-        cur.execute(f"SELECT * FROM {t('stock_transfers')} WHERE id = %s", (transfer_id,))
+        # Блокируем документ: повторное подтверждение ждёт и видит status = 'confirmed'
+        cur.execute(f"SELECT * FROM {t('stock_transfers')} WHERE id = %s FOR UPDATE", (transfer_id,))
         transfer = cur.fetchone()
         if not transfer:
             return resp(404, {'error': 'Перемещение не найдено'})
@@ -537,15 +740,33 @@ def confirm_transfer(conn, data):
             qty = float(item['qty'])
 
             if direction == 'to_order':
-                # Склад → ЗН: товар физически ушёл со склада, резерв снимается
+                # Склад → ЗН: товар физически ушёл со склада, резерв снимается.
+                # Остаток и резерв не уходят ниже нуля — в регистр пишем фактически применённые изменения
                 cur.execute(
-                    f"""UPDATE {t('products')}
-                        SET quantity = GREATEST(0, quantity - %s),
-                            reserved_qty = GREATEST(0, reserved_qty - %s),
+                    f"""WITH prev AS (
+                            SELECT id, quantity, reserved_qty FROM {t('products')} WHERE id = %s FOR UPDATE
+                        )
+                        UPDATE {t('products')} p
+                        SET quantity = GREATEST(0, prev.quantity - %s),
+                            reserved_qty = GREATEST(0, prev.reserved_qty - %s),
                             updated_at = NOW()
-                        WHERE id = %s""",
-                    (qty, qty, product_id)
+                        FROM prev
+                        WHERE p.id = prev.id
+                        RETURNING p.quantity - prev.quantity as quantity_delta,
+                                  p.reserved_qty - prev.reserved_qty as reserved_delta""",
+                    (product_id, qty, qty)
                 )
+                applied = cur.fetchone()
+                if applied and (applied['quantity_delta'] or applied['reserved_delta']):
+                    add_movement(
+                        cur, product_id, 'transfer_to_order',
+                        quantity_delta=float(applied['quantity_delta']),
+                        reserved_delta=float(applied['reserved_delta']),
+                        work_order_id=transfer['work_order_id'],
+                        work_order_part_id=item.get('work_order_part_id'),
+                        stock_transfer_id=transfer_id,
+                        note=transfer['transfer_number'],
+                    )
             else:
                 # ЗН → Склад (возврат): товар физически вернулся, резерв снова появляется
                 cur.execute(
@@ -556,6 +777,14 @@ def confirm_transfer(conn, data):
                         WHERE id = %s""",
                     (qty, qty, product_id)
                 )
+                add_movement(
+                    cur, product_id, 'transfer_to_stock',
+                    quantity_delta=qty, reserved_delta=qty,
+                    work_order_id=transfer['work_order_id'],
+                    work_order_part_id=item.get('work_order_part_id'),
+                    stock_transfer_id=transfer_id,
+                    note=transfer['transfer_number'],
+                )
 
         cur.execute(
             f"""UPDATE {t('stock_transfers')}
@@ -563,6 +792,7 @@ def confirm_transfer(conn, data):
                 WHERE id = %s RETURNING *""",
             (transfer_id,)
         )
+        revalue_before_commit(cur, [i['product_id'] for i in items])
         conn.commit()
 
         transfers = get_transfers(conn, {'work_order_id': transfer['work_order_id']})
@@ -573,32 +803,414 @@ def confirm_transfer(conn, data):
 def recalc_reserved(conn):
     """Пересчитываем reserved_qty: зарезервировано в ЗН минус уже перемещённое физически"""
     with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        # Один оператор: строки товаров блокируются до чтения старого резерва,
+        # разница по каждому товару сразу пишется в регистр, чтобы восстановление остатков на дату сходилось
         cur.execute(f"""
-            UPDATE {t('products')} p
-            SET reserved_qty = GREATEST(0,
-                COALESCE((
-                    SELECT SUM(wop.qty)
-                    FROM {t('work_order_parts')} wop
-                    JOIN {t('work_orders')} wo ON wo.id = wop.work_order_id
-                    WHERE wop.product_id = p.id
-                      AND wop.out_of_stock = false
-                      AND wo.status != 'issued'
-                ), 0)
-                - COALESCE((
-                    SELECT SUM(CASE WHEN st.direction = 'to_order' THEN sti.qty ELSE -sti.qty END)
-                    FROM {t('stock_transfer_items')} sti
-                    JOIN {t('stock_transfers')} st ON st.id = sti.transfer_id
-                    JOIN {t('work_orders')} wo ON wo.id = st.work_order_id
-                    WHERE sti.product_id = p.id
-                      AND st.status = 'confirmed'
-                      AND wo.status != 'issued'
-                ), 0)
-            ),
-            updated_at = NOW()
+            WITH prev AS (
+                SELECT id, COALESCE(reserved_qty, 0) as reserved_qty FROM {t('products')} FOR UPDATE
+            ), upd AS (
+                UPDATE {t('products')} p
+                SET reserved_qty = GREATEST(0,
+                    COALESCE((
+                        SELECT SUM(wop.qty)
+                        FROM {t('work_order_parts')} wop
+                        JOIN {t('work_orders')} wo ON wo.id = wop.work_order_id
+                        WHERE wop.product_id = p.id
+                          AND wop.out_of_stock = false
+                          AND wo.status != 'issued'
+                    ), 0)
+                    - COALESCE((
+                        SELECT SUM(CASE WHEN st.direction = 'to_order' THEN sti.qty ELSE -sti.qty END)
+                        FROM {t('stock_transfer_items')} sti
+                        JOIN {t('stock_transfers')} st ON st.id = sti.transfer_id
+                        JOIN {t('work_orders')} wo ON wo.id = st.work_order_id
+                        WHERE sti.product_id = p.id
+                          AND st.status = 'confirmed'
+                          AND wo.status != 'issued'
+                    ), 0)
+                ),
+                updated_at = NOW()
+                FROM prev
+                WHERE p.id = prev.id
+                RETURNING p.id, p.reserved_qty - prev.reserved_qty as diff
+            ), logged AS (
+                INSERT INTO {t('stock_movements')} (product_id, qty, movement_type, reserved_delta, note)
+                SELECT id, ROUND(ABS(diff)), 'reserve_recalc', diff, 'пересчёт резервов'
+                FROM upd WHERE diff <> 0
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM upd) as updated, (SELECT COUNT(*) FROM logged) as changed
         """)
-        updated = cur.rowcount
+        row = cur.fetchone()
+        conn.commit()
+    return resp(200, {'success': True, 'updated': row['updated'], 'changed': row['changed']})
+
+
+# ==================== ОСТАТКИ НА ДАТУ ====================
+
+SNAPSHOT_MAX_AGE_DAYS = 7
+# Действия, меняющие остатки или резервы: перед ними при необходимости делаем плановый снимок
+STOCK_WRITE_ACTIONS = {'create_receipt', 'confirm_transfer', 'recalc_reserved'}
+
+
+def take_stock_snapshot(conn, note=''):
+    """Снимок текущих остатков и резервов всех товаров с отметкой последнего учтённого движения"""
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        # Один оператор: шапка и строки снимка видят одно и то же состояние products и регистра
+        cur.execute(f"""
+            WITH s AS (
+                INSERT INTO {t('stock_snapshots')} (taken_at, last_movement_id, note)
+                SELECT NOW(), COALESCE(MAX(id), 0), %s FROM {t('stock_movements')}
+                RETURNING *
+            ), items AS (
+                INSERT INTO {t('stock_snapshot_items')} (snapshot_id, product_id, quantity, reserved_qty)
+                SELECT s.id, p.id, COALESCE(p.quantity, 0), COALESCE(p.reserved_qty, 0)
+                FROM {t('products')} p, s
+                RETURNING 1
+            )
+            SELECT s.*, (SELECT COUNT(*) FROM items) as items_count FROM s
+        """, (note,))
+        snapshot = dict(cur.fetchone())
         conn.commit()
-    return resp(200, {'success': True, 'updated': updated})
+        return snapshot
+
+
+def ensure_recent_snapshot(conn):
+    """Периодический снимок: делаем новый, если последний старше SNAPSHOT_MAX_AGE_DAYS.
+    Вызывается из записывающих действий со складом, чтобы GET не менял данные"""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT COALESCE(MAX(taken_at) < NOW() - %s * INTERVAL '1 day', TRUE) FROM {t('stock_snapshots')}",
+            (SNAPSHOT_MAX_AGE_DAYS,),
+        )
+        stale = cur.fetchone()[0]
+    if stale:
+        take_stock_snapshot(conn, note='автоматический снимок')
+
+
+def get_stock_at(conn, params):
+    """Остатки и резервы на конец указанного дня: ближайший снимок + движения регистра"""
+    try:
+        day = datetime.strptime(params.get('date', ''), '%Y-%m-%d')
+    except ValueError:
+        return resp(400, {'error': 'date is required in format YYYY-MM-DD'})
+    moment = day + timedelta(days=1)
+
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        # Ближайший снимок до даты — прибавляем движения после него,
+        # иначе ближайший после даты — вычитаем движения, совершённые позже даты
+        cur.execute(f"""
+            SELECT * FROM {t('stock_snapshots')} WHERE taken_at <= %s
+            ORDER BY taken_at DESC LIMIT 1
+        """, (moment,))
+        snapshot = cur.fetchone()
+        forward = snapshot is not None
+        if not forward:
+            cur.execute(f"""
+                SELECT * FROM {t('stock_snapshots')} WHERE taken_at > %s
+                ORDER BY taken_at LIMIT 1
+            """, (moment,))
+            snapshot = cur.fetchone()
+        if not snapshot:
+            return resp(404, {'error': 'Нет снимков остатков'})
+
+        where = []
+        vals = []
+        if params.get('product_id'):
+            where.append("p.id = %s")
+            vals.append(int(params['product_id']))
+        if params.get('category'):
+            where.append("p.category = %s")
+            vals.append(params['category'])
+        w = (" AND " + " AND ".join(where)) if where else ""
+
+        if forward:
+            movements_filter = "m.id > %s AND m.created_at < %s"
+            sign = "+"
+        else:
+            movements_filter = "m.id <= %s AND m.created_at >= %s"
+            sign = "-"
+
+        cur.execute(f"""
+            WITH mv AS (
+                SELECT m.product_id,
+                       SUM(m.quantity_delta) as quantity_delta,
+                       SUM(m.reserved_delta) as reserved_delta
+                FROM {t('stock_movements')} m
+                WHERE {movements_filter}
+                GROUP BY m.product_id
+            )
+            SELECT p.id as product_id, p.sku, p.name, p.unit, p.category,
+                   COALESCE(si.quantity, 0) {sign} COALESCE(mv.quantity_delta, 0) as quantity,
+                   COALESCE(si.reserved_qty, 0) {sign} COALESCE(mv.reserved_delta, 0) as reserved_qty
+            FROM {t('products')} p
+            LEFT JOIN {t('stock_snapshot_items')} si ON si.product_id = p.id AND si.snapshot_id = %s
+            LEFT JOIN mv ON mv.product_id = p.id
+            WHERE (si.product_id IS NOT NULL OR mv.product_id IS NOT NULL){w}
+            ORDER BY p.name
+        """, [snapshot['last_movement_id'], moment, snapshot['id']] + vals)
+        rows = cur.fetchall()
+
+        products = []
+        total_quantity = 0.0
+        total_reserved = 0.0
+        for r in rows:
+            qty = float(r['quantity'])
+            reserved = max(0.0, float(r['reserved_qty']))
+            if not qty and not reserved:
+                continue
+            total_quantity += qty
+            total_reserved += reserved
+            products.append({
+                'product_id': r['product_id'],
+                'sku': r['sku'],
+                'name': r['name'],
+                'unit': r['unit'],
+                'category': r['category'] or '',
+                'quantity': qty,
+                'reserved_qty': reserved,
+            })
+
+        return resp(200, {
+            'date': day.strftime('%Y-%m-%d'),
+            'snapshot': {
+                'id': snapshot['id'],
+                'taken_at': str(snapshot['taken_at']),
+                'direction': 'forward' if forward else 'backward',
+            },
+            'products': products,
+            'total_quantity': total_quantity,
+            'total_reserved': total_reserved,
+        })
+
+
+# ==================== ОЦЕНКА СЕБЕСТОИМОСТИ ====================
+
+VALUATION_BATCH_SIZE = 500
+
+PENDING_VALUATION_EVENTS = """
+    SELECT 'receipt' as kind, sri.id as item_id, sri.product_id, sr.created_at as at,
+           sri.quantity::numeric as qty, sri.price as price, NULL::integer as work_order_id
+    FROM {receipt_items} sri
+    JOIN {receipts} sr ON sr.id = sri.receipt_id
+    WHERE NOT EXISTS (SELECT 1 FROM {layers} l WHERE l.stock_receipt_item_id = sri.id)
+    UNION ALL
+    SELECT st.direction, sti.id, sti.product_id, COALESCE(st.confirmed_at, st.created_at),
+           sti.qty, sti.price, st.work_order_id
+    FROM {transfer_items} sti
+    JOIN {transfers} st ON st.id = sti.transfer_id
+    WHERE st.status = 'confirmed'
+      AND NOT EXISTS (SELECT 1 FROM {issues} ic WHERE ic.stock_transfer_item_id = sti.id)
+"""
+
+
+def _pending_events_sql():
+    return PENDING_VALUATION_EVENTS.format(
+        receipt_items=t('stock_receipt_items'),
+        receipts=t('stock_receipts'),
+        transfer_items=t('stock_transfer_items'),
+        transfers=t('stock_transfers'),
+        layers=t('inventory_cost_layers'),
+        issues=t('inventory_issue_costs'),
+    )
+
+
+# Настройка inventory_cost_method общая со сводкой finance (get_cost_method там же) — держать копии одинаковыми
+def get_cost_method(cur):
+    cur.execute(f"SELECT value FROM {t('system_settings')} WHERE key = 'inventory_cost_method'")
+    row = cur.fetchone()
+    method = (row['value'] if row else 'fifo') or 'fifo'
+    return method if method in ('fifo', 'average') else 'fifo'
+
+
+def _revalue_batch(cur, product_ids):
+    """Оценивает пачку товаров одним вызовом revalue_inventory_batch в БД (V0084), возвращает число событий"""
+    cur.execute(f"SELECT {t('revalue_inventory_batch')}(%s::integer[]) as events", (list(product_ids),))
+    return cur.fetchone()['events']
+
+
+def revalue_inventory(conn, product_ids=None):
+    """Инкрементальная оценка себестоимости: обрабатывает только ещё не оценённые документы"""
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        if product_ids is None:
+            cur.execute(f"SELECT DISTINCT product_id FROM ({_pending_events_sql()}) ev ORDER BY product_id")
+            product_ids = [r['product_id'] for r in cur.fetchall()]
+        events = 0
+        for start in range(0, len(product_ids), VALUATION_BATCH_SIZE):
+            events += _revalue_batch(cur, list(product_ids[start:start + VALUATION_BATCH_SIZE]))
+            conn.commit()
+        return {'products': len(product_ids), 'events': events}
+
+
+def revalue_before_commit(cur, product_ids):
+    """Оценка в транзакции документа: ошибка оценки откатывает документ, а не оставляет его неоценённым"""
+    ids = sorted(set(product_ids))
+    for start in range(0, len(ids), VALUATION_BATCH_SIZE):
+        _revalue_batch(cur, ids[start:start + VALUATION_BATCH_SIZE])
+
+
+def get_valuation(conn, params=None):
+    """Оценка складских остатков по FIFO-слоям и скользящей средней"""
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        method = get_cost_method(cur)
+        where = ""
+        vals = []
+        if params and params.get('product_id'):
+            where = "WHERE p.id = %s"
+            vals.append(int(params['product_id']))
+        cur.execute(f"""
+            SELECT p.id as product_id, p.sku, p.name, p.unit, p.quantity,
+                   COALESCE(vs.avg_unit_cost, p.purchase_price, 0) as avg_unit_cost,
+                   COALESCE(fl.fifo_qty, 0) as fifo_qty,
+                   COALESCE(fl.fifo_value, 0) as fifo_value
+            FROM {t('products')} p
+            LEFT JOIN {t('inventory_valuation_state')} vs ON vs.product_id = p.id
+            LEFT JOIN (
+                SELECT product_id, SUM(remaining_qty) as fifo_qty, SUM(remaining_qty * unit_cost) as fifo_value
+                FROM {t('inventory_cost_layers')}
+                WHERE remaining_qty > 0
+                GROUP BY product_id
+            ) fl ON fl.product_id = p.id
+            {where}
+            ORDER BY p.name
+        """, vals)
+        products = []
+        for r in cur.fetchall():
+            quantity = float(r['quantity'] or 0)
+            avg_unit_cost = float(r['avg_unit_cost'])
+            products.append({
+                'product_id': r['product_id'],
+                'sku': r['sku'],
+                'name': r['name'],
+                'unit': r['unit'],
+                'quantity': quantity,
+                'avg_unit_cost': round(avg_unit_cost, 4),
+                'avg_value': round(quantity * avg_unit_cost, 2),
+                'fifo_qty': float(r['fifo_qty']),
+                'fifo_value': round(float(r['fifo_value']), 2),
+            })
+        value_key = 'fifo_value' if method == 'fifo' else 'avg_value'
+        return {
+            'method': method,
+            'products': products,
+            'total_value': round(sum(p[value_key] for p in products), 2),
+        }
+
+
+# ==================== ПОТРЕБНОСТЬ В ЗАКУПКЕ ====================
+
+REORDER_DEFAULTS = {
+    'short_days': 30,
+    'long_days': 90,
+    'lead_days': 7,
+    'cover_days': 30,
+}
+
+
+def get_reorder(conn, params):
+    """Рекомендации к закупке по скорости расхода, с прогнозом даты обнуления остатка"""
+    opts = {}
+    for key, default in REORDER_DEFAULTS.items():
+        try:
+            opts[key] = max(0, int(params.get(key) or default))
+        except (TypeError, ValueError):
+            return resp(400, {'error': f'{key} must be an integer'})
+    if not opts['short_days'] or not opts['long_days']:
+        return resp(400, {'error': 'short_days and long_days must be positive'})
+    long_days = max(opts['short_days'], opts['long_days'])
+
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        # Расход = подтверждённые перемещения в ЗН минус возвраты, за короткое и длинное окно
+        cur.execute(f"""
+            WITH consumption AS (
+                SELECT sti.product_id,
+                       COALESCE(SUM(CASE WHEN st.direction = 'to_order' THEN sti.qty ELSE -sti.qty END)
+                           FILTER (WHERE st.confirmed_at >= NOW() - %(short_days)s * INTERVAL '1 day'), 0) as short_qty,
+                       COALESCE(SUM(CASE WHEN st.direction = 'to_order' THEN sti.qty ELSE -sti.qty END), 0) as long_qty
+                FROM {t('stock_transfer_items')} sti
+                JOIN {t('stock_transfers')} st ON st.id = sti.transfer_id
+                WHERE st.status = 'confirmed'
+                  AND st.confirmed_at >= NOW() - %(long_days)s * INTERVAL '1 day'
+                GROUP BY sti.product_id
+            ), last_supplier AS (
+                SELECT DISTINCT ON (sri.product_id) sri.product_id, sr.supplier_id
+                FROM {t('stock_receipt_items')} sri
+                JOIN {t('stock_receipts')} sr ON sr.id = sri.receipt_id
+                WHERE sr.supplier_id IS NOT NULL
+                ORDER BY sri.product_id, sr.created_at DESC, sri.id DESC
+            )
+            SELECT p.id as product_id, p.sku, p.name, p.unit,
+                   COALESCE(p.quantity, 0) as quantity,
+                   COALESCE(p.reserved_qty, 0) as reserved_qty,
+                   COALESCE(p.min_quantity, 0) as min_quantity,
+                   COALESCE(p.purchase_price, 0) as purchase_price,
+                   COALESCE(c.short_qty, 0) as short_qty,
+                   COALESCE(c.long_qty, 0) as long_qty,
+                   ls.supplier_id, s.name as supplier_name
+            FROM {t('products')} p
+            LEFT JOIN consumption c ON c.product_id = p.id
+            LEFT JOIN last_supplier ls ON ls.product_id = p.id
+            LEFT JOIN {t('suppliers')} s ON s.id = ls.supplier_id
+            WHERE p.is_active = true
+              AND (c.product_id IS NOT NULL OR p.quantity - p.reserved_qty <= p.min_quantity)
+        """, {'short_days': opts['short_days'], 'long_days': long_days})
+        rows = cur.fetchall()
+
+    today = date.today()
+    horizon = opts['lead_days'] + opts['cover_days']
+    groups = {}
+    for r in rows:
+        available = float(r['quantity']) - float(r['reserved_qty'])
+        # Берём большую из двух скоростей: свежий всплеск спроса не должен теряться в длинном окне
+        daily_rate = max(
+            max(0.0, float(r['short_qty'])) / opts['short_days'],
+            max(0.0, float(r['long_qty'])) / long_days,
+        )
+        min_quantity = float(r['min_quantity'])
+        days_left = available / daily_rate if daily_rate > 0 else None
+        need = daily_rate * horizon + min_quantity - available
+        suggested_qty = math.ceil(need) if need > 0 else 0
+        if not suggested_qty:
+            continue
+
+        key = r['supplier_id'] or 0
+        group = groups.setdefault(key, {
+            'supplier_id': r['supplier_id'],
+            'supplier_name': r['supplier_name'] or 'Без поставщика',
+            'items': [],
+            'total_qty': 0,
+            'total_amount': 0.0,
+        })
+        amount = suggested_qty * float(r['purchase_price'])
+        group['items'].append({
+            'product_id': r['product_id'],
+            'sku': r['sku'],
+            'name': r['name'],
+            'unit': r['unit'],
+            'quantity': float(r['quantity']),
+            'reserved_qty': float(r['reserved_qty']),
+            'available': available,
+            'min_quantity': min_quantity,
+            'daily_rate': round(daily_rate, 3),
+            'days_left': round(days_left, 1) if days_left is not None else None,
+            'stockout_date': (today + timedelta(days=max(0, int(days_left)))).isoformat() if days_left is not None else None,
+            'suggested_qty': suggested_qty,
+            'purchase_price': float(r['purchase_price']),
+            'amount': round(amount, 2),
+        })
+        group['total_qty'] += suggested_qty
+        group['total_amount'] = round(group['total_amount'] + amount, 2)
+
+    suppliers = sorted(groups.values(), key=lambda g: g['supplier_name'])
+    for g in suppliers:
+        g['items'].sort(key=lambda i: (i['days_left'] is None, i['days_left'] or 0, i['name']))
+
+    return resp(200, {
+        'params': {**opts, 'long_days': long_days},
+        'suppliers': suppliers,
+        'items_count': sum(len(g['items']) for g in suppliers),
+        'total_amount': round(sum(g['total_amount'] for g in suppliers), 2),
+    })
 
 
 _wh_action_labels = {
@@ -610,6 +1222,9 @@ _wh_action_labels = {
     'create_transfer':  'Создано перемещение товара',
     'confirm_transfer': 'Подтверждено перемещение товара',
     'recalc_reserved':  'Пересчёт резервов',
+    'snapshot_stock':   'Снимок остатков',
+    'revalue_inventory': 'Оценка себестоимости',
+    'rebuild_summary':  'Пересчёт итогов склада',
 }
 
 
@@ -684,6 +1299,16 @@ def handler(event, context):
                 return resp(200, {'receipt': r})
             elif section == 'transfers':
                 return resp(200, {'transfers': get_transfers(conn, qs)})
+            elif section == 'stock_at':
+                return get_stock_at(conn, qs)
+            elif section == 'summary_check':
+                return resp(200, check_summary(conn))
+            elif section == 'product_suggest':
+                return resp(200, {'products': get_product_suggest(conn, qs)})
+            elif section == 'reorder':
+                return get_reorder(conn, qs)
+            elif section == 'valuation':
+                return resp(200, get_valuation(conn, qs))
             else:
                 return resp(400, {'error': f'Unknown section: {section}'})
 
@@ -692,10 +1317,25 @@ def handler(event, context):
             body = json.loads(event.get('body') or '{}')
             action = body.get('action', '') or qs.get('action', '')
 
+            if action in STOCK_WRITE_ACTIONS:
+                ensure_recent_snapshot(conn)
+
             if action == 'recalc_reserved':
                 _r = recalc_reserved(conn)
                 _wh_log(event, action, _r, body)
                 return _r
+            elif action == 'rebuild_summary':
+                _r = resp(200, {'summary': rebuild_summary(conn)})
+                _wh_log(event, action, _r, body)
+                return _r
+            elif action == 'revalue_inventory':
+                _r = resp(200, revalue_inventory(conn))
+                _wh_log(event, action, _r, body)
+                return _r
+            elif action == 'snapshot_stock':
+                _r = resp(201, {'snapshot': take_stock_snapshot(conn, body.get('note', ''))})
+                _wh_log(event, action, _r, body)
+                return _r
             elif action == 'create_product':
                 _r = create_product(conn, body)
                 _wh_log(event, action, _r, body)
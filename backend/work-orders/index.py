@@ -135,68 +135,75 @@ def get_transferred_qty_for_parts(cur, wo_id):
     return {r['product_id']: float(r['transferred_qty']) for r in rows}
 
 
-def get_work_orders():
-    conn = get_conn()
-    try:
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute(f"""
-                SELECT wo.*, c.vin as car_vin, cl.phone as client_phone,
-                       e.name as employee_name
-                FROM {t('work_orders')} wo
-                LEFT JOIN {t('cars')} c ON wo.car_id = c.id
-                LEFT JOIN {t('clients')} cl ON wo.client_id = cl.id
-                LEFT JOIN {t('employees')} e ON wo.employee_id = e.id
-                ORDER BY wo.created_at DESC
-            """)
-            wos = cur.fetchall()
-
-            if not wos:
-                return resp(200, {'work_orders': []})
+def load_work_orders(cur, ids=None):
+    """ЗН с работами, запчастями и перемещёнными количествами; ids — только указанные ЗН"""
+    where = "WHERE wo.id = ANY(%s)" if ids is not None else ""
+    cur.execute(f"""
+        SELECT wo.*, c.vin as car_vin, cl.phone as client_phone,
+               e.name as employee_name
+        FROM {t('work_orders')} wo
+        LEFT JOIN {t('cars')} c ON wo.car_id = c.id
+        LEFT JOIN {t('clients')} cl ON wo.client_id = cl.id
+        LEFT JOIN {t('employees')} e ON wo.employee_id = e.id
+        {where}
+        ORDER BY wo.created_at DESC
+    """, (list(ids),) if ids is not None else None)
+    wos = cur.fetchall()
+
+    if not wos:
+        return []
+
+    wo_ids = [wo['id'] for wo in wos]
+    id_list = ','.join(str(i) for i in wo_ids)
 
-            wo_ids = [wo['id'] for wo in wos]
-            id_list = ','.join(str(i) for i in wo_ids)
+    cur.execute(f"""
+        SELECT wow.*, e.name as employee_name
+        FROM {t('work_order_works')} wow
+        LEFT JOIN {t('employees')} e ON wow.employee_id = e.id
+        WHERE wow.work_order_id IN ({id_list}) ORDER BY wow.id
+    """)
+    all_works = cur.fetchall()
 
-            cur.execute(f"""
-                SELECT wow.*, e.name as employee_name
-                FROM {t('work_order_works')} wow
-                LEFT JOIN {t('employees')} e ON wow.employee_id = e.id
-                WHERE wow.work_order_id IN ({id_list}) ORDER BY wow.id
-            """)
-            all_works = cur.fetchall()
+    cur.execute(f"SELECT * FROM {t('work_order_parts')} WHERE work_order_id IN ({id_list}) ORDER BY id")
+    all_parts = cur.fetchall()
 
-            cur.execute(f"SELECT * FROM {t('work_order_parts')} WHERE work_order_id IN ({id_list}) ORDER BY id")
-            all_parts = cur.fetchall()
+    # Получаем перемещённые количества по всем ЗН сразу
+    cur.execute(f"""
+        SELECT st.work_order_id, sti.product_id,
+               COALESCE(SUM(CASE WHEN st.direction = 'to_order' THEN sti.qty ELSE -sti.qty END), 0) as transferred_qty
+        FROM {t('stock_transfer_items')} sti
+        JOIN {t('stock_transfers')} st ON st.id = sti.transfer_id
+        WHERE st.work_order_id IN ({id_list}) AND st.status = 'confirmed'
+        GROUP BY st.work_order_id, sti.product_id
+    """)
+    transfer_rows = cur.fetchall()
+    # {(wo_id, product_id): qty}
+    transfer_map = {(r['work_order_id'], r['product_id']): float(r['transferred_qty']) for r in transfer_rows}
+
+    result = []
+    for wo in wos:
+        works = [w for w in all_works if w['work_order_id'] == wo['id']]
+        parts = [p for p in all_parts if p['work_order_id'] == wo['id']]
+        # Обогащаем части transferred_qty
+        enriched_parts = []
+        for p in parts:
+            p = dict(p)
+            if p.get('product_id'):
+                p['transferred_qty'] = transfer_map.get((wo['id'], p['product_id']), 0)
+            enriched_parts.append(p)
+        formatted = format_work_order(wo, works, enriched_parts)
+        formatted['car_vin'] = wo.get('car_vin') or ''
+        formatted['client_phone'] = wo.get('client_phone') or ''
+        result.append(formatted)
 
-            # Получаем перемещённые количества по всем ЗН сразу
-            cur.execute(f"""
-                SELECT st.work_order_id, sti.product_id,
-                       COALESCE(SUM(CASE WHEN st.direction = 'to_order' THEN sti.qty ELSE -sti.qty END), 0) as transferred_qty
-                FROM {t('stock_transfer_items')} sti
-                JOIN {t('stock_transfers')} st ON st.id = sti.transfer_id
-                WHERE st.work_order_id IN ({id_list}) AND st.status = 'confirmed'
-                GROUP BY st.work_order_id, sti.product_id
-            """)
-            transfer_rows = cur.fetchall()
-            # {(wo_id, product_id): qty}
-            transfer_map = {(r['work_order_id'], r['product_id']): float(r['transferred_qty']) for r in transfer_rows}
+    return result
 
-            result = []
-            for wo in wos:
-                works = [w for w in all_works if w['work_order_id'] == wo['id']]
-                parts = [p for p in all_parts if p['work_order_id'] == wo['id']]
-                # Обогащаем части transferred_qty
-                enriched_parts = []
-                for p in parts:
-                    p = dict(p)
-                    if p.get('product_id'):
-                        p['transferred_qty'] = transfer_map.get((wo['id'], p['product_id']), 0)
-                    enriched_parts.append(p)
-                formatted = format_work_order(wo, works, enriched_parts)
-                formatted['car_vin'] = wo.get('car_vin') or ''
-                formatted['client_phone'] = wo.get('client_phone') or ''
-                result.append(formatted)
 
-            return resp(200, {'work_orders': result})
+def get_work_orders():
+    conn = get_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            return resp(200, {'work_orders': load_work_orders(cur)})
     finally:
         conn.close()
 
@@ -221,9 +228,9 @@ def create_work_order(data):
     try:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
             cur.execute(
-                f"""INSERT INTO {t('work_orders')} (order_id, client_id, car_id, client_name, car_info, status, master, payer_client_id, payer_name, employee_id)
-                   VALUES (%s, %s, %s, %s, %s, 'new', %s, %s, %s, %s) RETURNING *""",
-                (order_id, client_id, car_id, client_name, car_info, master, payer_client_id, payer_name, employee_id),
+                f"""INSERT INTO {t('work_orders')} (order_id, client_id, car_id, client_name, client_phone, car_info, status, master, payer_client_id, payer_name, employee_id)
+                   VALUES (%s, %s, %s, %s, COALESCE((SELECT phone FROM {t('clients')} WHERE id = %s), ''), %s, 'new', %s, %s, %s, %s) RETURNING *""",
+                (order_id, client_id, car_id, client_name, client_id, car_info, master, payer_client_id, payer_name, employee_id),
             )
             wo = cur.fetchone()
             wo_id = wo['id']
@@ -320,6 +327,9 @@ def update_work_order(data):
             if 'client_id' in data:
                 updates.append("client_id = %s")
                 params.append(data['client_id'])
+                # Телефон клиента копируется в ЗН — по нему строится индексируемый phone_key
+                updates.append(f"client_phone = COALESCE((SELECT phone FROM {t('clients')} WHERE id = %s), '')")
+                params.append(data['client_id'])
 
             if 'client_name' in data:
                 updates.append("client_name = %s")
@@ -456,7 +466,13 @@ def add_part(data):
                 # Если передан артикул — ищем или создаём позицию в номенклатуре
                 sku = article or part_number
                 if sku:
-                    cur.execute(f"SELECT * FROM {t('products')} WHERE sku = %s", (sku,))
+                    # Артикул ищем по индексу нормализованного значения: «AB-12 34» и «ab1234» — одна позиция
+                    cur.execute(f"""
+                        SELECT * FROM {t('products')}
+                        WHERE sku_normalized = lower(regexp_replace(%s, '[[:space:]-]', '', 'g'))
+                        ORDER BY (sku = %s) DESC, id
+                        LIMIT 1
+                    """, (sku, sku))
                     prod = cur.fetchone()
                     if prod:
                         product_id = prod['id']
@@ -483,9 +499,9 @@ def add_part(data):
 
             if product_id and not out_of_stock:
                 cur.execute(f"""
-                    INSERT INTO {t('stock_movements')} (product_id, work_order_id, work_order_part_id, qty, movement_type)
-                    VALUES (%s, %s, %s, %s, 'reserved')
-                """, (product_id, wo_id, p['id'], qty))
+                    INSERT INTO {t('stock_movements')} (product_id, work_order_id, work_order_part_id, qty, movement_type, reserved_delta)
+                    VALUES (%s, %s, %s, %s, 'reserved', %s)
+                """, (product_id, wo_id, p['id'], qty, qty))
                 cur.execute(f"""
                     UPDATE {t('products')}
                     SET reserved_qty = reserved_qty + %s,
@@ -569,6 +585,23 @@ def delete_work(data):
         conn.close()
 
 
+def clamp_reserved(cur, product_id, delta):
+    """Меняет резерв товара на delta, не опуская ниже нуля; возвращает фактически применённое изменение"""
+    cur.execute(f"""
+        WITH prev AS (
+            SELECT id, reserved_qty FROM {t('products')} WHERE id = %s FOR UPDATE
+        )
+        UPDATE {t('products')} p
+        SET reserved_qty = GREATEST(0, prev.reserved_qty + %s),
+            updated_at = NOW()
+        FROM prev
+        WHERE p.id = prev.id
+        RETURNING p.reserved_qty - prev.reserved_qty as applied
+    """, (product_id, delta))
+    row = cur.fetchone()
+    return float(row['applied']) if row else 0.0
+
+
 def update_part(data):
     part_id = data.get('part_id')
     if not part_id:
@@ -619,12 +652,12 @@ def update_part(data):
                 qty_diff = new_qty - old['qty']
                 if qty_diff != 0:
                     # Меняем только резерв — quantity изменится через confirm_transfer при перемещении
-                    cur.execute(f"""
-                        UPDATE {t('products')}
-                        SET reserved_qty = GREATEST(0, reserved_qty + %s),
-                            updated_at = NOW()
-                        WHERE id = %s
-                    """, (qty_diff, old['product_id']))
+                    applied = clamp_reserved(cur, old['product_id'], qty_diff)
+                    if applied:
+                        cur.execute(f"""
+                            INSERT INTO {t('stock_movements')} (product_id, work_order_id, work_order_part_id, qty, movement_type, reserved_delta, note)
+                            VALUES (%s, %s, %s, %s, 'reserve_changed', %s, 'изменено кол-во в ЗН')
+                        """, (old['product_id'], old['work_order_id'], part_id, abs(applied), applied))
 
             conn.commit()
 
@@ -656,8 +689,8 @@ def delete_part(data):
             old = cur.fetchone()
             if not old:
                 return resp(404, {'error': 'Запчасть не найдена или уже удалена'})
-            # Сначала удаляем связанные движения, потом саму деталь
-            cur.execute(f"DELETE FROM {t('stock_movements')} WHERE work_order_part_id = %s", (part_id,))
+            # Движения остаются в регистре (по ним восстанавливаются остатки на дату), отвязываем их от детали
+            cur.execute(f"UPDATE {t('stock_movements')} SET work_order_part_id = NULL WHERE work_order_part_id = %s", (part_id,))
             cur.execute(f"DELETE FROM {t('work_order_parts')} WHERE id = %s", (part_id,))
             deleted = cur.rowcount
             if deleted == 0:
@@ -676,20 +709,20 @@ def delete_part(data):
                 transferred = float(cur.fetchone()['transferred'])
                 reserve_to_release = float(old['qty'])
 
-                cur.execute(f"""
-                    INSERT INTO {t('stock_movements')} (product_id, work_order_id, work_order_part_id, qty, movement_type, note)
-                    VALUES (%s, %s, NULL, %s, 'unreserved', 'удалено из ЗН')
-                """, (old['product_id'], old['work_order_id'], reserve_to_release))
-
                 # Снимаем резерв; quantity возвращаем только на не-перемещённое количество
                 not_transferred = max(0.0, reserve_to_release - transferred)
+
                 cur.execute(f"""
                     UPDATE {t('products')}
                     SET quantity = quantity + %s,
-                        reserved_qty = GREATEST(0, reserved_qty - %s),
                         updated_at = NOW()
                     WHERE id = %s
-                """, (not_transferred, reserve_to_release, old['product_id']))
+                """, (not_transferred, old['product_id']))
+                released = clamp_reserved(cur, old['product_id'], -reserve_to_release)
+                cur.execute(f"""
+                    INSERT INTO {t('stock_movements')} (product_id, work_order_id, work_order_part_id, qty, movement_type, quantity_delta, reserved_delta, note)
+                    VALUES (%s, %s, NULL, %s, 'unreserved', %s, %s, 'удалено из ЗН')
+                """, (old['product_id'], old['work_order_id'], reserve_to_release, not_transferred, released))
 
             conn.commit()
             return resp(200, {'success': True, 'deleted_id': part_id})
@@ -833,62 +866,128 @@ def get_work_orders_by_client(qs):
     try:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
             cid = int(client_id)
-            # Получаем имя клиента для поиска по client_name (т.к. не все ЗН имеют client_id)
-            cur.execute("SELECT name FROM " + t('clients') + " WHERE id = " + str(cid))
-            cl_row = cur.fetchone()
-            cl_name = cl_row['name'] if cl_row else None
-
-            where = "wo.client_id = " + str(cid)
-            if cl_name:
-                safe_name = cl_name.replace("'", "''")
-                where = "(" + where + " OR wo.client_name ILIKE '" + safe_name + "')"
-
-            sql1 = (
-                "SELECT wo.id, wo.status, wo.created_at, wo.car_info, wo.client_name "
-                "FROM " + t('work_orders') + " wo "
-                "WHERE " + where + " "
-                "ORDER BY wo.created_at DESC"
-            )
-            cur.execute(sql1)
+            # ЗН клиента: по client_id, а старые ЗН без client_id — по имени (индекс на lower(client_name))
+            cur.execute(f"""
+                SELECT wo.id, wo.status, wo.created_at, wo.car_info, wo.client_name,
+                       COALESCE(w.total, 0) + COALESCE(p.total, 0) as total
+                FROM {t('work_orders')} wo
+                LEFT JOIN LATERAL (
+                    SELECT SUM(price * qty) as total FROM {t('work_order_works')} WHERE work_order_id = wo.id
+                ) w ON TRUE
+                LEFT JOIN LATERAL (
+                    SELECT SUM(sell_price * qty) as total FROM {t('work_order_parts')} WHERE work_order_id = wo.id
+                ) p ON TRUE
+                WHERE wo.client_id = %s
+                   OR (wo.client_id IS NULL
+                       AND lower(wo.client_name) = (SELECT lower(name) FROM {t('clients')} WHERE id = %s))
+                ORDER BY wo.created_at DESC
+            """, (cid, cid))
             rows = cur.fetchall()
 
-            if not rows:
-                return resp(200, {'work_orders': []})
-
-            wo_ids = [r['id'] for r in rows]
-            id_list = ','.join(str(i) for i in wo_ids)
-
-            sql2 = (
-                "SELECT work_order_id, COALESCE(SUM(price * qty), 0) as works_total "
-                "FROM " + t('work_order_works') + " "
-                "WHERE work_order_id IN (" + id_list + ") "
-                "GROUP BY work_order_id"
-            )
-            cur.execute(sql2)
-            works_map = {r['work_order_id']: float(r['works_total']) for r in cur.fetchall()}
-
-            sql3 = (
-                "SELECT work_order_id, COALESCE(SUM(sell_price * qty), 0) as parts_total "
-                "FROM " + t('work_order_parts') + " "
-                "WHERE work_order_id IN (" + id_list + ") "
-                "GROUP BY work_order_id"
-            )
-            cur.execute(sql3)
-            parts_map = {r['work_order_id']: float(r['parts_total']) for r in cur.fetchall()}
-
             result = [{
                 'id': r['id'],
                 'order_number': str(r['id']),
                 'status': r['status'],
                 'created_at': str(r['created_at']) if r.get('created_at') else '',
                 'car_info': r.get('car_info') or '',
-                'total': works_map.get(r['id'], 0) + parts_map.get(r['id'], 0),
+                'total': float(r['total']),
             } for r in rows]
             return resp(200, {'work_orders': result})
     finally:
         conn.close()
 
 
+CHANGES_BATCH = 500
+CHANGE_LOG_RETENTION_DAYS = 30
+CHANGE_LOG_PRUNE_EVERY = 300
+CHANGE_LOG_PRUNE_BATCH = 10000
+
+
+def prune_change_log(cur):
+    """Удаляет записи change_log старше CHANGE_LOG_RETENTION_DAYS — не чаще раза в CHANGE_LOG_PRUNE_EVERY секунд
+    и не больше CHANGE_LOG_PRUNE_BATCH за раз — и сдвигает горизонт хранения на наибольший удалённый txid"""
+    cur.execute(
+        f"""WITH gone AS (
+                DELETE FROM {t('change_log')}
+                WHERE id IN (
+                    SELECT id FROM {t('change_log')}
+                    WHERE changed_at < NOW() - %(days)s * INTERVAL '1 day'
+                      AND EXISTS (SELECT 1 FROM {t('change_log_retention')}
+                                  WHERE id = 1 AND pruned_at < NOW() - %(every)s * INTERVAL '1 second')
+                    ORDER BY id
+                    LIMIT %(batch)s
+                )
+                RETURNING txid
+            )
+            UPDATE {t('change_log_retention')}
+            SET pruned_at = NOW(), pruned_txid = GREATEST(pruned_txid, COALESCE((SELECT MAX(txid) FROM gone), 0))
+            WHERE id = 1 AND pruned_at < NOW() - %(every)s * INTERVAL '1 second'""",
+        {'days': CHANGE_LOG_RETENTION_DAYS, 'every': CHANGE_LOG_PRUNE_EVERY, 'batch': CHANGE_LOG_PRUNE_BATCH},
+    )
+
+
+def read_changes(cur, entity, since):
+    """Изменения сущности из change_log после курсора "txid.id".
+    Отдаются только транзакции младше горизонта xmin — они уже завершены, поэтому курсор ничего не пропускает.
+    Возвращает ({entity_id: последняя операция}, новый курсор, есть ли ещё); ops=None — курсор попадает
+    в уже удалённую часть change_log (см. prune_change_log), нужна полная перезагрузка.
+    Некорректный курсор — ValueError."""
+    cur.execute(
+        f"""SELECT txid_snapshot_xmin(txid_current_snapshot()) as xmin,
+                   (SELECT pruned_txid FROM {t('change_log_retention')} WHERE id = 1) as pruned_txid"""
+    )
+    row = cur.fetchone()
+    xmin = row['xmin']
+    if not since:
+        return {}, f"{xmin}.0", False
+    txid_part, _, id_part = since.partition('.')
+    if not (txid_part.isdigit() and id_part.isdigit() and len(txid_part) <= 18 and len(id_part) <= 18):
+        raise ValueError(f'invalid cursor: {since}')
+    since_txid, since_id = int(txid_part), int(id_part)
+    if row['pruned_txid'] and since_txid <= row['pruned_txid']:
+        return None, f"{xmin}.0", False
+    cur.execute(
+        f"""SELECT id, entity_id, op, txid FROM {t('change_log')}
+            WHERE entity = %s AND (txid, id) >= (%s, %s) AND txid < %s
+            ORDER BY txid, id
+            LIMIT %s""",
+        (entity, since_txid, since_id, xmin, CHANGES_BATCH + 1),
+    )
+    rows = cur.fetchall()
+    has_more = len(rows) > CHANGES_BATCH
+    rows = rows[:CHANGES_BATCH]
+    ops = {}
+    for r in rows:
+        ops[r['entity_id']] = r['op']
+    if has_more:
+        cursor = f"{rows[-1]['txid']}.{rows[-1]['id'] + 1}"
+    else:
+        cursor = f"{max(xmin, since_txid)}.{0 if xmin > since_txid else since_id}"
+    return ops, cursor, has_more
+
+
+def get_work_order_changes(qs):
+    """Лента изменений ЗН (включая работы и запчасти): изменённые ЗН целиком и id удалённых"""
+    conn = get_conn()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            prune_change_log(cur)
+            conn.commit()
+            try:
+                ops, cursor, has_more = read_changes(cur, 'work_order', qs.get('since'))
+            except ValueError:
+                return resp(400, {'error': 'invalid since cursor'})
+            if ops is None:
+                return resp(410, {'error': 'cursor too old, resync', 'resync': True, 'cursor': cursor})
+            changed = [wid for wid, op in ops.items() if op != 'D']
+            work_orders = load_work_orders(cur, changed) if changed else []
+            found = {wo['id'] for wo in work_orders}
+            deleted = sorted(wid for wid in ops if wid not in found)
+            return resp(200, {'work_orders': work_orders, 'deleted': deleted, 'cursor': cursor, 'has_more': has_more})
+    finally:
+        conn.close()
+
+
 def handler(event, context):
     """API заказ-нарядов установочного центра"""
     if event.get('httpMethod') == 'OPTIONS':
@@ -902,6 +1001,8 @@ def handler(event, context):
             return get_employee_earnings()
         if qs.get('action') == 'transfers':
             return get_transfers_for_order(qs)
+        if qs.get('action') == 'changes':
+            return get_work_order_changes(qs)
         if qs.get('action') == 'by_client':
             return get_work_orders_by_client(qs)
         return get_work_orders()
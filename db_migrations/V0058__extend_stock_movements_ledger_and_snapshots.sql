@@ -0,0 +1,49 @@
+-- Журнал движений товара становится полноценным регистром остатков:
+-- каждое движение хранит изменение остатка (quantity_delta) и резерва (reserved_delta)
+ALTER TABLE t_p82967824_project_development_.stock_movements
+    ALTER COLUMN work_order_id DROP NOT NULL;
+
+ALTER TABLE t_p82967824_project_development_.stock_movements
+    ADD COLUMN IF NOT EXISTS quantity_delta NUMERIC(12,3) NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS reserved_delta NUMERIC(12,3) NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS stock_receipt_id INTEGER NULL,
+    ADD COLUMN IF NOT EXISTS stock_transfer_id INTEGER NULL;
+
+-- Старые записи: резерв увеличивался при 'reserved' и снимался при 'unreserved'
+UPDATE t_p82967824_project_development_.stock_movements
+SET reserved_delta = qty
+WHERE movement_type = 'reserved';
+
+UPDATE t_p82967824_project_development_.stock_movements
+SET reserved_delta = -qty
+WHERE movement_type = 'unreserved';
+
+CREATE INDEX IF NOT EXISTS idx_stock_movements_created_at ON t_p82967824_project_development_.stock_movements(created_at);
+CREATE INDEX IF NOT EXISTS idx_stock_movements_product_created ON t_p82967824_project_development_.stock_movements(product_id, created_at);
+
+-- Снимки остатков: шапка снимка + строки по товарам
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.stock_snapshots (
+    id SERIAL PRIMARY KEY,
+    taken_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    last_movement_id INTEGER NOT NULL DEFAULT 0,
+    note TEXT NULL DEFAULT ''
+);
+
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.stock_snapshot_items (
+    snapshot_id INTEGER NOT NULL REFERENCES t_p82967824_project_development_.stock_snapshots(id),
+    product_id INTEGER NOT NULL REFERENCES t_p82967824_project_development_.products(id),
+    quantity NUMERIC(12,3) NOT NULL DEFAULT 0,
+    reserved_qty NUMERIC(12,3) NOT NULL DEFAULT 0,
+    PRIMARY KEY (snapshot_id, product_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_stock_snapshots_taken_at ON t_p82967824_project_development_.stock_snapshots(taken_at);
+
+-- Базовый снимок текущих остатков: от него восстанавливаются даты до появления регистра
+INSERT INTO t_p82967824_project_development_.stock_snapshots (taken_at, last_movement_id, note)
+SELECT NOW(), COALESCE(MAX(id), 0), 'начальный снимок'
+FROM t_p82967824_project_development_.stock_movements;
+
+INSERT INTO t_p82967824_project_development_.stock_snapshot_items (snapshot_id, product_id, quantity, reserved_qty)
+SELECT (SELECT MAX(id) FROM t_p82967824_project_development_.stock_snapshots), p.id, COALESCE(p.quantity, 0), COALESCE(p.reserved_qty, 0)
+FROM t_p82967824_project_development_.products p;
@@ -0,0 +1,45 @@
+-- Слои себестоимости (FIFO): каждая строка поступления и каждый возврат в склад — отдельный слой
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.inventory_cost_layers (
+    id SERIAL PRIMARY KEY,
+    product_id INTEGER NOT NULL REFERENCES t_p82967824_project_development_.products(id),
+    stock_receipt_item_id INTEGER NULL UNIQUE,
+    stock_transfer_item_id INTEGER NULL UNIQUE,
+    received_at TIMESTAMP NOT NULL,
+    qty NUMERIC(12,3) NOT NULL,
+    remaining_qty NUMERIC(12,3) NOT NULL,
+    unit_cost NUMERIC(14,4) NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_inventory_cost_layers_open
+    ON t_p82967824_project_development_.inventory_cost_layers(product_id, received_at, id)
+    WHERE remaining_qty > 0;
+
+-- Себестоимость списаний в ЗН (и возвратов со знаком минус) по обоим методам
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.inventory_issue_costs (
+    stock_transfer_item_id INTEGER PRIMARY KEY,
+    product_id INTEGER NOT NULL REFERENCES t_p82967824_project_development_.products(id),
+    work_order_id INTEGER NULL,
+    direction VARCHAR(20) NOT NULL,
+    qty NUMERIC(12,3) NOT NULL,
+    fifo_cost NUMERIC(14,2) NOT NULL DEFAULT 0,
+    avg_cost NUMERIC(14,2) NOT NULL DEFAULT 0,
+    issued_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_inventory_issue_costs_wo_product
+    ON t_p82967824_project_development_.inventory_issue_costs(work_order_id, product_id);
+
+-- Текущее состояние оценки по товару (скользящая средняя)
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.inventory_valuation_state (
+    product_id INTEGER PRIMARY KEY REFERENCES t_p82967824_project_development_.products(id),
+    on_hand_qty NUMERIC(12,3) NOT NULL DEFAULT 0,
+    avg_unit_cost NUMERIC(14,4) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Индексы для поиска ещё не оценённых документов
+CREATE INDEX IF NOT EXISTS idx_stock_transfer_items_transfer ON t_p82967824_project_development_.stock_transfer_items(transfer_id);
+CREATE INDEX IF NOT EXISTS idx_stock_transfer_items_product ON t_p82967824_project_development_.stock_transfer_items(product_id);
+
+INSERT INTO t_p82967824_project_development_.system_settings (key, value) VALUES ('inventory_cost_method', 'fifo')
+    ON CONFLICT (key) DO NOTHING;
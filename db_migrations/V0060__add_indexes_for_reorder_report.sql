@@ -0,0 +1,7 @@
+-- Индексы для расчёта скорости расхода (подтверждённые перемещения за период)
+-- и поиска последнего поставщика по товару
+CREATE INDEX IF NOT EXISTS idx_stock_transfers_status_confirmed_at
+    ON t_p82967824_project_development_.stock_transfers(status, confirmed_at);
+
+CREATE INDEX IF NOT EXISTS idx_stock_receipts_created_at
+    ON t_p82967824_project_development_.stock_receipts(created_at);
@@ -0,0 +1,14 @@
+-- Триграммный поиск по номенклатуре и нормализованный артикул (без пробелов, дефисов и регистра)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE t_p82967824_project_development_.products
+    ADD COLUMN IF NOT EXISTS sku_normalized VARCHAR(50)
+    GENERATED ALWAYS AS (lower(regexp_replace(sku, '[[:space:]-]', '', 'g'))) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_products_sku ON t_p82967824_project_development_.products(sku);
+CREATE INDEX IF NOT EXISTS idx_products_sku_normalized
+    ON t_p82967824_project_development_.products(sku_normalized text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_products_sku_normalized_trgm
+    ON t_p82967824_project_development_.products USING GIN (sku_normalized gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_name_trgm
+    ON t_p82967824_project_development_.products USING GIN (name gin_trgm_ops);
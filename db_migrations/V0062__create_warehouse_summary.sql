@@ -0,0 +1,22 @@
+-- Итоги склада для дашборда: одна строка, поддерживается операциями склада
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.warehouse_summary (
+    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    total_products BIGINT NOT NULL DEFAULT 0,
+    total_quantity BIGINT NOT NULL DEFAULT 0,
+    total_supplied NUMERIC(16,2) NOT NULL DEFAULT 0,
+    low_stock_count BIGINT NOT NULL DEFAULT 0,
+    suppliers_count BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO t_p82967824_project_development_.warehouse_summary
+    (id, total_products, total_quantity, total_supplied, low_stock_count, suppliers_count)
+SELECT 1,
+       COUNT(*),
+       COALESCE(SUM(quantity), 0),
+       COALESCE(SUM(quantity * purchase_price), 0),
+       COUNT(CASE WHEN quantity <= min_quantity THEN 1 END),
+       (SELECT COUNT(*) FROM t_p82967824_project_development_.suppliers WHERE is_active = true)
+FROM t_p82967824_project_development_.products
+WHERE is_active = true
+ON CONFLICT (id) DO NOTHING;
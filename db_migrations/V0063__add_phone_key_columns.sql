@@ -0,0 +1,29 @@
+-- Ключ телефона: последние 10 цифр номера. Хранится вычисляемой колонкой, поэтому
+-- заполняется при любой записи (API, боты, импорт) и сопоставляется по индексу равенством
+ALTER TABLE t_p82967824_project_development_.clients
+    ADD COLUMN IF NOT EXISTS phone_key VARCHAR(10)
+    GENERATED ALWAYS AS (NULLIF(right(regexp_replace(COALESCE(phone, ''), '[^0-9]', '', 'g'), 10), '')) STORED;
+
+ALTER TABLE t_p82967824_project_development_.calls
+    ADD COLUMN IF NOT EXISTS phone_key VARCHAR(10)
+    GENERATED ALWAYS AS (NULLIF(right(regexp_replace(COALESCE(phone, ''), '[^0-9]', '', 'g'), 10), '')) STORED;
+
+ALTER TABLE t_p82967824_project_development_.orders
+    ADD COLUMN IF NOT EXISTS phone_key VARCHAR(10)
+    GENERATED ALWAYS AS (NULLIF(right(regexp_replace(COALESCE(phone, ''), '[^0-9]', '', 'g'), 10), '')) STORED;
+
+-- У заказ-нарядов телефон клиента хранится в client_phone — заполняем его из карточки клиента
+UPDATE t_p82967824_project_development_.work_orders wo
+SET client_phone = cl.phone
+FROM t_p82967824_project_development_.clients cl
+WHERE cl.id = wo.client_id
+  AND COALESCE(wo.client_phone, '') = '';
+
+ALTER TABLE t_p82967824_project_development_.work_orders
+    ADD COLUMN IF NOT EXISTS phone_key VARCHAR(10)
+    GENERATED ALWAYS AS (NULLIF(right(regexp_replace(COALESCE(client_phone, ''), '[^0-9]', '', 'g'), 10), '')) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_clients_phone_key ON t_p82967824_project_development_.clients(phone_key);
+CREATE INDEX IF NOT EXISTS idx_calls_phone_key ON t_p82967824_project_development_.calls(phone_key, started_at DESC);
+CREATE INDEX IF NOT EXISTS idx_orders_phone_key ON t_p82967824_project_development_.orders(phone_key);
+CREATE INDEX IF NOT EXISTS idx_work_orders_phone_key ON t_p82967824_project_development_.work_orders(phone_key);
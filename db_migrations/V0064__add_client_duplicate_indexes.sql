@@ -0,0 +1,3 @@
+-- Индексы для проверки дублей клиентов: имя без учёта регистра и госномер автомобиля
+CREATE INDEX IF NOT EXISTS idx_clients_name_lower ON t_p82967824_project_development_.clients(lower(name));
+CREATE INDEX IF NOT EXISTS idx_cars_license_plate ON t_p82967824_project_development_.cars(license_plate) WHERE license_plate != '';
@@ -0,0 +1,11 @@
+-- Поиск по справочнику клиентов: имя, ключ телефона, VIN и госномер (триграммы), постраничный вывод по id
+CREATE INDEX IF NOT EXISTS idx_clients_name_trgm
+    ON t_p82967824_project_development_.clients USING GIN (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_clients_phone_key_trgm
+    ON t_p82967824_project_development_.clients USING GIN (phone_key gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_cars_vin_trgm
+    ON t_p82967824_project_development_.cars USING GIN (vin gin_trgm_ops) WHERE is_active = TRUE;
+CREATE INDEX IF NOT EXISTS idx_cars_license_plate_trgm
+    ON t_p82967824_project_development_.cars USING GIN (license_plate gin_trgm_ops) WHERE is_active = TRUE;
+CREATE INDEX IF NOT EXISTS idx_cars_client_active
+    ON t_p82967824_project_development_.cars(client_id, created_at DESC) WHERE is_active = TRUE;
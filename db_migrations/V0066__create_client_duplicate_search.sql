@@ -0,0 +1,32 @@
+-- Поиск дублей клиентов: запуски фоновой задачи и найденные пары-кандидаты
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.client_duplicate_runs (
+    id SERIAL PRIMARY KEY,
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    last_client_id INTEGER NOT NULL DEFAULT 0,
+    max_client_id INTEGER NOT NULL DEFAULT 0,
+    pairs_found INTEGER NOT NULL DEFAULT 0,
+    started_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMP NULL
+);
+
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.client_duplicate_pairs (
+    run_id INTEGER NOT NULL REFERENCES t_p82967824_project_development_.client_duplicate_runs(id),
+    client_id INTEGER NOT NULL,
+    other_client_id INTEGER NOT NULL,
+    reasons TEXT[] NOT NULL DEFAULT '{}',
+    PRIMARY KEY (run_id, client_id, other_client_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_client_duplicate_pairs_other
+    ON t_p82967824_project_development_.client_duplicate_pairs(other_client_id);
+
+-- Ключи блокировки: ИНН клиента и VIN автомобиля (ключ телефона и имя уже проиндексированы)
+CREATE INDEX IF NOT EXISTS idx_clients_inn ON t_p82967824_project_development_.clients(inn) WHERE inn != '';
+CREATE INDEX IF NOT EXISTS idx_cars_vin_active ON t_p82967824_project_development_.cars(vin, client_id) WHERE vin != '' AND is_active = TRUE;
+
+-- Индексы по клиенту для переноса ссылок при объединении
+CREATE INDEX IF NOT EXISTS idx_orders_client_id ON t_p82967824_project_development_.orders(client_id);
+CREATE INDEX IF NOT EXISTS idx_work_orders_client_id ON t_p82967824_project_development_.work_orders(client_id);
+CREATE INDEX IF NOT EXISTS idx_work_orders_payer_client_id ON t_p82967824_project_development_.work_orders(payer_client_id);
+CREATE INDEX IF NOT EXISTS idx_incomes_client_id ON t_p82967824_project_development_.incomes(client_id);
+CREATE INDEX IF NOT EXISTS idx_expenses_client_id ON t_p82967824_project_development_.expenses(client_id);
@@ -0,0 +1,6 @@
+-- Карточка клиента: ЗН по имени (старые ЗН без client_id), платежи и приходы по ЗН
+CREATE INDEX IF NOT EXISTS idx_work_orders_client_name_lower
+    ON t_p82967824_project_development_.work_orders(lower(client_name));
+CREATE INDEX IF NOT EXISTS idx_payments_work_order_id ON t_p82967824_project_development_.payments(work_order_id);
+CREATE INDEX IF NOT EXISTS idx_incomes_work_order_id ON t_p82967824_project_development_.incomes(work_order_id);
+CREATE INDEX IF NOT EXISTS idx_orders_client_created ON t_p82967824_project_development_.orders(client_id, created_at DESC);
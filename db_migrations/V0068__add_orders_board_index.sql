@@ -0,0 +1,3 @@
+-- Канбан заявок: колонка по статусу, новые сверху (постраничная подгрузка по (created_at, id))
+CREATE INDEX IF NOT EXISTS idx_orders_status_created
+    ON t_p82967824_project_development_.orders(status, created_at DESC, id DESC);
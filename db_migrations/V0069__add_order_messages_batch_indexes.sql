@@ -0,0 +1,11 @@
+-- Бейджи задач и чата на доске заявок: последнее сообщение и непрочитанные по заявке
+CREATE INDEX IF NOT EXISTS idx_order_messages_order_created
+    ON t_p82967824_project_development_.order_messages(order_id, created_at);
+
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.order_message_reads (
+    order_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    last_read_message_id INTEGER NOT NULL DEFAULT 0,
+    read_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, order_id)
+);
@@ -0,0 +1,77 @@
+-- Журнал изменений для инкрементальной синхронизации (заявки, заказ-наряды, клиенты).
+-- Пишется триггерами, поэтому охватывает все источники записи; txid — номер транзакции для безопасного курсора
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.change_log (
+    id BIGSERIAL PRIMARY KEY,
+    entity VARCHAR(30) NOT NULL,
+    entity_id INTEGER NOT NULL,
+    op CHAR(1) NOT NULL,
+    txid BIGINT NOT NULL DEFAULT txid_current(),
+    changed_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_change_log_entity_txid
+    ON t_p82967824_project_development_.change_log(entity, txid, id);
+
+-- TG_ARGV[0] — сущность, TG_ARGV[1] — колонка с её id. Для дочерних таблиц (работы, запчасти, автомобили)
+-- любое изменение строки — это изменение родителя
+CREATE OR REPLACE FUNCTION t_p82967824_project_development_.log_entity_change() RETURNS trigger AS $$
+DECLARE
+    rec JSONB;
+    op_code CHAR(1);
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        rec := to_jsonb(OLD);
+    ELSE
+        rec := to_jsonb(NEW);
+    END IF;
+    IF TG_ARGV[1] <> 'id' THEN
+        op_code := 'U';
+    ELSIF TG_OP = 'DELETE' THEN
+        op_code := 'D';
+    ELSIF TG_OP = 'INSERT' THEN
+        op_code := 'I';
+    ELSE
+        op_code := 'U';
+    END IF;
+    IF rec->>TG_ARGV[1] IS NOT NULL THEN
+        INSERT INTO t_p82967824_project_development_.change_log (entity, entity_id, op)
+        VALUES (TG_ARGV[0], (rec->>TG_ARGV[1])::integer, op_code);
+    END IF;
+    IF TG_OP = 'UPDATE' AND TG_ARGV[1] <> 'id' AND (to_jsonb(OLD)->>TG_ARGV[1]) IS DISTINCT FROM (rec->>TG_ARGV[1])
+       AND (to_jsonb(OLD)->>TG_ARGV[1]) IS NOT NULL THEN
+        INSERT INTO t_p82967824_project_development_.change_log (entity, entity_id, op)
+        VALUES (TG_ARGV[0], (to_jsonb(OLD)->>TG_ARGV[1])::integer, 'U');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_orders_change_log ON t_p82967824_project_development_.orders;
+CREATE TRIGGER trg_orders_change_log
+    AFTER INSERT OR UPDATE OR DELETE ON t_p82967824_project_development_.orders
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.log_entity_change('order', 'id');
+
+DROP TRIGGER IF EXISTS trg_work_orders_change_log ON t_p82967824_project_development_.work_orders;
+CREATE TRIGGER trg_work_orders_change_log
+    AFTER INSERT OR UPDATE OR DELETE ON t_p82967824_project_development_.work_orders
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.log_entity_change('work_order', 'id');
+
+DROP TRIGGER IF EXISTS trg_work_order_works_change_log ON t_p82967824_project_development_.work_order_works;
+CREATE TRIGGER trg_work_order_works_change_log
+    AFTER INSERT OR UPDATE OR DELETE ON t_p82967824_project_development_.work_order_works
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.log_entity_change('work_order', 'work_order_id');
+
+DROP TRIGGER IF EXISTS trg_work_order_parts_change_log ON t_p82967824_project_development_.work_order_parts;
+CREATE TRIGGER trg_work_order_parts_change_log
+    AFTER INSERT OR UPDATE OR DELETE ON t_p82967824_project_development_.work_order_parts
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.log_entity_change('work_order', 'work_order_id');
+
+DROP TRIGGER IF EXISTS trg_clients_change_log ON t_p82967824_project_development_.clients;
+CREATE TRIGGER trg_clients_change_log
+    AFTER INSERT OR UPDATE OR DELETE ON t_p82967824_project_development_.clients
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.log_entity_change('client', 'id');
+
+DROP TRIGGER IF EXISTS trg_cars_change_log ON t_p82967824_project_development_.cars;
+CREATE TRIGGER trg_cars_change_log
+    AFTER INSERT OR UPDATE OR DELETE ON t_p82967824_project_development_.cars
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.log_entity_change('client', 'client_id');
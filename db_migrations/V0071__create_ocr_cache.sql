@@ -0,0 +1,16 @@
+-- Кэш распознавания документов по SHA-256 изображения и дневные счётчики попаданий
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.ocr_cache (
+    image_hash CHAR(64) PRIMARY KEY,
+    recognized JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    hits INTEGER NOT NULL DEFAULT 0,
+    last_hit_at TIMESTAMP NULL
+);
+
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.ocr_cache_stats (
+    day DATE PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    bytes_in BIGINT NOT NULL DEFAULT 0,
+    bytes_sent BIGINT NOT NULL DEFAULT 0
+);
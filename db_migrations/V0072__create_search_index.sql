@@ -0,0 +1,140 @@
+-- Глобальный поиск: одна строка на сущность (клиент, заявка, заказ-наряд, товар).
+-- Поддерживается триггерами на исходных таблицах, поэтому актуален при записи из любого источника
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.search_index (
+    entity VARCHAR(20) NOT NULL,
+    entity_id INTEGER NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    subtitle TEXT NOT NULL DEFAULT '',
+    search_text TEXT NOT NULL DEFAULT '',
+    tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('russian', search_text)) STORED,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (entity, entity_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_search_index_tsv
+    ON t_p82967824_project_development_.search_index USING GIN (tsv);
+CREATE INDEX IF NOT EXISTS idx_search_index_trgm
+    ON t_p82967824_project_development_.search_index USING GIN (search_text gin_trgm_ops);
+
+CREATE OR REPLACE FUNCTION t_p82967824_project_development_.search_index_put(
+    p_entity VARCHAR, p_id INTEGER, p_found BOOLEAN, p_title TEXT, p_subtitle TEXT, p_text TEXT
+) RETURNS void AS $$
+BEGIN
+    IF NOT p_found THEN
+        DELETE FROM t_p82967824_project_development_.search_index WHERE entity = p_entity AND entity_id = p_id;
+        RETURN;
+    END IF;
+    INSERT INTO t_p82967824_project_development_.search_index (entity, entity_id, title, subtitle, search_text, updated_at)
+    VALUES (p_entity, p_id, COALESCE(p_title, ''), COALESCE(p_subtitle, ''), COALESCE(p_text, ''), NOW())
+    ON CONFLICT (entity, entity_id) DO UPDATE SET
+        title = EXCLUDED.title, subtitle = EXCLUDED.subtitle,
+        search_text = EXCLUDED.search_text, updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql;
+
+-- Клиент вместе с автомобилями: имя, телефон (и 10 цифр), ИНН, email, марка/модель, VIN, госномер
+CREATE OR REPLACE FUNCTION t_p82967824_project_development_.search_index_client(p_id INTEGER) RETURNS void AS $$
+DECLARE
+    r RECORD;
+    cars_text TEXT;
+BEGIN
+    SELECT * INTO r FROM t_p82967824_project_development_.clients WHERE id = p_id;
+    SELECT string_agg(concat_ws(' ', brand, model, year, vin, license_plate), ' ') INTO cars_text
+    FROM t_p82967824_project_development_.cars WHERE client_id = p_id AND is_active = TRUE;
+    PERFORM t_p82967824_project_development_.search_index_put(
+        'client', p_id, r.id IS NOT NULL, r.name, r.phone,
+        concat_ws(' ', r.name, r.phone, r.phone_key, r.inn, r.email, cars_text)
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p82967824_project_development_.search_index_order(p_id INTEGER) RETURNS void AS $$
+DECLARE
+    r RECORD;
+BEGIN
+    SELECT * INTO r FROM t_p82967824_project_development_.orders WHERE id = p_id;
+    PERFORM t_p82967824_project_development_.search_index_put(
+        'order', p_id, r.id IS NOT NULL, 'З-' || LPAD(p_id::text, 4, '0') || ' ' || COALESCE(r.client_name, ''),
+        concat_ws(' · ', NULLIF(r.service, ''), NULLIF(r.car_info, '')),
+        concat_ws(' ', 'З-' || LPAD(p_id::text, 4, '0'), r.client_name, r.phone, r.phone_key, r.car_info, r.service, r.comment)
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p82967824_project_development_.search_index_work_order(p_id INTEGER) RETURNS void AS $$
+DECLARE
+    r RECORD;
+BEGIN
+    SELECT * INTO r FROM t_p82967824_project_development_.work_orders WHERE id = p_id;
+    PERFORM t_p82967824_project_development_.search_index_put(
+        'work_order', p_id, r.id IS NOT NULL, 'ЗН-' || LPAD(p_id::text, 4, '0') || ' ' || COALESCE(r.client_name, ''),
+        COALESCE(r.car_info, ''),
+        concat_ws(' ', 'ЗН-' || LPAD(p_id::text, 4, '0'), r.client_name, r.client_phone, r.phone_key, r.car_info, r.master, r.complaint)
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p82967824_project_development_.search_index_product(p_id INTEGER) RETURNS void AS $$
+DECLARE
+    r RECORD;
+BEGIN
+    SELECT * INTO r FROM t_p82967824_project_development_.products WHERE id = p_id AND is_active = TRUE;
+    PERFORM t_p82967824_project_development_.search_index_put(
+        'product', p_id, r.id IS NOT NULL, r.name, r.sku,
+        concat_ws(' ', r.sku, r.sku_normalized, r.name, r.category, r.description)
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Триггер: TG_ARGV[0] — функция переиндексации, TG_ARGV[1] — колонка с id сущности
+CREATE OR REPLACE FUNCTION t_p82967824_project_development_.search_index_trigger() RETURNS trigger AS $$
+DECLARE
+    new_id INTEGER;
+    old_id INTEGER;
+BEGIN
+    IF TG_OP <> 'DELETE' THEN
+        new_id := (to_jsonb(NEW)->>TG_ARGV[1])::integer;
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        old_id := (to_jsonb(OLD)->>TG_ARGV[1])::integer;
+    END IF;
+    IF new_id IS NOT NULL THEN
+        EXECUTE format('SELECT t_p82967824_project_development_.%I($1)', TG_ARGV[0]) USING new_id;
+    END IF;
+    IF old_id IS NOT NULL AND old_id IS DISTINCT FROM new_id THEN
+        EXECUTE format('SELECT t_p82967824_project_development_.%I($1)', TG_ARGV[0]) USING old_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_clients_search_index ON t_p82967824_project_development_.clients;
+CREATE TRIGGER trg_clients_search_index
+    AFTER INSERT OR UPDATE OR DELETE ON t_p82967824_project_development_.clients
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_client', 'id');
+
+DROP TRIGGER IF EXISTS trg_cars_search_index ON t_p82967824_project_development_.cars;
+CREATE TRIGGER trg_cars_search_index
+    AFTER INSERT OR UPDATE OR DELETE ON t_p82967824_project_development_.cars
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_client', 'client_id');
+
+DROP TRIGGER IF EXISTS trg_orders_search_index ON t_p82967824_project_development_.orders;
+CREATE TRIGGER trg_orders_search_index
+    AFTER INSERT OR UPDATE OR DELETE ON t_p82967824_project_development_.orders
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_order', 'id');
+
+DROP TRIGGER IF EXISTS trg_work_orders_search_index ON t_p82967824_project_development_.work_orders;
+CREATE TRIGGER trg_work_orders_search_index
+    AFTER INSERT OR UPDATE OR DELETE ON t_p82967824_project_development_.work_orders
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_work_order', 'id');
+
+DROP TRIGGER IF EXISTS trg_products_search_index ON t_p82967824_project_development_.products;
+CREATE TRIGGER trg_products_search_index
+    AFTER INSERT OR UPDATE OR DELETE ON t_p82967824_project_development_.products
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_product', 'id');
+
+-- Начальное наполнение
+SELECT t_p82967824_project_development_.search_index_client(id) FROM t_p82967824_project_development_.clients;
+SELECT t_p82967824_project_development_.search_index_order(id) FROM t_p82967824_project_development_.orders;
+SELECT t_p82967824_project_development_.search_index_work_order(id) FROM t_p82967824_project_development_.work_orders;
+SELECT t_p82967824_project_development_.search_index_product(id) FROM t_p82967824_project_development_.products;
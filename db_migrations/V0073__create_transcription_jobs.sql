@@ -0,0 +1,36 @@
+-- Очередь автоматической расшифровки звонков (воркеры забирают задания через FOR UPDATE SKIP LOCKED)
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.transcription_jobs (
+    id SERIAL PRIMARY KEY,
+    mobilon_id VARCHAR(64) NOT NULL UNIQUE,
+    record_url TEXT NOT NULL,
+    status VARCHAR(16) NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_after TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    locked_by VARCHAR(128) NULL,
+    locked_until TIMESTAMP WITH TIME ZONE NULL,
+    last_error TEXT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMP WITH TIME ZONE NULL,
+    finished_at TIMESTAMP WITH TIME ZONE NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- Выборка готовых к запуску заданий и заданий с истёкшей арендой
+CREATE INDEX IF NOT EXISTS idx_transcription_jobs_ready
+    ON t_p82967824_project_development_.transcription_jobs(run_after, id)
+    WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_transcription_jobs_running
+    ON t_p82967824_project_development_.transcription_jobs(locked_until)
+    WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_transcription_jobs_finished
+    ON t_p82967824_project_development_.transcription_jobs(finished_at)
+    WHERE finished_at IS NOT NULL;
+
+-- Звонки, застрявшие в 'pending' после перезапуска, ставим в очередь заново
+INSERT INTO t_p82967824_project_development_.transcription_jobs (mobilon_id, record_url)
+SELECT mobilon_id, COALESCE(raw->>'recordUrl', raw->>'record_url')
+FROM t_p82967824_project_development_.calls
+WHERE transcript_status = 'pending'
+  AND COALESCE(raw->>'recordUrl', raw->>'record_url') IS NOT NULL
+ON CONFLICT (mobilon_id) DO NOTHING;
@@ -0,0 +1,15 @@
+-- Кеш журнала Мобилон за прошедшие дни: закрытый день больше не меняется и берётся из БД
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.call_journal_days (
+    day DATE PRIMARY KEY,
+    calls_count INTEGER NOT NULL DEFAULT 0,
+    fetched_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- Записи журнала в исходном виде (поля <call>), форматирование — при чтении
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.call_journal (
+    day DATE NOT NULL,
+    callid VARCHAR(64) NOT NULL,
+    call_time VARCHAR(32) NOT NULL DEFAULT '',
+    data JSONB NOT NULL,
+    PRIMARY KEY (day, callid)
+);
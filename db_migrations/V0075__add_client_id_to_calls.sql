@@ -0,0 +1,20 @@
+-- Клиент звонка определяется при записи вебхука (кеш определителя номера), чтобы списки звонков не требовали join
+ALTER TABLE t_p82967824_project_development_.calls
+    ADD COLUMN IF NOT EXISTS client_id INTEGER NULL;
+
+UPDATE t_p82967824_project_development_.calls c
+SET client_id = (
+    SELECT cl.id FROM t_p82967824_project_development_.clients cl
+    WHERE cl.phone_key = c.phone_key
+    ORDER BY cl.id
+    LIMIT 1
+)
+WHERE c.client_id IS NULL AND c.phone_key IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_calls_client_started
+    ON t_p82967824_project_development_.calls(client_id, started_at DESC)
+    WHERE client_id IS NOT NULL;
+
+-- Последний заказ-наряд клиента для карточки звонящего
+CREATE INDEX IF NOT EXISTS idx_work_orders_client_created
+    ON t_p82967824_project_development_.work_orders(client_id, created_at DESC, id DESC);
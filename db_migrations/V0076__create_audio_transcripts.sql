@@ -0,0 +1,7 @@
+-- Расшифровки по хешу содержимого записи: одинаковое аудио не отправляется в Whisper повторно
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.audio_transcripts (
+    content_hash CHAR(64) PRIMARY KEY,
+    size_bytes INTEGER NOT NULL,
+    transcript TEXT NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,17 @@
+-- Полнотекстовый поиск по расшифровкам звонков
+ALTER TABLE t_p82967824_project_development_.call_transcripts
+    ADD COLUMN IF NOT EXISTS tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('russian', COALESCE(transcript_raw, ''))) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_call_transcripts_tsv
+    ON t_p82967824_project_development_.call_transcripts USING GIN (tsv);
+
+-- Расшифровки, сохранённые только в calls.transcript, переносим, чтобы они тоже находились поиском
+INSERT INTO t_p82967824_project_development_.call_transcripts
+    (call_id, mobilon_id, phone, dst, direction, started_at, duration, transcript_raw)
+SELECT c.id, c.mobilon_id, COALESCE(NULLIF(c.phone, ''), c.src, ''), c.dst, c.direction, c.started_at, c.duration, c.transcript
+FROM t_p82967824_project_development_.calls c
+WHERE c.transcript IS NOT NULL AND c.transcript <> ''
+  AND NOT EXISTS (
+      SELECT 1 FROM t_p82967824_project_development_.call_transcripts ct WHERE ct.mobilon_id = c.mobilon_id
+  );
@@ -0,0 +1,37 @@
+-- Почасовые итоги по звонкам (оператор — внутренняя сторона разговора). Пересчитываются при записи
+-- завершающего вебхука за час начала звонка, поэтому повторные и запоздавшие события не искажают итоги
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.call_stats_hourly (
+    hour BIGINT NOT NULL,
+    operator VARCHAR(32) NOT NULL DEFAULT '',
+    inbound INTEGER NOT NULL DEFAULT 0,
+    answered INTEGER NOT NULL DEFAULT 0,
+    missed INTEGER NOT NULL DEFAULT 0,
+    outbound INTEGER NOT NULL DEFAULT 0,
+    talk_seconds BIGINT NOT NULL DEFAULT 0,
+    dur_lt_30 INTEGER NOT NULL DEFAULT 0,
+    dur_30_120 INTEGER NOT NULL DEFAULT 0,
+    dur_120_300 INTEGER NOT NULL DEFAULT 0,
+    dur_gt_300 INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour, operator)
+);
+
+INSERT INTO t_p82967824_project_development_.call_stats_hourly
+    (hour, operator, inbound, answered, missed, outbound, talk_seconds, dur_lt_30, dur_30_120, dur_120_300, dur_gt_300)
+SELECT started_at - started_at % 3600,
+       COALESCE(CASE WHEN direction = 'out' THEN src ELSE dst END, ''),
+       COUNT(*) FILTER (WHERE direction IN ('in', 'missed')),
+       COUNT(*) FILTER (WHERE direction = 'in'),
+       COUNT(*) FILTER (WHERE direction = 'missed'),
+       COUNT(*) FILTER (WHERE direction = 'out'),
+       COALESCE(SUM(duration) FILTER (WHERE direction <> 'missed'), 0),
+       COUNT(*) FILTER (WHERE direction <> 'missed' AND duration < 30),
+       COUNT(*) FILTER (WHERE direction <> 'missed' AND duration >= 30 AND duration < 120),
+       COUNT(*) FILTER (WHERE direction <> 'missed' AND duration >= 120 AND duration < 300),
+       COUNT(*) FILTER (WHERE direction <> 'missed' AND duration >= 300)
+FROM t_p82967824_project_development_.calls
+WHERE started_at IS NOT NULL
+  AND state IN ('HANGUP', 'END')
+  AND NOT (src ~ '^\d{1,3}$' AND dst ~ '^\d{1,3}$')
+  AND COALESCE(raw->>'direction', '') <> 'internal'
+GROUP BY 1, 2
+ON CONFLICT (hour, operator) DO NOTHING;
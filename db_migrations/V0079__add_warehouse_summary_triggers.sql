@@ -0,0 +1,98 @@
+-- Итоги склада поддерживаются триггерами: учитываются все источники записи в products и suppliers
+-- (склад, заказ-наряды, боты, импорт). Вклад строки считается по OLD/NEW, поэтому параллельные
+-- изменения под READ COMMITTED не дают расхождений — приращения сериализуются блокировкой строки итогов
+CREATE OR REPLACE FUNCTION t_p82967824_project_development_.products_summary_delta() RETURNS trigger AS $$
+DECLARE
+    d_cnt BIGINT := 0;
+    d_qty NUMERIC := 0;
+    d_supplied NUMERIC := 0;
+    d_low BIGINT := 0;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.is_active THEN
+        d_cnt := d_cnt - 1;
+        d_qty := d_qty - COALESCE(OLD.quantity, 0);
+        d_supplied := d_supplied - COALESCE(OLD.quantity * OLD.purchase_price, 0);
+        IF OLD.quantity <= OLD.min_quantity THEN
+            d_low := d_low - 1;
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.is_active THEN
+        d_cnt := d_cnt + 1;
+        d_qty := d_qty + COALESCE(NEW.quantity, 0);
+        d_supplied := d_supplied + COALESCE(NEW.quantity * NEW.purchase_price, 0);
+        IF NEW.quantity <= NEW.min_quantity THEN
+            d_low := d_low + 1;
+        END IF;
+    END IF;
+    IF d_cnt <> 0 OR d_qty <> 0 OR d_supplied <> 0 OR d_low <> 0 THEN
+        UPDATE t_p82967824_project_development_.warehouse_summary SET
+            total_products = total_products + d_cnt,
+            total_quantity = total_quantity + d_qty,
+            total_supplied = total_supplied + d_supplied,
+            low_stock_count = low_stock_count + d_low,
+            updated_at = NOW()
+        WHERE id = 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_products_summary ON t_p82967824_project_development_.products;
+CREATE TRIGGER trg_products_summary
+    AFTER INSERT OR DELETE ON t_p82967824_project_development_.products
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.products_summary_delta();
+
+-- Изменения резерва, названий и т.п. итоги не затрагивают — строку итогов не блокируем
+DROP TRIGGER IF EXISTS trg_products_summary_update ON t_p82967824_project_development_.products;
+CREATE TRIGGER trg_products_summary_update
+    AFTER UPDATE ON t_p82967824_project_development_.products
+    FOR EACH ROW
+    WHEN (OLD.quantity IS DISTINCT FROM NEW.quantity
+          OR OLD.purchase_price IS DISTINCT FROM NEW.purchase_price
+          OR OLD.min_quantity IS DISTINCT FROM NEW.min_quantity
+          OR OLD.is_active IS DISTINCT FROM NEW.is_active)
+    EXECUTE FUNCTION t_p82967824_project_development_.products_summary_delta();
+
+CREATE OR REPLACE FUNCTION t_p82967824_project_development_.suppliers_summary_delta() RETURNS trigger AS $$
+DECLARE
+    d_cnt BIGINT := 0;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.is_active THEN
+        d_cnt := d_cnt - 1;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.is_active THEN
+        d_cnt := d_cnt + 1;
+    END IF;
+    IF d_cnt <> 0 THEN
+        UPDATE t_p82967824_project_development_.warehouse_summary SET
+            suppliers_count = suppliers_count + d_cnt,
+            updated_at = NOW()
+        WHERE id = 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_suppliers_summary ON t_p82967824_project_development_.suppliers;
+CREATE TRIGGER trg_suppliers_summary
+    AFTER INSERT OR UPDATE OR DELETE ON t_p82967824_project_development_.suppliers
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.suppliers_summary_delta();
+
+-- Сбрасываем накопившееся расхождение
+UPDATE t_p82967824_project_development_.warehouse_summary ws SET
+    total_products = a.total_products,
+    total_quantity = a.total_quantity,
+    total_supplied = a.total_supplied,
+    low_stock_count = a.low_stock_count,
+    suppliers_count = a.suppliers_count,
+    updated_at = NOW()
+FROM (
+    SELECT COUNT(*) as total_products,
+           COALESCE(SUM(quantity), 0) as total_quantity,
+           COALESCE(SUM(quantity * purchase_price), 0) as total_supplied,
+           COUNT(CASE WHEN quantity <= min_quantity THEN 1 END) as low_stock_count,
+           (SELECT COUNT(*) FROM t_p82967824_project_development_.suppliers WHERE is_active = true) as suppliers_count
+    FROM t_p82967824_project_development_.products
+    WHERE is_active = true
+) a
+WHERE ws.id = 1;
@@ -0,0 +1,6 @@
+-- transferred_qty запчастей заказ-наряда считается по подтверждённым перемещениям:
+-- изменение перемещения — изменение заказ-наряда для ленты change_log
+DROP TRIGGER IF EXISTS trg_stock_transfers_change_log ON t_p82967824_project_development_.stock_transfers;
+CREATE TRIGGER trg_stock_transfers_change_log
+    AFTER INSERT OR UPDATE OR DELETE ON t_p82967824_project_development_.stock_transfers
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.log_entity_change('work_order', 'work_order_id');
@@ -0,0 +1,11 @@
+-- В журнале Мобилон за день callid может повторяться: строка кеша — это позиция записи в журнале дня.
+-- Ранее закешированные дни могли потерять повторы, поэтому кеш сбрасывается и заполнится заново при чтении
+DELETE FROM t_p82967824_project_development_.call_journal;
+DELETE FROM t_p82967824_project_development_.call_journal_days;
+
+ALTER TABLE t_p82967824_project_development_.call_journal
+    DROP CONSTRAINT IF EXISTS call_journal_pkey;
+ALTER TABLE t_p82967824_project_development_.call_journal
+    ADD COLUMN IF NOT EXISTS seq INTEGER NOT NULL;
+ALTER TABLE t_p82967824_project_development_.call_journal
+    ADD PRIMARY KEY (day, seq);
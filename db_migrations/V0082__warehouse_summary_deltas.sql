@@ -0,0 +1,73 @@
+-- Триггеры итогов склада больше не обновляют единственную строку warehouse_summary в транзакции писателя:
+-- это сериализовало все изменения остатков (запчасти, перемещения, поступления, боты) на одной блокировке.
+-- Вклад изменения дописывается в warehouse_summary_deltas (только вставки, без общих блокировок);
+-- чтение складывает строку итогов с накопленными дельтами, а накопленное периодически сворачивается в строку
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.warehouse_summary_deltas (
+    id BIGSERIAL PRIMARY KEY,
+    d_products BIGINT NOT NULL DEFAULT 0,
+    d_quantity NUMERIC(16,3) NOT NULL DEFAULT 0,
+    d_supplied NUMERIC(16,2) NOT NULL DEFAULT 0,
+    d_low BIGINT NOT NULL DEFAULT 0,
+    d_suppliers BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE OR REPLACE FUNCTION t_p82967824_project_development_.products_summary_delta() RETURNS trigger AS $$
+DECLARE
+    d_cnt BIGINT := 0;
+    d_qty NUMERIC := 0;
+    d_sup NUMERIC := 0;
+    d_lo BIGINT := 0;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.is_active THEN
+        d_cnt := d_cnt - 1;
+        d_qty := d_qty - COALESCE(OLD.quantity, 0);
+        d_sup := d_sup - COALESCE(OLD.quantity * OLD.purchase_price, 0);
+        IF OLD.quantity <= OLD.min_quantity THEN
+            d_lo := d_lo - 1;
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.is_active THEN
+        d_cnt := d_cnt + 1;
+        d_qty := d_qty + COALESCE(NEW.quantity, 0);
+        d_sup := d_sup + COALESCE(NEW.quantity * NEW.purchase_price, 0);
+        IF NEW.quantity <= NEW.min_quantity THEN
+            d_lo := d_lo + 1;
+        END IF;
+    END IF;
+    IF d_cnt <> 0 OR d_qty <> 0 OR d_sup <> 0 OR d_lo <> 0 THEN
+        INSERT INTO t_p82967824_project_development_.warehouse_summary_deltas (d_products, d_quantity, d_supplied, d_low)
+        VALUES (d_cnt, d_qty, d_sup, d_lo);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p82967824_project_development_.suppliers_summary_delta() RETURNS trigger AS $$
+DECLARE
+    d_cnt BIGINT := 0;
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.is_active THEN
+        d_cnt := d_cnt - 1;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.is_active THEN
+        d_cnt := d_cnt + 1;
+    END IF;
+    IF d_cnt <> 0 THEN
+        INSERT INTO t_p82967824_project_development_.warehouse_summary_deltas (d_suppliers) VALUES (d_cnt);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Поставщики: триггер на UPDATE только при смене is_active
+DROP TRIGGER IF EXISTS trg_suppliers_summary ON t_p82967824_project_development_.suppliers;
+CREATE TRIGGER trg_suppliers_summary
+    AFTER INSERT OR DELETE ON t_p82967824_project_development_.suppliers
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.suppliers_summary_delta();
+
+DROP TRIGGER IF EXISTS trg_suppliers_summary_update ON t_p82967824_project_development_.suppliers;
+CREATE TRIGGER trg_suppliers_summary_update
+    AFTER UPDATE ON t_p82967824_project_development_.suppliers
+    FOR EACH ROW
+    WHEN (OLD.is_active IS DISTINCT FROM NEW.is_active)
+    EXECUTE FUNCTION t_p82967824_project_development_.suppliers_summary_delta();
@@ -0,0 +1,61 @@
+-- Триггеры поиска пересобирали документ при любом изменении строки (резерв и остаток товара, статус ЗН и т.п.).
+-- Обновление переиндексирует сущность, только если изменились колонки, из которых строится документ
+DROP TRIGGER IF EXISTS trg_clients_search_index ON t_p82967824_project_development_.clients;
+CREATE TRIGGER trg_clients_search_index
+    AFTER INSERT OR DELETE ON t_p82967824_project_development_.clients
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_client', 'id');
+DROP TRIGGER IF EXISTS trg_clients_search_index_update ON t_p82967824_project_development_.clients;
+CREATE TRIGGER trg_clients_search_index_update
+    AFTER UPDATE ON t_p82967824_project_development_.clients
+    FOR EACH ROW
+    WHEN ((OLD.name, OLD.phone, OLD.phone_key, OLD.inn, OLD.email)
+          IS DISTINCT FROM (NEW.name, NEW.phone, NEW.phone_key, NEW.inn, NEW.email))
+    EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_client', 'id');
+
+DROP TRIGGER IF EXISTS trg_cars_search_index ON t_p82967824_project_development_.cars;
+CREATE TRIGGER trg_cars_search_index
+    AFTER INSERT OR DELETE ON t_p82967824_project_development_.cars
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_client', 'client_id');
+DROP TRIGGER IF EXISTS trg_cars_search_index_update ON t_p82967824_project_development_.cars;
+CREATE TRIGGER trg_cars_search_index_update
+    AFTER UPDATE ON t_p82967824_project_development_.cars
+    FOR EACH ROW
+    WHEN ((OLD.client_id, OLD.brand, OLD.model, OLD.year, OLD.vin, OLD.license_plate, OLD.is_active)
+          IS DISTINCT FROM (NEW.client_id, NEW.brand, NEW.model, NEW.year, NEW.vin, NEW.license_plate, NEW.is_active))
+    EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_client', 'client_id');
+
+DROP TRIGGER IF EXISTS trg_orders_search_index ON t_p82967824_project_development_.orders;
+CREATE TRIGGER trg_orders_search_index
+    AFTER INSERT OR DELETE ON t_p82967824_project_development_.orders
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_order', 'id');
+DROP TRIGGER IF EXISTS trg_orders_search_index_update ON t_p82967824_project_development_.orders;
+CREATE TRIGGER trg_orders_search_index_update
+    AFTER UPDATE ON t_p82967824_project_development_.orders
+    FOR EACH ROW
+    WHEN ((OLD.client_name, OLD.phone, OLD.phone_key, OLD.car_info, OLD.service, OLD.comment)
+          IS DISTINCT FROM (NEW.client_name, NEW.phone, NEW.phone_key, NEW.car_info, NEW.service, NEW.comment))
+    EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_order', 'id');
+
+DROP TRIGGER IF EXISTS trg_work_orders_search_index ON t_p82967824_project_development_.work_orders;
+CREATE TRIGGER trg_work_orders_search_index
+    AFTER INSERT OR DELETE ON t_p82967824_project_development_.work_orders
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_work_order', 'id');
+DROP TRIGGER IF EXISTS trg_work_orders_search_index_update ON t_p82967824_project_development_.work_orders;
+CREATE TRIGGER trg_work_orders_search_index_update
+    AFTER UPDATE ON t_p82967824_project_development_.work_orders
+    FOR EACH ROW
+    WHEN ((OLD.client_name, OLD.client_phone, OLD.phone_key, OLD.car_info, OLD.master, OLD.complaint)
+          IS DISTINCT FROM (NEW.client_name, NEW.client_phone, NEW.phone_key, NEW.car_info, NEW.master, NEW.complaint))
+    EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_work_order', 'id');
+
+DROP TRIGGER IF EXISTS trg_products_search_index ON t_p82967824_project_development_.products;
+CREATE TRIGGER trg_products_search_index
+    AFTER INSERT OR DELETE ON t_p82967824_project_development_.products
+    FOR EACH ROW EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_product', 'id');
+DROP TRIGGER IF EXISTS trg_products_search_index_update ON t_p82967824_project_development_.products;
+CREATE TRIGGER trg_products_search_index_update
+    AFTER UPDATE ON t_p82967824_project_development_.products
+    FOR EACH ROW
+    WHEN ((OLD.sku, OLD.sku_normalized, OLD.name, OLD.category, OLD.description, OLD.is_active)
+          IS DISTINCT FROM (NEW.sku, NEW.sku_normalized, NEW.name, NEW.category, NEW.description, NEW.is_active))
+    EXECUTE FUNCTION t_p82967824_project_development_.search_index_trigger('search_index_product', 'id');
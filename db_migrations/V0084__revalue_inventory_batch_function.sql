@@ -0,0 +1,131 @@
+-- Оценка себестоимости пачки товаров выполняется в БД одним вызовом: приложение больше не выкачивает
+-- события и слои и не обходит их в Python. Скользящая средняя и стоимость возвратов зависят от порядка
+-- событий, поэтому обход по событиям остаётся, но списание FIFO — одним UPDATE по окну накопленных остатков слоёв.
+-- Функция вызывается внутри транзакции документа: ошибка оценки откатывает документ, а не теряется
+CREATE OR REPLACE FUNCTION t_p82967824_project_development_.revalue_inventory_batch(p_ids INTEGER[]) RETURNS INTEGER AS $$
+DECLARE
+    ev RECORD;
+    v_pid INTEGER;
+    v_qty NUMERIC;
+    v_avg NUMERIC;
+    v_base NUMERIC;
+    v_taken NUMERIC;
+    v_fifo NUMERIC;
+    v_issued_qty NUMERIC;
+    v_issued_fifo NUMERIC;
+    v_issued_avg NUMERIC;
+    v_fifo_unit NUMERIC;
+    v_avg_unit NUMERIC;
+    v_events INTEGER := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('inventory_valuation'));
+
+    FOR ev IN
+        SELECT 'receipt' as kind, sri.id as item_id, sri.product_id, sr.created_at as at,
+               sri.quantity::numeric as qty, sri.price as price, NULL::integer as work_order_id
+        FROM t_p82967824_project_development_.stock_receipt_items sri
+        JOIN t_p82967824_project_development_.stock_receipts sr ON sr.id = sri.receipt_id
+        WHERE sri.product_id = ANY(p_ids)
+          AND NOT EXISTS (SELECT 1 FROM t_p82967824_project_development_.inventory_cost_layers l
+                          WHERE l.stock_receipt_item_id = sri.id)
+        UNION ALL
+        SELECT st.direction, sti.id, sti.product_id, COALESCE(st.confirmed_at, st.created_at),
+               sti.qty, sti.price, st.work_order_id
+        FROM t_p82967824_project_development_.stock_transfer_items sti
+        JOIN t_p82967824_project_development_.stock_transfers st ON st.id = sti.transfer_id
+        WHERE st.status = 'confirmed'
+          AND sti.product_id = ANY(p_ids)
+          AND NOT EXISTS (SELECT 1 FROM t_p82967824_project_development_.inventory_issue_costs ic
+                          WHERE ic.stock_transfer_item_id = sti.id)
+        ORDER BY product_id, at, item_id
+    LOOP
+        IF ev.product_id IS DISTINCT FROM v_pid THEN
+            IF v_pid IS NOT NULL THEN
+                INSERT INTO t_p82967824_project_development_.inventory_valuation_state (product_id, on_hand_qty, avg_unit_cost, updated_at)
+                VALUES (v_pid, v_qty, v_avg, NOW())
+                ON CONFLICT (product_id) DO UPDATE
+                SET on_hand_qty = EXCLUDED.on_hand_qty, avg_unit_cost = EXCLUDED.avg_unit_cost, updated_at = NOW();
+            END IF;
+            v_pid := ev.product_id;
+            SELECT on_hand_qty, avg_unit_cost INTO v_qty, v_avg
+            FROM t_p82967824_project_development_.inventory_valuation_state WHERE product_id = v_pid;
+            IF NOT FOUND THEN
+                v_qty := 0;
+                SELECT COALESCE(purchase_price, 0) INTO v_avg
+                FROM t_p82967824_project_development_.products WHERE id = v_pid;
+                v_avg := COALESCE(v_avg, 0);
+            END IF;
+        END IF;
+        v_base := GREATEST(v_qty, 0);
+
+        IF ev.kind = 'receipt' THEN
+            v_avg := CASE WHEN v_base + ev.qty > 0
+                          THEN (v_base * v_avg + ev.qty * ev.price) / (v_base + ev.qty)
+                          ELSE ev.price END;
+            v_qty := v_qty + ev.qty;
+            INSERT INTO t_p82967824_project_development_.inventory_cost_layers
+                (product_id, stock_receipt_item_id, received_at, qty, remaining_qty, unit_cost)
+            VALUES (v_pid, ev.item_id, ev.at, ev.qty, ev.qty, ev.price);
+
+        ELSIF ev.kind = 'to_order' THEN
+            -- FIFO: слой берётся целиком, пока накопленный остаток до него меньше списания
+            WITH open_layers AS (
+                SELECT id, remaining_qty, unit_cost,
+                       SUM(remaining_qty) OVER (ORDER BY received_at, id) - remaining_qty as qty_before
+                FROM t_p82967824_project_development_.inventory_cost_layers
+                WHERE product_id = v_pid AND remaining_qty > 0
+            ), take AS (
+                SELECT id, unit_cost, LEAST(remaining_qty, ev.qty - qty_before) as take_qty
+                FROM open_layers
+                WHERE qty_before < ev.qty
+            ), consumed AS (
+                UPDATE t_p82967824_project_development_.inventory_cost_layers l
+                SET remaining_qty = l.remaining_qty - take.take_qty
+                FROM take
+                WHERE l.id = take.id
+                RETURNING take.take_qty, take.unit_cost
+            )
+            SELECT COALESCE(SUM(take_qty), 0), COALESCE(SUM(take_qty * unit_cost), 0) INTO v_taken, v_fifo
+            FROM consumed;
+            -- Слоёв не хватило (остаток заведён без поступления) — оцениваем по средней
+            v_fifo := v_fifo + GREATEST(ev.qty - v_taken, 0) * v_avg;
+            v_qty := v_qty - ev.qty;
+            INSERT INTO t_p82967824_project_development_.inventory_issue_costs
+                (stock_transfer_item_id, product_id, work_order_id, direction, qty, fifo_cost, avg_cost, issued_at)
+            VALUES (ev.item_id, v_pid, ev.work_order_id, 'to_order', ev.qty, ROUND(v_fifo, 2), ROUND(ev.qty * v_avg, 2), ev.at)
+            ON CONFLICT (stock_transfer_item_id) DO NOTHING;
+
+        ELSE
+            -- Возврат из ЗН: товар приходит обратно по той себестоимости, по которой был списан
+            SELECT COALESCE(SUM(CASE WHEN direction = 'to_order' THEN qty ELSE -qty END), 0),
+                   COALESCE(SUM(fifo_cost), 0), COALESCE(SUM(avg_cost), 0)
+            INTO v_issued_qty, v_issued_fifo, v_issued_avg
+            FROM t_p82967824_project_development_.inventory_issue_costs
+            WHERE work_order_id IS NOT DISTINCT FROM ev.work_order_id AND product_id = v_pid;
+            v_fifo_unit := CASE WHEN v_issued_qty > 0 THEN v_issued_fifo / v_issued_qty ELSE v_avg END;
+            v_avg_unit := CASE WHEN v_issued_qty > 0 THEN v_issued_avg / v_issued_qty ELSE v_avg END;
+            v_avg := CASE WHEN v_base + ev.qty > 0
+                          THEN (v_base * v_avg + ev.qty * v_avg_unit) / (v_base + ev.qty)
+                          ELSE v_avg_unit END;
+            v_qty := v_qty + ev.qty;
+            INSERT INTO t_p82967824_project_development_.inventory_cost_layers
+                (product_id, stock_transfer_item_id, received_at, qty, remaining_qty, unit_cost)
+            VALUES (v_pid, ev.item_id, ev.at, ev.qty, ev.qty, v_fifo_unit);
+            INSERT INTO t_p82967824_project_development_.inventory_issue_costs
+                (stock_transfer_item_id, product_id, work_order_id, direction, qty, fifo_cost, avg_cost, issued_at)
+            VALUES (ev.item_id, v_pid, ev.work_order_id, 'to_stock', ev.qty,
+                    ROUND(-ev.qty * v_fifo_unit, 2), ROUND(-ev.qty * v_avg_unit, 2), ev.at)
+            ON CONFLICT (stock_transfer_item_id) DO NOTHING;
+        END IF;
+        v_events := v_events + 1;
+    END LOOP;
+
+    IF v_pid IS NOT NULL THEN
+        INSERT INTO t_p82967824_project_development_.inventory_valuation_state (product_id, on_hand_qty, avg_unit_cost, updated_at)
+        VALUES (v_pid, v_qty, v_avg, NOW())
+        ON CONFLICT (product_id) DO UPDATE
+        SET on_hand_qty = EXCLUDED.on_hand_qty, avg_unit_cost = EXCLUDED.avg_unit_cost, updated_at = NOW();
+    END IF;
+    RETURN v_events;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,12 @@
+-- Хранение change_log ограничено: ленты изменений удаляют записи старше срока хранения пачками
+-- и запоминают наибольший удалённый txid. Курсор с txid не больше этого горизонта мог пропустить
+-- удалённые записи — такой клиент получает 410 и перезагружает список целиком
+CREATE TABLE IF NOT EXISTS t_p82967824_project_development_.change_log_retention (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    pruned_txid BIGINT NOT NULL DEFAULT 0,
+    pruned_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO t_p82967824_project_development_.change_log_retention (id, pruned_txid, pruned_at)
+VALUES (1, 0, NOW() - INTERVAL '1 day')
+ON CONFLICT (id) DO NOTHING;
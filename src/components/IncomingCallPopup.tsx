@@ -1,4 +1,4 @@
-import { useEffect, useState, useCallback } from "react";
+import { useEffect, useRef, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import { Button } from "@/components/ui/button";
 import Icon from "@/components/ui/icon";
@@ -17,8 +17,11 @@ interface ActiveCall {
 }
 
 const POLL_INTERVAL = 30000;
+const RETRY_DELAY = 5000;
 const DISMISS_TIMEOUT = 30000;
 
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
 const formatPhone = (phone: string) => {
   const d = phone.replace(/\D/g, "");
   if (d.length === 11) {
@@ -35,33 +38,52 @@ const IncomingCallPopup = () => {
   const [dismissed, setDismissed] = useState<Set<string>>(new Set());
   const [ringing, setRinging] = useState(false);
 
-  const fetchActive = useCallback(async () => {
+  const dismissedRef = useRef(dismissed);
+
+  useEffect(() => {
+    dismissedRef.current = dismissed;
+  }, [dismissed]);
+
+  // Long-poll: сервер отвечает сразу при новом или завершённом звонке, иначе — по таймауту
+  useEffect(() => {
     if (!user) return;
     const url = getApiUrl("calls");
     if (!url) return;
-    try {
-      const res = await fetch(`${url}?action=active`);
-      const data = await res.json();
-      if (data.active && data.call) {
-        const c: ActiveCall = data.call;
-        if (!dismissed.has(c.id)) {
-          setCall(c);
-          setVisible(true);
+    const controller = new AbortController();
+    let version: number | null = null;
+
+    const loop = async () => {
+      while (!controller.signal.aborted) {
+        try {
+          const query = version === null ? "action=active" : `action=active_wait&since=${version}`;
+          const res = await fetch(`${url}?${query}`, { signal: controller.signal });
+          const data = await res.json();
+          if (data.active && data.call) {
+            const c: ActiveCall = data.call;
+            if (!dismissedRef.current.has(c.id)) {
+              setCall(c);
+              setVisible(true);
+            }
+          } else {
+            setCall(null);
+            setVisible(false);
+          }
+          if (typeof data.version !== "number") {
+            await sleep(POLL_INTERVAL);
+          } else {
+            version = data.version;
+            if (data.retry_after) await sleep(data.retry_after * 1000);
+          }
+        } catch {
+          if (controller.signal.aborted) return;
+          await sleep(RETRY_DELAY);
         }
-      } else {
-        setCall(null);
-        setVisible(false);
       }
-    } catch {
-      // silent
-    }
-  }, [dismissed]);
+    };
 
-  useEffect(() => {
-    fetchActive();
-    const interval = setInterval(fetchActive, POLL_INTERVAL);
-    return () => clearInterval(interval);
-  }, [fetchActive]);
+    loop();
+    return () => controller.abort();
+  }, [user]);
 
   useEffect(() => {
     if (!visible || !call) return;
@@ -1,26 +1,424 @@
 """
 Локальный прокси-сервер для вебхуков Мобилон ВАТС.
 
-Принимает входящие вебхуки от Мобилон на порту 5173,
-пересылает их в облачную функцию poehali.dev.
+Принимает входящие вебхуки от Мобилон на порту 5173, дописывает каждое событие
+в журнал на диске и сразу отвечает 200. Фоновый поток пересылает события в облачную
+функцию poehali.dev по порядку, через keep-alive соединение, с повторами при сбоях.
 
 Запуск:
     python webhook_proxy.py
 
+Повторная отправка событий из журнала (например, после сбоя на стороне функции):
+    python webhook_proxy.py replay [--since 2026-10-01T09:00] [--rejected]
+
+Счётчики работающего прокси:
+    http://127.0.0.1:5173/proxy/stats
+
 Адрес для настройки вебхука в Мобилон:
     http://<ВАШ_БЕЛЫЙ_IP>:5173/webhook
 """
 
+import argparse
+import base64
+import http.client
 import json
-import urllib.request
-import urllib.error
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 
-CLOUD_FUNCTION_URL = "https://functions.poehali.dev/0389a6f3-a315-4f7b-ba16-8dc9c3abde73"
+CLOUD_FUNCTION_URL = os.environ.get("PROXY_TARGET_URL", "https://functions.poehali.dev/0389a6f3-a315-4f7b-ba16-8dc9c3abde73")
 
 PORT = 5173
 
+SPOOL_DIR = os.environ.get("PROXY_SPOOL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "webhook_spool"))
+SEGMENT_BYTES = 16 * 1024 * 1024
+RETAIN_DAYS = int(os.environ.get("PROXY_RETAIN_DAYS", 7))   # пересланные сегменты хранятся для replay
+FSYNC = os.environ.get("PROXY_FSYNC", "1") != "0"
+# Пачки — только если получатель принимает {"events": [...]} (локальный сервер backend/calls умеет)
+BATCH_SIZE = int(os.environ.get("PROXY_BATCH_SIZE", 1))
+FORWARD_TIMEOUT = 15
+RETRY_BASE = 1
+RETRY_MAX = 60
+# Сколько раз подряд получатель может ответить на событие ошибкой (500, 408, 429 …), прежде чем событие
+# проверяется на «ядовитость»: оно уходит в rejected.log, только если следующее событие получатель принимает.
+# Сетевые ошибки и 502/503/504 (функция недоступна) не считаются — события ждут в журнале сколько нужно
+RETRY_ATTEMPTS = int(os.environ.get("PROXY_RETRY_ATTEMPTS", 10))
+UNAVAILABLE_STATUSES = (502, 503, 504)
+STATS_INTERVAL = 60
+
+
+# ── Журнал на диске ───────────────────────────────────────────────────────────
+
+class Spool:
+    """Append-only журнал: сегменты NNNNNN.log со строками JSON и offset.json — позиция,
+    до которой всё уже переслано. После перезапуска пересылка продолжается с этой позиции."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.cond = threading.Condition()
+        segments = self.segments()
+        self.segment = segments[-1] if segments else 1
+        self._truncate_torn_tail(self.path(self.segment))
+        self.file = open(self.path(self.segment), "ab")
+        self.position = self._load_offset()
+
+    def path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:06d}.log")
+
+    def segments(self) -> list:
+        return sorted(int(name[:-4]) for name in os.listdir(self.directory)
+                      if name.endswith(".log") and name[:-4].isdigit())
+
+    @staticmethod
+    def _truncate_torn_tail(path: str):
+        """Обрезает недописанную строку, оставшуюся после аварийной остановки."""
+        if not os.path.exists(path):
+            return
+        with open(path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def _load_offset(self) -> tuple:
+        try:
+            with open(os.path.join(self.directory, "offset.json"), encoding="utf-8") as f:
+                data = json.load(f)
+            return data["segment"], data["pos"]
+        except (OSError, ValueError, KeyError):
+            segments = self.segments()
+            return (segments[0] if segments else self.segment), 0
+
+    def append(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self.cond:
+            if self.file.tell() > 0 and self.file.tell() + len(line) > SEGMENT_BYTES:
+                self.file.close()
+                self.segment += 1
+                self.file = open(self.path(self.segment), "ab")
+            self.file.write(line)
+            self.file.flush()
+            if FSYNC:
+                os.fsync(self.file.fileno())
+            self.cond.notify_all()
+
+    def read(self, limit: int, wait: float) -> list:
+        """До limit непересланных записей [(запись, позиция после неё)]; ждёт новые не дольше wait."""
+        records = self._read(limit)
+        if not records:
+            with self.cond:
+                self.cond.wait(wait)
+            records = self._read(limit)
+        return records
+
+    def _read(self, limit: int) -> list:
+        segment, pos = self.position
+        records = []
+        while len(records) < limit:
+            try:
+                with open(self.path(segment), "rb") as f:
+                    f.seek(pos)
+                    for line in f:
+                        if not line.endswith(b"\n"):
+                            break
+                        pos += len(line)
+                        try:
+                            records.append((json.loads(line), (segment, pos)))
+                        except ValueError:
+                            print(f"[SPOOL] skip corrupted line in segment {segment}")
+                        if len(records) >= limit:
+                            break
+            except FileNotFoundError:
+                pass
+            if len(records) >= limit or segment >= self.segment:
+                break
+            segment, pos = segment + 1, 0
+        return records
+
+    def commit(self, position: tuple):
+        """Запоминает, что всё до position переслано; старые пересланные сегменты удаляет."""
+        tmp = os.path.join(self.directory, "offset.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segment": position[0], "pos": position[1]}, f)
+        os.replace(tmp, os.path.join(self.directory, "offset.json"))
+        if position[0] != self.position[0]:
+            cutoff = time.time() - RETAIN_DAYS * 86400
+            for segment in self.segments():
+                if segment < position[0] and os.path.getmtime(self.path(segment)) < cutoff:
+                    os.remove(self.path(segment))
+        self.position = position
+
+    def backlog_bytes(self) -> int:
+        segment, pos = self.position
+        total = -pos
+        for s in self.segments():
+            if s >= segment:
+                total += os.path.getsize(self.path(s))
+        return max(total, 0)
+
+    def reject(self, records: list, reason: str):
+        """Записи, которые получатель отверг (4xx) или не принял за RETRY_ATTEMPTS попыток, —
+        в rejected.log для разбора и replay --rejected."""
+        with open(os.path.join(self.directory, "rejected.log"), "ab") as f:
+            for record in records:
+                f.write(json.dumps({**record, "reason": reason}, ensure_ascii=False).encode("utf-8") + b"\n")
+
+    def close(self):
+        with self.cond:
+            self.file.close()
+
+
+# ── Счётчики ──────────────────────────────────────────────────────────────────
+
+class Counters:
+    """Пропускная способность и задержки: ack — запись в журнал до ответа Мобилону,
+    delivery — от приёма события до подтверждения облачной функцией."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.totals = {"received": 0, "forwarded": 0, "requests": 0, "retries": 0, "rejected": 0, "gave_up": 0}
+        self.ack_ms = deque(maxlen=1000)
+        self.delivery_ms = deque(maxlen=1000)
+
+    def add(self, name: str, n: int = 1):
+        with self.lock:
+            self.totals[name] += n
+
+    def observe(self, name: str, ms: float):
+        with self.lock:
+            getattr(self, name).append(ms)
+
+    @staticmethod
+    def _summary(values) -> dict:
+        if not values:
+            return {"p50": None, "p95": None, "max": None}
+        ordered = sorted(values)
+        return {
+            "p50": round(ordered[len(ordered) // 2], 1),
+            "p95": round(ordered[int(len(ordered) * 0.95) - 1 if len(ordered) > 1 else 0], 1),
+            "max": round(ordered[-1], 1),
+        }
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            uptime = time.time() - self.started
+            return {
+                **self.totals,
+                "uptime_seconds": round(uptime),
+                "forwarded_per_minute": round(self.totals["forwarded"] * 60 / uptime, 2) if uptime else 0,
+                "ack_ms": self._summary(self.ack_ms),
+                "delivery_ms": self._summary(self.delivery_ms),
+            }
+
+
+# ── Пересылка ─────────────────────────────────────────────────────────────────
+
+class Rejected(Exception):
+    pass
+
+
+class GaveUp(Rejected):
+    """Получатель RETRY_ATTEMPTS раз подряд ответил на событие ошибкой, которую обычно имеет смысл повторять."""
+
+
+class CloudClient:
+    """Keep-alive соединение с облачной функцией; при обрыве переподключается."""
+
+    def __init__(self, url: str):
+        self.url = urlparse(url)
+        self.conn = None
+
+    def _connect(self):
+        if self.url.scheme == "https":
+            return http.client.HTTPSConnection(self.url.netloc, timeout=FORWARD_TIMEOUT)
+        return http.client.HTTPConnection(self.url.netloc, timeout=FORWARD_TIMEOUT)
+
+    def send(self, method: str, query: str, body: bytes) -> tuple:
+        path = self.url.path or "/"
+        if query:
+            path = f"{path}?{query}"
+        headers = {"Content-Type": "application/json", "User-Agent": "MobilonWebhookProxy/2.0"}
+        if self.conn is None:
+            self.conn = self._connect()
+        try:
+            self.conn.request(method, path, body=body or None, headers=headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+            if resp.will_close:
+                self.close()
+            return resp.status, data
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def record_body(record: dict) -> bytes:
+    if "body_b64" in record:
+        return base64.b64decode(record["body_b64"])
+    return record.get("body", "").encode("utf-8")
+
+
+def batchable(record: dict) -> bool:
+    if record["method"] != "POST" or record.get("query") or "body_b64" in record:
+        return False
+    try:
+        return isinstance(json.loads(record.get("body") or "null"), dict)
+    except ValueError:
+        return False
+
+
+def deliver(client: CloudClient, records: list, counters: Counters, stop: threading.Event, probe: bool = False):
+    """Отправляет одно событие как есть или пачку {"events": [...]}; повторяет до успеха.
+    4xx (кроме 408/429) — событие отвергнуто получателем, повтор не поможет: Rejected.
+    Прочие ошибочные ответы (кроме 502/503/504) повторяются не больше RETRY_ATTEMPTS раз подряд: GaveUp.
+    probe=True — одна попытка без повторов: любая ошибка сразу GaveUp."""
+    if len(records) == 1:
+        method, query, body = records[0]["method"], records[0].get("query", ""), record_body(records[0])
+    else:
+        method, query = "POST", ""
+        body = json.dumps({"events": [json.loads(r["body"]) for r in records]}, ensure_ascii=False).encode("utf-8")
+
+    attempt = 0
+    failed_responses = 0
+    while True:
+        try:
+            counters.add("requests")
+            status, data = client.send(method, query, body)
+            if 200 <= status < 300:
+                return
+            error = f"HTTP {status}: {data[:200].decode('utf-8', errors='replace')}"
+            if 400 <= status < 500 and status not in (408, 429):
+                raise Rejected(error)
+            if status not in UNAVAILABLE_STATUSES:
+                failed_responses += 1
+        except (OSError, http.client.HTTPException) as e:
+            error = str(e) or type(e).__name__
+        if probe:
+            raise GaveUp(error)
+        if failed_responses >= RETRY_ATTEMPTS:
+            raise GaveUp(f"{error} (попыток: {failed_responses})")
+        attempt += 1
+        counters.add("retries")
+        delay = min(RETRY_MAX, RETRY_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+        print(f"[CLOUD ERROR] {error}; повтор #{attempt} через {delay:.1f} с")
+        if stop.wait(delay):
+            raise InterruptedError("proxy is stopping")
+
+
+class Forwarder(threading.Thread):
+    """Единственный поток пересылки: события уходят строго в порядке журнала."""
+
+    def __init__(self, spool: Spool, counters: Counters):
+        super().__init__(name="forwarder", daemon=True)
+        self.spool = spool
+        self.counters = counters
+        self.client = CloudClient(CLOUD_FUNCTION_URL)
+        self.stop_event = threading.Event()
+
+    def run(self):
+        last_report = time.time()
+        while not self.stop_event.is_set():
+            records = self.spool.read(max(BATCH_SIZE, 1) * 10, wait=1.0)
+            try:
+                self._forward_all(records)
+            except InterruptedError:
+                return
+            if time.time() - last_report >= STATS_INTERVAL:
+                last_report = time.time()
+                print(f"[PROXY STATS] {json.dumps({**self.counters.snapshot(), 'backlog_bytes': self.spool.backlog_bytes()})}")
+
+    @staticmethod
+    def _group_at(records: list, i: int, batch: bool) -> list:
+        group = [records[i]]
+        if batch and BATCH_SIZE > 1 and batchable(records[i][0]):
+            for item in records[i + 1:]:
+                if len(group) >= BATCH_SIZE or not batchable(item[0]):
+                    break
+                group.append(item)
+        return group
+
+    def _forward_all(self, records: list):
+        """Пересылает прочитанные записи по порядку. Застрявшее событие остаётся первым в очереди,
+        пока получатель не покажет, что исправен (принимает следующее событие)."""
+        i = 0
+        singles_until = 0
+        while i < len(records):
+            group = self._group_at(records, i, batch=i >= singles_until)
+            try:
+                self._deliver([record for record, _ in group])
+            except GaveUp as e:
+                if len(group) > 1:
+                    # Пачку так и не приняли — шлём по одному, чтобы отложить только проблемное событие
+                    print(f"[CLOUD GAVE UP] пачка из {len(group)} событий не принята, отправляю по одному")
+                    singles_until = i + len(group)
+                    continue
+                if not self._set_aside_poison(records, i, e):
+                    return
+                i += 2
+                continue
+            except Rejected as e:
+                self._reject([record for record, _ in group], e)
+            self.spool.commit(group[-1][1])
+            i += len(group)
+
+    def _set_aside_poison(self, records: list, i: int, error: Exception) -> bool:
+        """Событие i исчерпало попытки. Пробуем следующее: если получатель его принял — он исправен,
+        а событие i «ядовитое» и уходит в rejected.log. Иначе получатель нездоров: ничего не откладываем."""
+        if i + 1 >= len(records):
+            print(f"[CLOUD ERROR] {error}; следующих событий нет — продолжаю повторять")
+            return False
+        probe, probe_position = records[i + 1]
+        try:
+            self._deliver([probe], probe=True)
+        except GaveUp as e:
+            print(f"[CLOUD ERROR] следующее событие тоже не принято ({e}) — получатель нездоров, жду")
+            return False
+        except Rejected as e:
+            self._reject([probe], e)
+        print(f"[CLOUD GAVE UP] {error}; получатель принимает другие события — событие → rejected.log")
+        self.spool.reject([records[i][0]], str(error))
+        self.counters.add("gave_up")
+        self.spool.commit(probe_position)
+        return True
+
+    def _deliver(self, records: list, probe: bool = False):
+        deliver(self.client, records, self.counters, self.stop_event, probe=probe)
+        self.counters.add("forwarded", len(records))
+        now = time.time()
+        for record in records:
+            self.counters.observe("delivery_ms", (now - record["ts"]) * 1000)
+
+    def _reject(self, records: list, error: Exception):
+        print(f"[CLOUD REJECTED] {error}; событий: {len(records)} → rejected.log")
+        self.spool.reject(records, str(error))
+        self.counters.add("rejected", len(records))
+
+    def stop(self):
+        self.stop_event.set()
+        with self.spool.cond:
+            self.spool.cond.notify_all()
+        self.join(FORWARD_TIMEOUT + 5)
+        self.client.close()
+
+
+# ── HTTP ──────────────────────────────────────────────────────────────────────
+
+SPOOL = None
+COUNTERS = Counters()
+
 
 class WebhookHandler(BaseHTTPRequestHandler):
 
@@ -34,41 +432,26 @@ class WebhookHandler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(b"ok")
 
-    def send_error_response(self, code, message):
+    def send_json(self, code: int, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
         self.send_response(code)
         self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        self.wfile.write(json.dumps({"error": message}).encode())
-
-    def forward_to_cloud(self, method: str, path: str, query_string: str, body: bytes):
-        """Пересылает запрос в облачную функцию и возвращает (status, body)."""
-        url = CLOUD_FUNCTION_URL
-        if query_string:
-            url = f"{url}?{query_string}"
-
-        headers = {
-            "Content-Type": "application/json",
-            "User-Agent": "MobilonWebhookProxy/1.0",
-        }
-
-        req = urllib.request.Request(
-            url,
-            data=body if body else None,
-            headers=headers,
-            method=method,
-        )
+        self.wfile.write(body)
 
+    def spool_and_ack(self, method: str, parsed, body: bytes):
+        """Событие дописывается в журнал, Мобилону сразу уходит 200; пересылка — в фоне."""
+        started = time.perf_counter()
+        record = {"ts": time.time(), "method": method, "path": parsed.path, "query": parsed.query}
         try:
-            with urllib.request.urlopen(req, timeout=15) as r:
-                response_body = r.read()
-                return r.status, response_body
-        except urllib.error.HTTPError as e:
-            error_body = e.read()
-            print(f"[CLOUD ERROR] HTTP {e.code}: {error_body.decode('utf-8', errors='replace')}")
-            return e.code, error_body
-        except Exception as e:
-            print(f"[CLOUD ERROR] {e}")
-            return 502, json.dumps({"error": str(e)}).encode()
+            record["body"] = body.decode("utf-8")
+        except UnicodeDecodeError:
+            record["body_b64"] = base64.b64encode(body).decode("ascii")
+        SPOOL.append(record)
+        COUNTERS.add("received")
+        COUNTERS.observe("ack_ms", (time.perf_counter() - started) * 1000)
+        self.send_ok()
 
     def do_OPTIONS(self):
         self.send_response(200)
@@ -79,28 +462,19 @@ class WebhookHandler(BaseHTTPRequestHandler):
 
     def do_GET(self):
         parsed = urlparse(self.path)
-        query_string = parsed.query
+        if parsed.path == "/proxy/stats":
+            self.send_json(200, {**COUNTERS.snapshot(), "backlog_bytes": SPOOL.backlog_bytes()})
+            return
 
         # Парсим query-параметры для логирования
-        params = parse_qs(query_string, keep_blank_values=True)
+        params = parse_qs(parsed.query, keep_blank_values=True)
         flat_params = {k: v[0] if len(v) == 1 else v for k, v in params.items()}
-
         print(f"[WEBHOOK GET] path={parsed.path} params={json.dumps(flat_params, ensure_ascii=False)}")
 
-        status, response_body = self.forward_to_cloud("GET", parsed.path, query_string, None)
-
-        print(f"[CLOUD RESPONSE] status={status} body={response_body[:200].decode('utf-8', errors='replace')}")
-
-        self.send_response(200)  # Всегда отвечаем 200 Мобилону
-        self.send_header("Content-Type", "text/plain")
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.end_headers()
-        self.wfile.write(b"ok")
+        self.spool_and_ack("GET", parsed, b"")
 
     def do_POST(self):
         parsed = urlparse(self.path)
-        query_string = parsed.query
-
         content_length = int(self.headers.get("Content-Length", 0))
         body = self.rfile.read(content_length) if content_length > 0 else b""
 
@@ -111,23 +485,66 @@ class WebhookHandler(BaseHTTPRequestHandler):
         except Exception:
             print(f"[WEBHOOK POST] path={parsed.path} raw_body={body[:500]}")
 
-        status, response_body = self.forward_to_cloud("POST", parsed.path, query_string, body)
+        self.spool_and_ack("POST", parsed, body)
+
+
+# ── Команды ───────────────────────────────────────────────────────────────────
+
+def replay(since: str = None, rejected: bool = False):
+    """Повторно отправляет события из журнала (или из rejected.log) по порядку.
+    Получатель сохраняет звонки по mobilon_id, поэтому повторная отправка безопасна."""
+    directory = SPOOL_DIR
+    since_ts = datetime.fromisoformat(since).timestamp() if since else 0
+    if rejected:
+        files = [os.path.join(directory, "rejected.log")]
+    else:
+        files = [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                 if name.endswith(".log") and name[:-4].isdigit()]
+    client = CloudClient(CLOUD_FUNCTION_URL)
+    counters = Counters()
+    stop = threading.Event()
+    sent = failed = 0
+    for path in files:
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("ts", 0) < since_ts:
+                    continue
+                record.pop("reason", None)
+                try:
+                    deliver(client, [record], counters, stop)
+                    sent += 1
+                except Rejected as e:
+                    failed += 1
+                    print(f"[REPLAY] отвергнуто: {e}")
+    client.close()
+    print(f"  Replay завершён: отправлено {sent}, отвергнуто {failed}")
 
-        print(f"[CLOUD RESPONSE] status={status} body={response_body[:200].decode('utf-8', errors='replace')}")
 
-        self.send_response(200)  # Всегда отвечаем 200 Мобилону
-        self.send_header("Content-Type", "text/plain")
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.end_headers()
-        self.wfile.write(b"ok")
+def main():
+    global SPOOL
+    SPOOL = Spool(SPOOL_DIR)
+    forwarder = Forwarder(SPOOL, COUNTERS)
+    forwarder.start()
 
+    server = ThreadingHTTPServer(("0.0.0.0", PORT), WebhookHandler)
+    server.daemon_threads = True
+
+    def _on_signal(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, _on_signal)
 
-def main():
-    server = HTTPServer(("0.0.0.0", PORT), WebhookHandler)
     print(f"")
     print(f"  Мобилон Webhook Proxy запущен")
     print(f"  Слушаю: http://0.0.0.0:{PORT}")
     print(f"  Проксирую в: {CLOUD_FUNCTION_URL}")
+    print(f"  Журнал: {SPOOL_DIR} (в очереди {SPOOL.backlog_bytes()} байт)")
     print(f"")
     print(f"  Укажи в настройках Мобилон:")
     print(f"  URL вебхука: http://<ВАШ_БЕЛЫЙ_IP>:{PORT}/webhook")
@@ -138,9 +555,23 @@ def main():
     try:
         server.serve_forever()
     except KeyboardInterrupt:
-        print("\n  Остановлен.")
-        server.server_close()
+        pass
+    print("\n  Остановка: непересланные события остаются в журнале...")
+    server.server_close()
+    forwarder.stop()
+    SPOOL.close()
+    print("  Остановлен.")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Прокси вебхуков Мобилон")
+    sub = parser.add_subparsers(dest="command")
+    replay_parser = sub.add_parser("replay", help="повторно отправить события из журнала")
+    replay_parser.add_argument("--since", help="только события начиная с момента, например 2026-10-01T09:00")
+    replay_parser.add_argument("--rejected", action="store_true", help="отправить события из rejected.log")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        replay(args.since, args.rejected)
+        sys.exit(0)
     main()